@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+"""
+Collector process for collector mode (COLLECTOR in the config file).  Run one
+alongside the web workers; it collects every section and publishes snapshots
+for the workers to serve.
+"""
+
+if __name__ == '__main__':
+    from serverstatus import views
+
+    views.BACKENDCALLS.run_collector()
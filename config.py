@@ -31,7 +31,15 @@ PLEX_INFO = dict(
     user='user',
     password='password',
     auth_token='AUTH_TOKEN',
-    local_network_auth=False
+    local_network_auth=False,
+    # keep-alive connections kept open to Plex, and timeouts in seconds,
+    # pool_timeout being the longest a request waits for a free connection
+    max_connections=4,
+    connect_timeout=3,
+    read_timeout=10,
+    pool_timeout=10,
+    # ask Plex for JSON responses instead of XML
+    json_api=True
 )
 
 SERVERSYNC_INFO = dict(
@@ -46,12 +54,141 @@ PARTITIONS = dict(Partition_Name_1='/mnt/partition1',
                   Root='/',
                   Home='/home')
 
+# seconds to wait for a partition's disk usage before reporting it
+# unresponsive, and seconds between background probes of unresponsive ones
+MOUNT_PROBE = dict(
+    timeout=2,
+    interval=30)
+
+# seconds between network IO polls, and number of polls averaged for speed
+NETWORK_SPEED = dict(
+    interval=1,
+    window=5)
+
+# latency probes run in the background every interval seconds.  mode is 'tcp'
+# (time a TCP handshake with port) or 'icmp' (unprivileged ICMP echo, needs
+# the net.ipv4.ping_group_range sysctl to include the app's group).  Stats
+# cover the last window probes of each target
+PING = dict(
+    targets=['8.8.8.8'],
+    mode='tcp',
+    port=53,
+    interval=10,
+    window=30,
+    timeout=2)
+
 INTERNAL_IP = 'http://192.168.0.1'
+# the forecast is refreshed every refresh_interval seconds (the free
+# forecast.io plan allows 1,000 calls a day), and the last one is saved to
+# cache_file (by default data/ in the app's directory) so it survives
+# restarts.  Workers sharing cache_file take
+# turns refreshing it, so it's fetched once per interval however many run
 WEATHER = dict(
     Forecast_io_API_key='FORECASTIOKEY',
     Latitude=37.8030,
     Longitude=-122.4360,
-    units='us')
+    units='us',
+    refresh_interval=600)
+# seconds to cache results for each API call before refreshing them in the
+# background.  "default" applies to calls not listed, 0 disables caching
+CACHE_TTL = dict(
+    default=5,
+    system_info=10,
+    network_speed=1,
+    ping=5,
+    storage=60,
+    ip_address=600,
+    services=30,
+    media=15,
+    forecast=300,
+    plex_transcodes=10)
+
+# seconds to wait for each media section before marking it stale/unavailable
+MEDIA_TIMEOUTS = dict(
+    default=10,
+    subsonic_nowplaying=5,
+    plex_nowplaying=5,
+    subsonic_recentlyadded=10,
+    plex_recentlyadded=10)
+
+# maximum size in bytes of cached cover art, least recently used images are
+# removed first.  max_age is how many seconds browsers may cache cover art.
+# Set sendfile to 'x-sendfile' (Apache mod_xsendfile, lighttpd) or
+# 'x-accel-redirect' (nginx) to have the front-end server send cached images;
+# for nginx, sendfile_prefix is an internal location aliased to the image
+# directory (/tmp/flask-images)
+IMAGE_CACHE = dict(
+    max_bytes=256 * 1024 ** 2,
+    max_age=30 * 24 * 60 * 60,
+    sendfile=None,
+    sendfile_prefix='/cover-art/')
+
+# seconds between collecting each section pushed to /stream subscribers
+STREAM = dict(
+    system_info=30,
+    plex_transcodes=30,
+    network_speed=60,
+    ping=60,
+    media=60,
+    storage=600,
+    forecast=600,
+    services=600)
+
+# after failure_threshold consecutive failures a service is reported offline
+# without being contacted, and retried after base_delay seconds, doubling on
+# each failed retry up to max_delay seconds
+CIRCUIT_BREAKER = dict(
+    failure_threshold=3,
+    base_delay=5,
+    max_delay=300)
+
+# worker threads computing sections requested from /api/batch, and seconds
+# to wait for the whole batch
+BATCH = dict(
+    workers=8,
+    timeout=30)
+
+# services and the sections listed are loaded in the background as soon as a
+# worker starts, or from its first request under the debug server.  /ready
+# answers 503 until they're done, or until timeout seconds have passed
+WARMUP = dict(
+    enabled=True,
+    timeout=60,
+    sections=['system_info', 'storage', 'network_speed', 'ping', 'services',
+              'plex_transcodes', 'media', 'forecast'])
+
+# collector mode, for running several web workers: one collector process
+# (./collector.py) collects the sections listed every interval seconds and
+# publishes them to path (by default data/ in the app's directory), along
+# with the metrics and history for /metrics and /api/history.  Workers serve
+# them from there instead of polling every server themselves.  Workers fall
+# back to collecting sections on their own while the snapshot is older than
+# max_age seconds, and answer /metrics and /api/history with a 503
+COLLECTOR = dict(
+    enabled=False,
+    interval=10,
+    max_age=60,
+    sections=['system_info', 'storage', 'network_speed', 'ping', 'ip_address',
+              'services', 'plex_transcodes', 'media', 'forecast'])
+
+# gzip/brotli compression level (1-9) of API and html responses, and the
+# smallest response in bytes worth compressing
+COMPRESSION = dict(
+    level=6,
+    min_size=512)
+
+# seconds between collecting the metrics served at /metrics
+METRICS = dict(
+    interval=15)
+
+# number of points kept in each tier of the metrics history served at
+# /api/history: raw samples (one per METRICS interval), 1 minute averages and
+# 1 hour averages.  The defaults keep 1 hour, 1 day and 30 days
+HISTORY = dict(
+    raw_points=240,
+    minute_points=24 * 60,
+    hour_points=30 * 24)
+
 SERVER_URL = 'http://www.example.com'
 DEBUG = False
 SECRET_KEY = 'my secret'
@@ -0,0 +1,15 @@
+"""
+Gunicorn settings, used with
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+
+def post_fork(server, worker):
+    """
+    Starts warming up each worker as soon as it's forked rather than on its
+    first request, so it's ready by the time the load balancer asks /ready.
+    Works with --preload too, since a warm-up started before the fork
+    doesn't carry over to the worker.
+    """
+    from serverstatus.views import BACKENDCALLS
+    BACKENDCALLS.start_warmup()
@@ -25,6 +25,13 @@ app.config['TEMP_IMAGES'] = os.path.join(app.config['TEMP_LOCATION'],
                                          'flask-images')
 app.config['APP_MODULESLOCATION'] = os.path.join(app.config['APPLOCATION'],
                                                  'serverstatus')
+# files shared between workers, ex. the collector's snapshot
+app.config['DATA_LOCATION'] = os.path.join(app.config['APPLOCATION'], 'data')
+if not os.path.isdir(app.config['DATA_LOCATION']):
+    try:
+        os.mkdir(app.config['DATA_LOCATION'])
+    except OSError:
+        pass
 
 import views
 import assets
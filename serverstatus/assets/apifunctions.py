@@ -3,13 +3,25 @@ Serves as backend for returning information about server to jQuery and Jinja
 templates.  Data is returned in the form of dicts to mimic JSON formatting.
 """
 from collections import OrderedDict
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 import logging
+import threading
+import time
 
+from serverstatus.assets.background import monotonic
+from serverstatus.assets.cache import TTLCache
+from serverstatus.assets.circuitbreaker import CircuitBreaker
+from serverstatus.assets.exceptions import ServiceUnavailableError
+from serverstatus.assets.history import HistoryStore
+from serverstatus.assets.httpclient import get_http_client_stats
+from serverstatus.assets.metrics import MetricsCollector
+from serverstatus.assets.mounts import MountProber
 from serverstatus.assets.weather import Forecast
 from serverstatus.assets.services import CheckCrashPlan, ServerSync, Plex, \
-    SubSonic
-from serverstatus.assets.sysinfo import GetSystemInfo, get_network_speed, \
-    get_ping, get_wan_ip, get_partitions_space, get_total_system_space
+    SubSonic, Service
+from serverstatus.assets.sysinfo import GetSystemInfo, NetworkSpeedSampler, \
+    LatencyProber, get_wan_ip, get_storage
 import serverstatus.assets.wrappers as wrappers
 
 
@@ -29,7 +41,25 @@ class APIFunctions(object):
 
     To return network speed:
     http://foobar.com/api/network_speed
+
+    Results are cached for the number of seconds set per function in
+    CACHE_TTL in the config file.  Expired results are served while they're
+    refreshed in the background.
+
+    Each service is called through a circuit breaker, configured by
+    CIRCUIT_BREAKER in the config file.  While a service is known to be down
+    it's reported offline without being contacted, and its sections fail
+    fast.  Breaker states are returned by circuit_breakers.
     """
+    # attribute, status name, config key and class of each service
+    _service_classes = (('plex', 'plex', 'PLEX_INFO', Plex),
+                        ('subsonic', 'subsonic', 'SUBSONIC_INFO', SubSonic),
+                        ('server_sync', 'server-sync', 'SERVERSYNC_INFO',
+                         ServerSync),
+                        ('crashplan', 'backups', 'CRASHPLAN_INFO',
+                         CheckCrashPlan),
+                        ('weather', 'weather', 'WEATHER', Forecast))
+
     def __init__(self, config):
         self.logger = LOGGER
         LOGGER.debug('{} initialized'.format(__name__))
@@ -39,10 +69,52 @@ class APIFunctions(object):
         self.server_sync = None
         self.crashplan = None
         self.weather = None
+        self._network_sampler = None
+        self._latency_prober = None
+        self._mount_prober = None
+        self._cache = None
+        self._media_pool = None
+        self._media_in_flight = dict()
+        self._media_last_result = dict()
+        self._breakers = dict()
+        self._service_locks = {attrib: threading.Lock() for attrib, _, _, _ in
+                               self._service_classes}
+        self._metrics_collector = None
+        self._history = None
+        # the samplers, probers, breakers, collector and history are created
+        # on first use by warm-up, the metrics collector and requests alike
+        self._metrics_lock = threading.RLock()
+
+    def close(self):
+        """
+        Stops the background samplers and the media thread pool, discarding
+        media sources still waiting to run, and closes the Plex client's pool
+        """
+        for worker in (self._network_sampler, self._latency_prober,
+                       self._mount_prober, self._metrics_collector):
+            if worker is not None:
+                worker.stop()
+        if self._media_pool is not None:
+            self._media_pool.terminate()
+            self._media_pool = None
+            self._media_in_flight.clear()
+        if self.plex is not None:
+            self.plex.close()
 
-    @staticmethod
-    @wrappers.logger('debug')
-    def system_info():
+    @property
+    def cache(self):
+        """
+        TTL cache for API results.  Created on first use since the config file
+        is loaded after this class is initialized
+        :return: TTLCache
+        """
+        if self._cache is None:
+            self._cache = TTLCache(self.config.get('CACHE_TTL'))
+        return self._cache
+
+    @wrappers.cached
+    @wrappers.instrument('debug')
+    def system_info(self):
         """
         Returns data for system info section (memory, load, uptime)
 
@@ -52,38 +124,46 @@ class APIFunctions(object):
         output = get_system_info.get_info()
         return output
 
-    @staticmethod
-    @wrappers.logger('debug')
-    def network_speed():
+    @wrappers.cached
+    @wrappers.instrument('debug')
+    def network_speed(self):
         """
-        Returns server network speed.  Sleep defines the length of time in
-        between polling for network IO data to calculate speed based off delta
+        Returns server network speed from the background network sampler.
+        NETWORK_SPEED in the config file sets how often the sampler polls
+        network IO data, and how many polls the speed is averaged over
 
         :return: dict
         """
-        return get_network_speed(sleep=5)
+        return self._get_network_sampler().get_speed()
 
-    @staticmethod
-    @wrappers.logger('debug')
-    def ping():
+    @wrappers.cached
+    @wrappers.instrument('debug')
+    def ping(self):
         """
-        Returns ping from Google DNS (default)
+        Returns average ping to the first target in PING from the config file
+        (Google DNS by default), along with rolling latency statistics for
+        every target from the background latency prober
 
         :return: dict
         """
-        return dict(ping='{:.0f}'.format(get_ping()))
+        prober = self._get_latency_prober()
+        stats = prober.get_all_stats()
+        return dict(ping='{:.0f}'.format(stats[prober.targets[0]]['avg']),
+                    stats=stats)
 
-    @wrappers.logger('debug')
+    @wrappers.cached
+    @wrappers.instrument('debug')
     def storage(self):
         """
         Returns formatted storage data based off options selected in Config file
 
         :return: dict
         """
-        paths = get_partitions_space(self.config['PARTITIONS'])
-        return dict(total=get_total_system_space(), paths=paths)
+        return get_storage(self.config['PARTITIONS'],
+                           prober=self._get_mount_prober())
 
-    @wrappers.logger('debug')
+    @wrappers.cached
+    @wrappers.instrument('debug')
     def ip_address(self):
         """
         Returns servers internal and external IP addresses
@@ -92,109 +172,363 @@ class APIFunctions(object):
         """
         return dict(wan_ip=get_wan_ip(), internal_ip=self.config['INTERNAL_IP'])
 
-    @wrappers.logger('debug')
+    @wrappers.cached
+    @wrappers.instrument('debug')
     def services(self):
         """
         Returns sorted status mappings for servers listed in config file
         :return: dict
         """
         self._load_configs()
-        servers = [self.plex, self.subsonic, self.server_sync, self.crashplan]
-        servers_mapped = [getattr(server, 'status_mapping') for server in
-                          servers]
         servers_dict = OrderedDict()
-        for server in servers_mapped:
-            servers_dict = OrderedDict(servers_dict.items() + server.items())
+        for attrib, name, config_key, _ in self._service_classes[:4]:
+            server = getattr(self, attrib)
+            try:
+                if server is None:
+                    raise ServiceUnavailableError(
+                        '{} not loaded'.format(name))
+                mapping = self._call_service(attrib,
+                                             server.online_status_mapping)
+            except Exception as err:
+                LOGGER.debug('{} offline: {}'.format(name, err))
+                mapping = Service.offline_status_mapping(
+                    name, self.config.get(config_key, dict()).get(
+                        'external_url'))
+            servers_dict.update(mapping)
         return servers_dict
 
-    @wrappers.logger('debug')
+    @wrappers.instrument('debug')
+    def circuit_breakers(self):
+        """
+        Returns circuit breaker state of each service
+
+        >>> {'plex': {'state': 'open', 'failures': 3, 'retry_in': 8.5,
+        ...           'last_error': 'Connection refused'}, ...}
+
+        :return: dict
+        """
+        return {attrib: self._get_breaker(attrib).status for attrib, _, _, _
+                in self._service_classes}
+
+    @wrappers.cached
+    @wrappers.instrument('debug')
     def media(self):
         """
         Returns now playing data for Plex and Subsonic (if any), and recently
-        added items for both
+        added items for both.
+
+        Each section is fetched concurrently with its own deadline from
+        MEDIA_TIMEOUTS in the config file.  media_status maps each section to
+        "ok", or to "stale" (last good result returned) or "unavailable" (no
+        result) if its source failed or missed the deadline.
 
         :return: dict
         """
         self._load_configs()
-        subsonic = self.subsonic
-        plex = self.plex
-        return dict(
-            subsonic_nowplaying=subsonic.now_playing(),
-            plex_nowplaying=plex.now_playing(),
-            subsonic_recentlyadded=subsonic.recently_added(num_results=6),
-            plex_recentlyadded=plex.recently_added(num_results=6))
-
-    @wrappers.logger('debug')
+        sources = OrderedDict([
+            ('subsonic_nowplaying', lambda: self._call_service(
+                'subsonic', lambda: self.subsonic.now_playing())),
+            ('plex_nowplaying', lambda: self._call_service(
+                'plex', lambda: self.plex.now_playing())),
+            ('subsonic_recentlyadded', lambda: self._call_service(
+                'subsonic', lambda: self.subsonic.recently_added(
+                    num_results=6))),
+            ('plex_recentlyadded', lambda: self._call_service(
+                'plex', lambda: self.plex.recently_added(num_results=6)))])
+        return self._gather_media(sources)
+
+    @wrappers.cached
+    @wrappers.instrument('debug')
     def forecast(self):
         """
-        Gets forecast data from forecast.io
+        Gets forecast data from forecast.io, as last refreshed in the
+        background.  Reported as {'offline': True} while forecast.io is
+        unavailable
 
         :return: dict
         """
         self._load_configs()
-        self.weather.reload_data()
-        return self.weather.get_data()
+        try:
+            return self._call_service('weather',
+                                      lambda: self.weather.get_data())
+        except ServiceUnavailableError as err:
+            LOGGER.debug('forecast offline: {}'.format(err))
+            return dict(offline=True)
 
-    @wrappers.logger('debug')
+    @wrappers.cached
+    @wrappers.instrument('debug')
     def plex_transcodes(self):
         """
-        Gets number of transcodes from Plex
+        Gets number of transcodes from Plex, reported as 0 while Plex is
+        unavailable
 
         :return: dict
         """
         self._load_configs()
-        return dict(plex_transcodes=self.plex.transcodes)
+        try:
+            transcodes = self._call_service('plex',
+                                            lambda: self.plex.transcodes)
+        except ServiceUnavailableError:
+            transcodes = 0
+        return dict(plex_transcodes=transcodes)
+
+    @wrappers.instrument('debug')
+    def history(self, metric=None, window=60 * 60, max_points=None):
+        """
+        Returns history of metric over the last window seconds, from the
+        samples taken by the metrics collector every METRICS interval.  Lists
+        the metrics recorded when metric isn't given.  See HistoryStore.query
+        for the output format.
+
+        :type metric: str or NoneType
+        :type window: int
+        :type max_points: int or NoneType
+        :return: dict
+        :raises: KeyError if metric hasn't been recorded
+        """
+        self._get_metrics_collector().ensure_running()
+        history = self._get_history()
+        if metric is None:
+            return dict(metrics=history.metrics)
+        return history.query(metric, window, time.time(), max_points)
+
+    def stats(self):
+        """
+        Returns call count, error count and latency percentiles of every API
+        function, timed when its result is computed rather than served from
+        cache, along with connections opened and reused for each upstream
+        server
+
+        :return: dict
+        """
+        return dict(functions=wrappers.get_stats(),
+                    http=get_http_client_stats())
 
     def _get_plex_cover_art(self, args):
         """
         Gets Plex cover art passing flask requests into Plex class
 
-        :return: image
+        :return: CoverArt
         """
         self._load_configs()
-        return self.plex.get_cover_image(**args)
+        return self._call_service('plex', lambda: self.plex.cover_art(**args))
+
+    def _add_plex_covers(self, covers):
+        """
+        Adds Plex cover art ids listed by another process, ex. the collector,
+        so their images can be served from this one
+
+        :param covers: dict of cover art id: Plex path
+        """
+        self._load_configs()
+        if self.plex is not None:
+            self.plex._cover_mapping.update(covers)
 
     def _get_subsonic_cover_art(self, cover_id, size):
         """
         Gets subsonic cover art passing flask requests into Subsonic class
 
-        :return: image
+        :return: CoverArt
         """
         self._load_configs()
         cover_id = int(cover_id)
-        return self.subsonic.get_cover_art(cover_id, size)
+        return self._call_service(
+            'subsonic', lambda: self.subsonic.cover_art(cover_id, size))
+
+    def _get_metrics(self):
+        """
+        Returns the latest metrics in the Prometheus text format from the
+        background metrics collector, started on first use.  METRICS in the
+        config file sets how often metrics are collected.
+
+        :return: str
+        """
+        return self._get_metrics_collector().render()
+
+    def _get_metrics_collector(self):
+        """
+        Creates the metrics collector on first use, recording into the
+        history store
+        :return: MetricsCollector
+        """
+        with self._metrics_lock:
+            if self._metrics_collector is None:
+                self._metrics_collector = MetricsCollector(
+                    self, interval=self.config.get('METRICS', dict()).get(
+                        'interval', 15),
+                    history=self._get_history())
+        return self._metrics_collector
+
+    def _get_history(self):
+        """
+        Creates the history store on first use, sized by HISTORY in the
+        config file
+        :return: HistoryStore
+        """
+        with self._metrics_lock:
+            if self._history is None:
+                history_config = self.config.get('HISTORY', dict())
+                self._history = HistoryStore(
+                    raw_points=history_config.get('raw_points', 240),
+                    minute_points=history_config.get('minute_points',
+                                                     24 * 60),
+                    hour_points=history_config.get('hour_points', 30 * 24))
+        return self._history
+
+    def _get_network_sampler(self):
+        """
+        Creates and starts the network speed sampler on first use
+        :return: NetworkSpeedSampler
+        """
+        with self._metrics_lock:
+            if self._network_sampler is None:
+                sampler_config = self.config.get('NETWORK_SPEED', dict())
+                self._network_sampler = NetworkSpeedSampler(
+                    interval=sampler_config.get('interval', 1),
+                    window=sampler_config.get('window', 5))
+        self._network_sampler.ensure_running()
+        return self._network_sampler
+
+    def _get_mount_prober(self):
+        """
+        Creates the disk usage prober on first use.  It starts itself when a
+        mount first needs probing in the background.
+        :return: MountProber
+        """
+        with self._metrics_lock:
+            if self._mount_prober is None:
+                probe_config = self.config.get('MOUNT_PROBE', dict())
+                self._mount_prober = MountProber(
+                    timeout=probe_config.get('timeout', 2),
+                    interval=probe_config.get('interval', 30))
+        return self._mount_prober
+
+    def _get_latency_prober(self):
+        """
+        Creates and starts the latency prober on first use
+        :return: LatencyProber
+        """
+        with self._metrics_lock:
+            if self._latency_prober is None:
+                ping_config = self.config.get('PING', dict())
+                self._latency_prober = LatencyProber(
+                    targets=ping_config.get('targets'),
+                    mode=ping_config.get('mode', 'tcp'),
+                    port=ping_config.get('port', 53),
+                    interval=ping_config.get('interval', 10),
+                    window=ping_config.get('window', 30),
+                    timeout=ping_config.get('timeout', 2))
+        self._latency_prober.ensure_running()
+        return self._latency_prober
+
+    def _gather_media(self, sources):
+        """
+        Runs media sources concurrently on a bounded thread pool and collects
+        their results, waiting at most the section's deadline for each.  A
+        source still running from an earlier call isn't started again, so a
+        hung server can only ever tie up one pool thread per section.
+
+        :param sources: mapping of section name to function returning data
+        :type sources: OrderedDict
+        :return: dict
+        """
+        timeouts = self.config.get('MEDIA_TIMEOUTS', dict())
+        default_timeout = timeouts.get('default', 10)
+        if self._media_pool is None:
+            self._media_pool = ThreadPool(processes=len(sources))
+        start = monotonic()
+        for section, source in sources.items():
+            in_flight = self._media_in_flight.get(section)
+            if in_flight is None or in_flight.ready():
+                self._media_in_flight[section] = self._media_pool.apply_async(
+                    source)
+        output = dict()
+        media_status = dict()
+        for section in sources:
+            deadline = start + timeouts.get(section, default_timeout)
+            try:
+                output[section] = self._media_in_flight[section].get(
+                    max(deadline - monotonic(), 0))
+            except TimeoutError:
+                LOGGER.warning('{} missed its deadline'.format(section))
+            except Exception as err:
+                LOGGER.error('{} failed: {}'.format(section, err))
+            if section in output:
+                media_status[section] = 'ok'
+                self._media_last_result[section] = output[section]
+            elif section in self._media_last_result:
+                media_status[section] = 'stale'
+                output[section] = self._media_last_result[section]
+            else:
+                media_status[section] = 'unavailable'
+                output[section] = None
+        output['media_status'] = media_status
+        return output
+
+    def _get_breaker(self, attrib):
+        """
+        Returns the circuit breaker of a service, creating it on first use
+        :return: CircuitBreaker
+        """
+        with self._metrics_lock:
+            if attrib not in self._breakers:
+                breaker_config = self.config.get('CIRCUIT_BREAKER', dict())
+                self._breakers[attrib] = CircuitBreaker(
+                    attrib,
+                    failure_threshold=breaker_config.get('failure_threshold',
+                                                         3),
+                    base_delay=breaker_config.get('base_delay', 5),
+                    max_delay=breaker_config.get('max_delay', 300))
+            return self._breakers[attrib]
+
+    def _call_service(self, attrib, func, *args, **kwargs):
+        """
+        Calls func through the service's circuit breaker.  Services that
+        aren't loaded raise ServiceUnavailableError without counting as a
+        failure.
+
+        :raises: ServiceUnavailableError
+        """
+        if getattr(self, attrib) is None:
+            raise ServiceUnavailableError('{} not loaded'.format(attrib))
+        return self._get_breaker(attrib).call(func, *args, **kwargs)
 
     def _load_configs(self):
         """
         Loads config data for Service subclasses if not already loaded to
-        prevent errors.
+        prevent errors.  Services that fail to load are retried once their
+        circuit breaker allows it.
         :return: Service class
         """
-        if self.subsonic is None:
-            try:
-                self.subsonic = SubSonic(self.config['SUBSONIC_INFO'])
-            except KeyError:
-                LOGGER.debug('Subsonic not loaded yet')
-        if self.plex is None:
-            try:
-                self.plex = Plex(self.config['PLEX_INFO'])
-            except KeyError:
-                LOGGER.debug('Plex not loaded yet')
-        if self.server_sync is None:
-            try:
-                self.server_sync = ServerSync(self.config['SERVERSYNC_INFO'])
-            except KeyError:
-                LOGGER.debug('Server Sync not loaded yet')
-        if self.crashplan is None:
+        for service in self._service_classes:
+            self._load_service(*service)
+
+    def _load_service(self, attrib, name, config_key, service_class):
+        """
+        Loads a Service subclass into attrib if not already loaded, takes an
+        entry of _service_classes.  Concurrent calls for the same service
+        wait for a single load.
+
+        :return: 'ok', 'not_configured', 'unavailable' if its circuit breaker
+        is open, or 'error'
+        """
+        with self._service_locks[attrib]:
+            if getattr(self, attrib) is not None:
+                return 'ok'
             try:
-                self.crashplan = CheckCrashPlan(self.config['CRASHPLAN_INFO'])
+                service_config = self.config[config_key]
             except KeyError:
-                LOGGER.debug('CrashPlan not loaded yet')
-        if self.weather is None:
+                LOGGER.debug('{} not loaded yet'.format(name))
+                return 'not_configured'
             try:
-                self.weather = Forecast(self.config['WEATHER'])
-            except KeyError:
-                LOGGER.debug('weather not loaded yet')
+                setattr(self, attrib, self._get_breaker(attrib).call(
+                    service_class, service_config))
+            except ServiceUnavailableError:
+                return 'unavailable'
+            except Exception as err:
+                LOGGER.error('Failed to load {}: {}'.format(name, err))
+                return 'error'
+        return 'ok'
 
 
 LOGGER = logging.getLogger(__name__)
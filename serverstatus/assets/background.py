@@ -0,0 +1,185 @@
+"""
+Background worker primitives shared by the samplers, probers and caches that
+keep slow collection work off of the request thread
+"""
+import os
+import threading
+import logging
+import Queue
+
+try:
+    from time import monotonic
+except ImportError:
+    import ctypes
+    import ctypes.util
+
+    class _TimeSpec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    _CLOCK_MONOTONIC = 1
+    try:
+        _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or
+                                     ctypes.util.find_library('c'),
+                                     use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        _clock_gettime = None
+
+    def monotonic():
+        """
+        Seconds elapsed on a clock that never goes backwards.  Python 2.7 has
+        no monotonic clock in the time module, so read CLOCK_MONOTONIC through
+        libc.  Falls back to the elapsed real time from os.times(), which is
+        also monotonic on POSIX systems but only has 1/100th of a second
+        resolution
+
+        :return: float
+        """
+        if _clock_gettime is not None:
+            now = _TimeSpec()
+            if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(now)) == 0:
+                return now.tv_sec + now.tv_nsec * 1e-9
+        return os.times()[4]
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PeriodicThread(threading.Thread):
+    """
+    Daemon thread that calls tick() on a fixed interval until stopped.  tick
+    calls func when one is given, otherwise subclasses override tick.
+
+    The next run is scheduled from the start of the previous one so slow ticks
+    don't cause the interval to drift.  Exceptions raised by tick() are logged
+    and the thread keeps running.
+
+    Threads don't survive a fork, so ensure_running starts the thread again
+    in a child process, ex. a gunicorn worker forked from a preloaded app.
+    """
+
+    def __init__(self, interval, func=None, name=None):
+        if name is None and func is not None:
+            name = func.__name__
+        threading.Thread.__init__(self, name=name)
+        assert interval > 0
+        self.daemon = True
+        self.interval = float(interval)
+        self.func = func
+        self.logger = LOGGER
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._launched = False
+        self._pid = os.getpid()
+
+    def run(self):
+        next_run = monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as err:
+                self.logger.exception(
+                    '{} tick failed: {}'.format(self.name, err))
+            next_run += self.interval
+            delay = next_run - monotonic()
+            if delay < 0:
+                # tick overran the interval, skip the missed runs
+                next_run = monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def tick(self):
+        # method to be overridden by subclasses not given a func
+        if self.func is None:
+            raise NotImplementedError(
+                '{} has no func and doesn\'t override tick'.format(self.name))
+        self.func()
+
+    def ensure_running(self):
+        """
+        Start the thread if it hasn't been started yet.  Safe to call from
+        any number of request threads.
+        """
+        if self._launched and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # started before a fork, the thread isn't running here
+                threading.Thread.__init__(self, name=self.name)
+                self.daemon = True
+                self._pid = os.getpid()
+                self._launched = False
+            if not self._launched:
+                self._launched = True
+                self.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class WorkQueue(object):
+    """
+    Calls func(key) on background worker threads for each key put on the
+    queue.  Keys already waiting in the queue or being worked on are ignored,
+    so the same job is never queued twice.
+    """
+
+    def __init__(self, func, workers=1, name=None):
+        assert workers > 0
+        self.func = func
+        self.workers = workers
+        self.name = name or func.__name__
+        self.logger = LOGGER
+        self._queue = Queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = list()
+        self._pid = os.getpid()
+
+    def put(self, key):
+        """
+        Queues key for processing unless it's already pending
+
+        :return: bool - True if key was queued
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            self._start_workers()
+        self._queue.put(key)
+        return True
+
+    def is_pending(self, key):
+        return key in self._pending
+
+    def join(self):
+        """
+        Blocks until every queued key has been processed
+        """
+        self._queue.join()
+
+    def _start_workers(self):
+        if self._pid != os.getpid():
+            # workers started before a fork aren't running here
+            self._threads = list()
+            self._pid = os.getpid()
+        while len(self._threads) < self.workers:
+            worker = threading.Thread(
+                target=self._work,
+                name='{}-worker-{}'.format(self.name, len(self._threads)))
+            worker.daemon = True
+            worker.start()
+            self._threads.append(worker)
+
+    def _work(self):
+        while True:
+            key = self._queue.get()
+            try:
+                self.func(key)
+            except Exception as err:
+                self.logger.exception(
+                    '{} failed for {}: {}'.format(self.name, key, err))
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
@@ -0,0 +1,133 @@
+"""
+Collects dashboard sections once on the server and pushes changes to every
+connected client
+"""
+import threading
+import logging
+import Queue
+
+from serverstatus.assets.background import PeriodicThread, monotonic
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Subscription(Queue.Queue):
+    """
+    Queue of events for one subscriber.  closed is set once it's been
+    unsubscribed, ex. for falling behind, and nothing more is put on it.
+    """
+
+    def __init__(self, maxsize=0):
+        Queue.Queue.__init__(self, maxsize)
+        self.closed = False
+
+
+class Broadcaster(object):
+    """
+    Fans published events out to every subscriber queue, and remembers the
+    latest event of each name so new subscribers can start from a full
+    snapshot.  Subscribers that fall max_queued events behind are dropped
+    instead of buffering without bound, and their subscription is closed.
+    """
+
+    def __init__(self, max_queued=100):
+        self.logger = LOGGER
+        self.max_queued = max_queued
+        self._subscribers = set()
+        self._latest = dict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """
+        Returns a queue that receives (version, event, data) tuples for every
+        event published from now on
+
+        :return: Subscription
+        """
+        subscription = Subscription(maxsize=self.max_queued)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            subscription.closed = True
+
+    def latest(self):
+        """
+        Returns the latest (version, event, data) of every event name, oldest
+        first
+
+        :return: list of [tuple]
+        """
+        with self._lock:
+            return sorted(self._latest.values())
+
+    def publish(self, event, data):
+        """
+        Sends data to every subscriber under event name
+
+        :type event: str
+        :type data: str
+        """
+        with self._lock:
+            self._version += 1
+            message = (self._version, event, data)
+            self._latest[event] = message
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(message)
+            except Queue.Full:
+                self.logger.warning('Dropping subscriber that fell behind')
+                self.unsubscribe(subscription)
+
+
+class SnapshotPoller(PeriodicThread):
+    """
+    Collects each section on its own interval and publishes it to the
+    broadcaster when its data has changed since it was last published.
+    Nothing is collected while there are no subscribers; sections that came
+    due in the meantime are collected as soon as someone subscribes.
+    """
+
+    def __init__(self, broadcaster, collect, intervals, tick_interval=1):
+        """
+        :param broadcaster: Broadcaster
+        :param collect: function taking a section name, returning its data
+        as a str
+        :param intervals: mapping of section name to seconds between
+        collections
+        :type intervals: dict
+        """
+        PeriodicThread.__init__(self, tick_interval, name='snapshot-poller')
+        self.broadcaster = broadcaster
+        self.collect = collect
+        self.intervals = dict(intervals)
+        self._next_due = dict.fromkeys(self.intervals, 0)
+        self._published = dict()
+
+    def tick(self):
+        if not self.broadcaster.subscriber_count:
+            return
+        now = monotonic()
+        for section, interval in self.intervals.items():
+            if self._next_due[section] > now:
+                continue
+            self._next_due[section] = now + interval
+            try:
+                data = self.collect(section)
+            except Exception as err:
+                self.logger.error(
+                    'Collecting {} failed: {}'.format(section, err))
+                continue
+            if self._published.get(section) != data:
+                self._published[section] = data
+                self.broadcaster.publish(section, data)
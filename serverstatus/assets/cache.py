@@ -0,0 +1,119 @@
+"""
+In-memory caches for collected API data
+"""
+import threading
+import logging
+
+from serverstatus.assets.background import monotonic
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TTLCache(object):
+    """
+    Caches values by key for a per key time to live (TTL) in seconds.
+
+    The first request for a key loads the value in the calling thread, and
+    concurrent requests for the same key wait for that single load.  Once a
+    value has expired it is still returned (stale-while-revalidate) while one
+    background thread reloads it, so a slow loader only ever delays the very
+    first request.  A TTL of 0 or less disables caching for that key.
+    """
+
+    def __init__(self, ttls=None, default_ttl=5):
+        """
+        :param ttls: mapping of key to TTL in seconds
+        :type ttls: dict or NoneType
+        :param default_ttl: TTL in seconds for keys not found in ttls
+        :type default_ttl: int or float
+        """
+        self.logger = LOGGER
+        self.ttls = dict(ttls or dict())
+        self.default_ttl = self.ttls.pop('default', default_ttl)
+        self._entries = dict()
+        self._refreshing = set()
+        self._key_locks = dict()
+        self._lock = threading.Lock()
+
+    def ttl(self, key):
+        return self.ttls.get(key, self.default_ttl)
+
+    def get(self, key, loader):
+        """
+        Returns cached value for key, calling loader() to load it when the key
+        hasn't been cached yet.  Expired values are returned as is and
+        reloaded in the background.
+
+        :param key: cache key
+        :type key: str
+        :param loader: function with no arguments returning the value to cache
+        :return: cached value
+        """
+        ttl = self.ttl(key)
+        if ttl <= 0:
+            return loader()
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._get_key_lock(key):
+                # another thread may have loaded the key while we waited
+                entry = self._entries.get(key)
+                if entry is None:
+                    value = loader()
+                    self._store(key, value)
+                    return value
+        value, stored_at = entry
+        if monotonic() - stored_at >= ttl:
+            self._refresh_in_background(key, loader)
+        return value
+
+    def age(self, key):
+        """
+        Returns seconds since the value for key was loaded, None if not cached
+
+        :return: float or NoneType
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return monotonic() - entry[1]
+
+    def invalidate(self, key=None):
+        """
+        Removes key from the cache, or every key if key is None
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, monotonic())
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                # only one refresh per key at a time
+                return
+            self._refreshing.add(key)
+        refresh = threading.Thread(target=self._refresh, args=(key, loader),
+                                   name='cache-refresh-{}'.format(key))
+        refresh.daemon = True
+        refresh.start()
+
+    def _refresh(self, key, loader):
+        try:
+            self._store(key, loader())
+        except Exception as err:
+            # keep serving the stale value, the next request will retry
+            self.logger.exception(
+                'Background refresh of {} failed: {}'.format(key, err))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
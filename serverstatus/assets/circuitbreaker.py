@@ -0,0 +1,133 @@
+"""
+Circuit breakers for upstream services, so a server that's down fails fast
+instead of every request waiting on connection timeouts
+"""
+import threading
+import logging
+
+from serverstatus.assets.background import monotonic
+from serverstatus.assets.exceptions import ServiceUnavailableError
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+    """
+    Tracks consecutive failures of a single service.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected with ServiceUnavailableError without contacting the service.
+    Once the retry delay has passed the circuit is half open and a single
+    trial call is let through: success closes the circuit, failure opens it
+    again with the delay doubled, starting at base_delay and capped at
+    max_delay seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=3, base_delay=5,
+                 max_delay=300):
+        self.logger = LOGGER
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._failures = 0
+        self._times_opened = 0
+        self._retry_at = None
+        self._trial_in_progress = False
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    @property
+    def status(self):
+        """
+        Returns state of the circuit, consecutive failures, seconds until the
+        next retry is allowed and the last error seen
+
+        >>> {'state': 'open', 'failures': 3, 'retry_in': 8.5,
+        ...  'last_error': 'Connection refused'}
+
+        :return: dict
+        """
+        with self._lock:
+            retry_in = 0
+            if self._retry_at is not None:
+                retry_in = max(self._retry_at - monotonic(), 0)
+            return dict(state=self._state(), failures=self._failures,
+                        retry_in=round(retry_in, 1),
+                        last_error=self._last_error)
+
+    def allow(self):
+        """
+        Returns whether a call to the service may go ahead.  In the half open
+        state only the first caller is allowed through as the trial call.
+
+        :return: bool
+        """
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._retry_at is not None:
+                self.logger.info('{} recovered, closing circuit'.format(
+                    self.name))
+            self._failures = 0
+            self._times_opened = 0
+            self._retry_at = None
+            self._trial_in_progress = False
+            self._last_error = None
+
+    def record_failure(self, err=None):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(err) if err is not None else None
+            if self._trial_in_progress or \
+                    self._failures >= self.failure_threshold:
+                delay = min(self.base_delay * 2 ** self._times_opened,
+                            self.max_delay)
+                self._times_opened += 1
+                self._retry_at = monotonic() + delay
+                self.logger.warning(
+                    '{} failed {} times, retrying in {} seconds: {}'.format(
+                        self.name, self._failures, delay, self._last_error))
+            self._trial_in_progress = False
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func through the circuit breaker, recording its outcome
+
+        :raises: ServiceUnavailableError while the circuit is open, otherwise
+        any exception raised by func
+        """
+        if not self.allow():
+            raise ServiceUnavailableError(
+                '{} is unavailable, circuit is open'.format(self.name))
+        try:
+            result = func(*args, **kwargs)
+        except Exception as err:
+            self.record_failure(err)
+            raise
+        self.record_success()
+        return result
+
+    def _state(self):
+        if self._retry_at is None:
+            return self.CLOSED
+        if monotonic() < self._retry_at:
+            return self.OPEN
+        return self.HALF_OPEN
@@ -0,0 +1,277 @@
+"""
+Collector mode for multi-worker deployments: a single collector process
+gathers every section and publishes versioned snapshots to a memory-mapped
+file, which the web workers only read.  Upstream servers are then polled
+once per interval however many workers are running.
+"""
+import os
+import json
+import mmap
+import fcntl
+import struct
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+from serverstatus import app
+from serverstatus.assets.background import PeriodicThread, monotonic
+from serverstatus.assets.exceptions import CollectorRunningError
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(app.config['DATA_LOCATION'],
+                            'server_status.snapshot')
+
+# sections collected when none are configured
+DEFAULT_SECTIONS = ('system_info', 'storage', 'network_speed', 'ping',
+                    'ip_address', 'services', 'plex_transcodes', 'media',
+                    'forecast')
+
+# sequence number and payload length at the start of the file, followed by
+# the payload.  The sequence is odd while a snapshot is being written, and
+# the length is always written before the sequence that goes with it
+HEADER = struct.Struct('<QQ')
+_SEQUENCE = struct.Struct('<Q')
+
+
+class SnapshotWriter(object):
+    """
+    Publishes snapshots to a memory-mapped file with a sequence lock, so
+    readers never block the writer nor see a half written snapshot.  The
+    file only ever grows, so readers' existing mappings stay valid.  An
+    exclusive lock on the file keeps a second writer from publishing to it.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, size=65536):
+        """
+        :raises: CollectorRunningError if another writer has the file
+        """
+        self.logger = LOGGER
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            os.close(self._fd)
+            raise CollectorRunningError(
+                'Another collector is publishing to {}'.format(path))
+        size = max(os.fstat(self._fd).st_size, HEADER.size + size)
+        os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # carry on from the last snapshot published, so readers never see a
+        # version reused when the collector restarts
+        sequence = _SEQUENCE.unpack_from(self._map)[0]
+        self._sequence = sequence + (sequence & 1)
+
+    @property
+    def version(self):
+        return self._sequence // 2
+
+    def publish(self, payload):
+        """
+        Publishes payload as the next snapshot
+
+        :type payload: str
+        :return: int - version of the snapshot
+        """
+        end = HEADER.size + len(payload)
+        if end > len(self._map):
+            self._grow(end)
+        _SEQUENCE.pack_into(self._map, 0, self._sequence + 1)
+        self._map[HEADER.size:end] = payload
+        _SEQUENCE.pack_into(self._map, _SEQUENCE.size, len(payload))
+        _SEQUENCE.pack_into(self._map, 0, self._sequence + 2)
+        self._sequence += 2
+        return self.version
+
+    def close(self):
+        if self._fd is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._fd = None
+
+    def _grow(self, end):
+        size = max(end, len(self._map) * 2)
+        os.ftruncate(self._fd, size)
+        self._map.close()
+        self._map = mmap.mmap(self._fd, size)
+
+
+class SnapshotReader(object):
+    """
+    Reads the latest snapshot published by a SnapshotWriter.  Each read only
+    checks the file and its header; the payload is copied and decoded once
+    per version, and the decoded snapshot is returned until the next one is
+    published.
+    """
+    # attempts at reading a snapshot while it's being rewritten
+    retries = 100
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.logger = LOGGER
+        self.path = path
+        self._map = None
+        self._inode = None
+        self._sequence = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """
+        Version of the snapshot last read, None if there isn't one
+        """
+        if self._sequence is None:
+            return None
+        return self._sequence // 2
+
+    def read(self):
+        """
+        Returns the latest snapshot, or None if none has been published yet.
+        A snapshot that can't be decoded is skipped, leaving the one before.
+
+        :return: dict or NoneType
+        """
+        with self._lock:
+            if not self._open():
+                return self._snapshot
+            for _ in range(self.retries):
+                sequence, length = HEADER.unpack_from(self._map)
+                if sequence == self._sequence or sequence == 0:
+                    return self._snapshot
+                end = HEADER.size + length
+                if sequence & 1 or (end > len(self._map) and
+                                    not self._remap(end)):
+                    # the writer is part way through a snapshot
+                    time.sleep(0.001)
+                    continue
+                payload = self._map[HEADER.size:end]
+                if _SEQUENCE.unpack_from(self._map)[0] != sequence:
+                    continue
+                self._sequence = sequence
+                try:
+                    self._snapshot = json.loads(payload,
+                                                object_pairs_hook=OrderedDict)
+                except ValueError as err:
+                    self.logger.error(
+                        'Unreadable snapshot {} at {}: {}'.format(
+                            sequence // 2, self.path, err))
+                return self._snapshot
+        self.logger.warning(
+            'Snapshot at {} kept changing while being read'.format(self.path))
+        return self._snapshot
+
+    def _open(self):
+        # a new file, ex. one recreated by the collector, is mapped again
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            return False
+        if self._map is not None and inode == self._inode:
+            return True
+        if not self._remap(HEADER.size):
+            return False
+        self._inode = inode
+        self._sequence = None
+        return True
+
+    def _remap(self, end):
+        # maps the whole file again, returns False if it's smaller than end
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                if os.fstat(snapshot_file.fileno()).st_size < end:
+                    return False
+                new_map = mmap.mmap(snapshot_file.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+        except (IOError, OSError):
+            return False
+        if self._map is not None:
+            self._map.close()
+        self._map = new_map
+        return True
+
+
+class Collector(PeriodicThread):
+    """
+    Collects sections from APIFunctions every interval seconds and publishes
+    them as a snapshot, ex.
+        {'collected_at': 1414213562.3,
+         'sections': {'ping': {'status': 'ok', 'data': {'ping': '14'}},
+                      'media': {'status': 'stale', 'error': '...',
+                                'data': {...}, 'collected_at': 1414213552.1},
+                      'forecast': {'status': 'error', 'error': '...'}, ...},
+         'plex_covers': {'1412345678': '/library/metadata/27/thumb/...'},
+         'metrics': {'samples': [['load_average', {'period': '1m'}, 0.4],
+                                 ...],
+                     'history': {'tier_sizes': [240, 1440, 720], ...}}}
+    A section that fails is published as stale with the last data collected
+    for it, or as an error if it has never been collected.
+    plex_covers maps the cover art ids found in media to their Plex paths,
+    so workers can serve Plex images they never listed themselves.  metrics
+    holds the latest samples and the history store of the metrics collector
+    running in this process, so workers serve /metrics and /api/history
+    without collecting metrics themselves.
+    """
+
+    def __init__(self, api_functions, writer, sections=DEFAULT_SECTIONS,
+                 interval=10):
+        """
+        :type api_functions: APIFunctions
+        :type writer: SnapshotWriter
+        """
+        PeriodicThread.__init__(self, interval, name='collector')
+        self.api_functions = api_functions
+        self.writer = writer
+        self.sections = sections
+        # section: (unix time, data) of the last successful collection
+        self._last_good = dict()
+
+    def tick(self):
+        start = monotonic()
+        version = self.writer.publish(json.dumps(self.collect()))
+        self.logger.debug('Published snapshot {} in {:.1f}ms'.format(
+            version, (monotonic() - start) * 1000))
+
+    def collect(self):
+        """
+        Returns the snapshot of every section
+
+        :return: dict
+        """
+        sections = OrderedDict()
+        for section in self.sections:
+            try:
+                data = getattr(self.api_functions, section)()
+            except Exception as err:
+                self.logger.error('Collecting {} failed: {}'.format(section,
+                                                                    err))
+                sections[section] = dict(status='error', error=str(err))
+                if section in self._last_good:
+                    collected_at, data = self._last_good[section]
+                    sections[section].update(status='stale', data=data,
+                                             collected_at=collected_at)
+                continue
+            self._last_good[section] = (time.time(), data)
+            sections[section] = dict(status='ok', data=data)
+        plex = self.api_functions.plex
+        plex_covers = dict(plex._cover_mapping or ()) if plex else dict()
+        snapshot = dict(collected_at=time.time(), sections=sections,
+                        plex_covers=plex_covers)
+        metrics = self._collect_metrics()
+        if metrics is not None:
+            snapshot['metrics'] = metrics
+        return snapshot
+
+    def _collect_metrics(self):
+        # the metrics collector samples on its own interval, started here
+        # on the first snapshot
+        try:
+            samples = self.api_functions._get_metrics_collector(
+                ).latest_samples()
+            history = self.api_functions._get_history().dump()
+        except Exception as err:
+            self.logger.error('Collecting metrics failed: {}'.format(err))
+            return None
+        return dict(samples=samples, history=history)
@@ -0,0 +1,159 @@
+"""
+Content-Encoding negotiation and compression of response bodies.  gzip is
+always available; brotli is used as well when the brotli package is
+installed.
+"""
+import os
+import zlib
+import threading
+import logging
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+# encodings in order of preference when the client accepts several equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# file extension of precompressed static files for each encoding
+EXTENSIONS = dict(br='.br', gzip='.gz')
+
+# static files worth compressing, others are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.ttf', '.eot',
+                           '.ico', '.html', '.txt')
+
+
+def negotiate(accept_encodings, available=ENCODINGS):
+    """
+    Returns the encoding of available the client prefers, or None for no
+    encoding.  An encoding listed by the client takes precedence over "*",
+    and one with a quality of 0 is refused.
+
+    :param accept_encodings: (value, quality) pairs parsed from
+    Accept-Encoding, ex. request.accept_encodings
+    :type available: tuple of (str)
+    :return: str or NoneType
+    """
+    qualities = dict((value.lower(), quality) for value, quality in
+                     accept_encodings)
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=6):
+    """
+    Returns data compressed with encoding.  gzip output has no timestamp, so
+    the same data always compresses to the same bytes.
+
+    :type data: str
+    :param encoding: 'gzip' or 'br'
+    :param level: compression level, 1-9
+    :return: str
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br' and brotli is not None:
+        # brotli quality runs 0-11, scale the 1-9 level to it
+        return brotli.compress(data, quality=min(level + 2, 11))
+    raise ValueError('Unsupported encoding {}'.format(encoding))
+
+
+class CompressionCache(object):
+    """
+    Keeps the latest body for each key with its compressed variants, so an
+    unchanged body is compressed only once per encoding.  Bodies shorter than
+    min_size aren't worth compressing and are never encoded.  Only the
+    max_entries keys used most recently are kept, since clients choose the
+    sections of a batch, and so its key.
+    """
+
+    def __init__(self, level=6, min_size=512, max_entries=256):
+        self.logger = LOGGER
+        self.level = level
+        self.min_size = min_size
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, body, encoding):
+        """
+        Returns body encoded with encoding, and the encoding actually used,
+        None if body is returned as is
+
+        :param key: name the body is cached under, ex. the API section
+        :type body: str
+        :type encoding: str or NoneType
+        :return: tuple of (str, str or NoneType)
+        """
+        if encoding is None or len(body) < self.min_size:
+            return body, None
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != body:
+                entry = (body, dict())
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            encoded = entry[1].get(encoding)
+        if encoded is None:
+            encoded = compress(body, encoding, self.level)
+            with self._lock:
+                entry[1][encoding] = encoded
+        return encoded, encoding
+
+
+def precompressed_path(path, encoding):
+    """
+    Returns the path of the precompressed variant of static file path, or
+    None if there isn't one as new as the file itself
+
+    :type path: str
+    :type encoding: str or NoneType
+    :return: str or NoneType
+    """
+    if encoding is None:
+        return None
+    compressed_path = path + EXTENSIONS[encoding]
+    try:
+        if os.path.getmtime(compressed_path) >= os.path.getmtime(path):
+            return compressed_path
+    except OSError:
+        pass
+    return None
+
+
+def precompress_static(directory, level=9):
+    """
+    Writes a compressed variant of every compressible file under directory
+    next to it, for each available encoding, ex. functions.js.gz.  Variants
+    that are already up to date are left alone.
+
+    :type directory: str
+    :return: list of [str] - paths written
+    """
+    written = list()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            for encoding in ENCODINGS:
+                if precompressed_path(path, encoding) is not None:
+                    continue
+                with open(path, 'rb') as source:
+                    data = compress(source.read(), encoding, level)
+                with open(path + EXTENSIONS[encoding], 'wb') as output:
+                    output.write(data)
+                written.append(path + EXTENSIONS[encoding])
+    return written
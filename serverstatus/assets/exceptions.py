@@ -57,4 +57,25 @@ class SubsonicConnectionError(Exception):
     """
     Error connection to specified Subsonic server
     """
-    pass
\ No newline at end of file
+    pass
+
+class ServiceUnavailableError(Exception):
+    """
+    Service failed repeatedly and calls to it are suspended until its circuit
+    breaker allows a retry
+    """
+    pass
+
+
+class ServiceOfflineError(Exception):
+    """
+    Server reached over the network reported itself offline
+    """
+    pass
+
+
+class CollectorRunningError(Exception):
+    """
+    Another collector is already publishing snapshots to the same file
+    """
+    pass
@@ -0,0 +1,67 @@
+"""
+Cache of rendered html fragments, keyed by a fingerprint of the values they
+were rendered from
+"""
+import hashlib
+import json
+import threading
+import logging
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def fingerprint(section, values, version=''):
+    """
+    Returns a hex digest identifying section rendered from values.  version
+    is mixed in so fingerprints change when the templates do.
+
+    :type section: str
+    :param values: JSON serializable data, anything else is hashed as str()
+    :type version: str
+    :return: str
+    """
+    digest = hashlib.sha1('{}\0{}\0'.format(version, section))
+    digest.update(json.dumps(values, default=str))
+    return digest.hexdigest()
+
+
+class FragmentCache(object):
+    """
+    Keeps the last fragment rendered for each section with the fingerprint of
+    its values.  While a section's values don't change, the cached html is
+    returned without rendering the template again, and the fingerprint can be
+    used as its ETag.
+    """
+
+    def __init__(self, render, version=''):
+        """
+        :param render: function taking a section and its values, returning
+        rendered html as unicode
+        :param version: str identifying the templates, ex. their last
+        modified time
+        """
+        self.logger = LOGGER
+        self.render = render
+        self.version = version
+        self.renders = 0
+        self._fragments = dict()
+        self._lock = threading.Lock()
+
+    def get(self, section, values):
+        """
+        Returns the fingerprint of section's values, and section rendered
+        from them as utf-8 encoded html
+
+        :type section: str
+        :return: tuple of (str, str)
+        """
+        etag = fingerprint(section, values, self.version)
+        entry = self._fragments.get(section)
+        if entry is not None and entry[0] == etag:
+            return entry
+        entry = (etag, self.render(section, values).encode('utf-8'))
+        with self._lock:
+            self.renders += 1
+            self._fragments[section] = entry
+        return entry
@@ -0,0 +1,339 @@
+"""
+Fixed memory time-series history of system metrics, kept in ring buffers of
+doubles at raw, 1 minute and 1 hour resolution like an RRD
+"""
+import math
+import base64
+import threading
+import logging
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RingBuffer(object):
+    """
+    Fixed capacity buffer of timestamped (avg, min, max) points backed by
+    arrays of doubles.  Once full, every point appended replaces the oldest.
+    Timestamps must be appended in increasing order.
+    """
+    fields = ('timestamp', 'avg', 'min', 'max')
+
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self._columns = [array('d', [0.0]) * capacity for _ in self.fields]
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def full(self):
+        return self._size == self.capacity
+
+    @property
+    def oldest(self):
+        """
+        Timestamp of the oldest point, None if empty
+        """
+        if not self._size:
+            return None
+        return self._columns[0][self._next if self.full else 0]
+
+    def append(self, timestamp, avg, minimum, maximum):
+        for column, value in zip(self._columns,
+                                 (timestamp, avg, minimum, maximum)):
+            column[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def since(self, start):
+        """
+        Returns the points with a timestamp at or after start, oldest first,
+        as a tuple of (timestamps, avgs, mins, maxes) arrays
+
+        :type start: float
+        :return: tuple of [array.array]
+        """
+        columns = [self._ordered(column) for column in self._columns]
+        first = bisect_left(columns[0], start)
+        return tuple(column[first:] for column in columns)
+
+    def dump(self):
+        """
+        Returns the points oldest first, packed column by column into a
+        base64 string, for RingBuffer.load
+
+        :return: str
+        """
+        return base64.b64encode(''.join(
+            self._ordered(column).tostring() for column in self._columns))
+
+    @classmethod
+    def load(cls, capacity, dumped):
+        """
+        Returns a ring buffer holding the points from RingBuffer.dump
+
+        :type capacity: int
+        :type dumped: str
+        :return: RingBuffer
+        """
+        ring = cls(capacity)
+        values = array('d')
+        values.fromstring(base64.b64decode(dumped))
+        size = len(values) // len(cls.fields)
+        for index, column in enumerate(ring._columns):
+            column[:size] = values[index * size:(index + 1) * size]
+        ring._next = size % capacity
+        ring._size = size
+        return ring
+
+    def _ordered(self, column):
+        if not self.full:
+            return column[:self._size]
+        return column[self._next:] + column[:self._next]
+
+
+class Tier(object):
+    """
+    Ring buffer of points each summarizing step seconds of samples.  Samples
+    are accumulated until one arrives in a later step, then the finished
+    step's average, min and max are appended.  With step None every sample is
+    stored as is.
+    """
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.buffer = RingBuffer(capacity)
+        self._bucket = None
+        self._sum = self._count = 0
+        self._min = self._max = None
+
+    @property
+    def span(self):
+        """
+        Seconds of history the tier holds once full, None for the raw tier
+        """
+        if self.step is None:
+            return None
+        return self.step * self.buffer.capacity
+
+    def add(self, timestamp, value):
+        if self.step is None:
+            self.buffer.append(timestamp, value, value, value)
+            return
+        bucket = math.floor(timestamp / self.step) * self.step
+        if bucket != self._bucket:
+            self.flush()
+            self._bucket = bucket
+        self._sum += value
+        self._count += 1
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = value if self._max is None else max(self._max, value)
+
+    def flush(self):
+        if self._count:
+            self.buffer.append(self._bucket, self._sum / self._count,
+                               self._min, self._max)
+        self._sum = self._count = 0
+        self._min = self._max = None
+
+    def since(self, start):
+        """
+        Returns points since start like RingBuffer.since, including the step
+        still being accumulated as the last point
+        """
+        points = self.buffer.since(start)
+        if self._count and self._bucket >= start:
+            pending = (self._bucket, self._sum / self._count, self._min,
+                       self._max)
+            points = tuple(column + array('d', [value]) for column, value in
+                           zip(points, pending))
+        return points
+
+    def dump(self):
+        """
+        Returns the tier's points and the step still being accumulated as a
+        JSON serializable dict, for Tier.load
+
+        :return: dict
+        """
+        return dict(step=self.step, capacity=self.buffer.capacity,
+                    points=self.buffer.dump(),
+                    pending=[self._bucket, self._sum, self._count, self._min,
+                             self._max])
+
+    @classmethod
+    def load(cls, dumped):
+        """
+        Returns a tier holding the points from Tier.dump
+
+        :type dumped: dict
+        :return: Tier
+        """
+        tier = cls(dumped['step'], dumped['capacity'])
+        tier.buffer = RingBuffer.load(dumped['capacity'], dumped['points'])
+        tier._bucket, tier._sum, tier._count, tier._min, tier._max = \
+            dumped['pending']
+        return tier
+
+
+class HistoryStore(object):
+    """
+    History of every metric recorded, each in a raw tier holding the last
+    raw_points samples, a 1 minute tier and a 1 hour tier.  Memory use is
+    fixed per metric: 4 doubles per point of every tier.
+    """
+    minute = 60
+    hour = 60 * 60
+
+    def __init__(self, raw_points=240, minute_points=24 * 60,
+                 hour_points=30 * 24):
+        self.logger = LOGGER
+        self.tier_sizes = (raw_points, minute_points, hour_points)
+        self._metrics = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def metrics(self):
+        with self._lock:
+            return sorted(self._metrics)
+
+    def record(self, timestamp, values):
+        """
+        Adds a sample of each metric at unix time timestamp
+
+        :type timestamp: float
+        :param values: mapping of metric name to value
+        :type values: dict
+        """
+        with self._lock:
+            for metric, value in values.items():
+                if metric not in self._metrics:
+                    raw_points, minute_points, hour_points = self.tier_sizes
+                    self._metrics[metric] = (
+                        Tier(None, raw_points),
+                        Tier(self.minute, minute_points),
+                        Tier(self.hour, hour_points))
+                for tier in self._metrics[metric]:
+                    tier.add(timestamp, float(value))
+
+    def dump(self):
+        """
+        Returns every metric's tiers as a JSON serializable dict, so another
+        process can query the history with HistoryStore.load
+
+        :return: dict
+        """
+        with self._lock:
+            return dict(tier_sizes=list(self.tier_sizes),
+                        metrics={metric: [tier.dump() for tier in tiers] for
+                                 metric, tiers in self._metrics.items()})
+
+    @classmethod
+    def load(cls, dumped):
+        """
+        Returns a history store holding the metrics from HistoryStore.dump
+
+        :type dumped: dict
+        :return: HistoryStore
+        """
+        history = cls(*dumped['tier_sizes'])
+        history._metrics = {metric: tuple(Tier.load(tier) for tier in tiers)
+                            for metric, tiers in dumped['metrics'].items()}
+        return history
+
+    def query(self, metric, window, now, max_points=None):
+        """
+        Returns history of metric over the last window seconds from the finest
+        tier that covers the window, downsampled to at most max_points, ex.
+            {'metric': 'load_1m', 'step': 60, 'summary': {'min': 0.1,
+             'avg': 0.4, 'max': 1.9},
+             'points': [[1412345640.0, 0.41, 0.22, 0.73], ...]}
+        Each point is [timestamp, avg, min, max].  step is None for raw
+        samples.
+
+        :type metric: str
+        :param window: seconds of history wanted
+        :param now: unix time the window ends at
+        :type max_points: int or NoneType
+        :return: dict
+        :raises: KeyError if metric has never been recorded
+        """
+        start = now - window
+        with self._lock:
+            tiers = self._metrics[metric]
+            tier = self._choose_tier(tiers, start, window)
+            timestamps, avgs, mins, maxes = tier.since(start)
+        step = tier.step
+        if max_points and len(timestamps) > max_points:
+            factor = int(math.ceil(len(timestamps) / float(max_points)))
+            timestamps, avgs, mins, maxes = downsample(
+                timestamps, avgs, mins, maxes, factor)
+            step = factor * step if step else None
+        return dict(metric=metric, step=step,
+                    summary=summarize(avgs, mins, maxes),
+                    points=[list(point) for point in
+                            zip(timestamps, avgs, mins, maxes)])
+
+    @staticmethod
+    def _choose_tier(tiers, start, window):
+        raw, minutes, hours = tiers
+        # raw samples cover the window, or are all there is so far
+        if not raw.buffer.full or raw.buffer.oldest <= start:
+            return raw
+        if window <= minutes.span:
+            return minutes
+        return hours
+
+
+def summarize(avgs, mins, maxes):
+    """
+    Returns min, average and max over a window of points
+
+    :type avgs: array.array
+    :type mins: array.array
+    :type maxes: array.array
+    :return: dict
+    """
+    if not avgs:
+        return dict(min=None, avg=None, max=None)
+    if numpy is not None:
+        return dict(min=float(numpy.frombuffer(mins).min()),
+                    avg=float(numpy.frombuffer(avgs).mean()),
+                    max=float(numpy.frombuffer(maxes).max()))
+    return dict(min=min(mins), avg=sum(avgs) / len(avgs), max=max(maxes))
+
+
+def downsample(timestamps, avgs, mins, maxes, factor):
+    """
+    Merges every factor consecutive points into one, the first timestamp,
+    average of averages, min of mins and max of maxes
+
+    :type factor: int
+    :return: tuple of [array.array]
+    """
+    if numpy is not None:
+        length = len(timestamps)
+        starts = numpy.arange(0, length, factor)
+        counts = numpy.diff(numpy.append(starts, length))
+        return tuple(array('d', column.tolist()) for column in (
+            numpy.frombuffer(timestamps)[starts],
+            numpy.add.reduceat(numpy.frombuffer(avgs), starts) / counts,
+            numpy.minimum.reduceat(numpy.frombuffer(mins), starts),
+            numpy.maximum.reduceat(numpy.frombuffer(maxes), starts)))
+    chunks = range(0, len(timestamps), factor)
+    return (array('d', (timestamps[i] for i in chunks)),
+            array('d', (sum(avgs[i:i + factor]) / len(avgs[i:i + factor])
+                        for i in chunks)),
+            array('d', (min(mins[i:i + factor]) for i in chunks)),
+            array('d', (max(maxes[i:i + factor]) for i in chunks)))
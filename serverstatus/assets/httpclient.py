@@ -0,0 +1,226 @@
+"""
+Pooled keep-alive HTTP clients for upstream media servers
+"""
+import os
+import threading
+import urlparse
+import logging
+
+import requests
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, \
+    HTTPSConnectionPool
+from requests.packages.urllib3.exceptions import EmptyPoolError, \
+    MaxRetryError, ProtocolError, TimeoutError
+from requests.packages.urllib3.poolmanager import PoolManager, SSL_KEYWORDS
+
+
+LOGGER = logging.getLogger(__name__)
+
+_HTTP_CLIENTS = dict()
+_HTTP_CLIENTS_LOCK = threading.Lock()
+
+
+def get_http_client(base_url, **options):
+    """
+    Returns the shared PooledHTTPClient for base_url, creating it on first
+    use with options so every caller talking to the same server shares one
+    connection pool
+
+    :type base_url: str
+    :return: PooledHTTPClient
+    """
+    with _HTTP_CLIENTS_LOCK:
+        if base_url not in _HTTP_CLIENTS:
+            _HTTP_CLIENTS[base_url] = PooledHTTPClient(base_url, **options)
+        return _HTTP_CLIENTS[base_url]
+
+
+def get_http_client_stats():
+    """
+    Returns connection counters for every shared client keyed by base url
+
+    :return: dict
+    """
+    with _HTTP_CLIENTS_LOCK:
+        clients = _HTTP_CLIENTS.items()
+    return {base_url: client.stats for base_url, client in clients}
+
+
+class _PoolTimeoutMixin(object):
+    """
+    Connection pool that waits at most pool_timeout seconds for a free
+    connection.  requests 2.4 never passes a pool timeout to urlopen, so a
+    blocking pool would otherwise wait forever.
+    """
+
+    def __init__(self, host, port=None, pool_timeout=None, **kwargs):
+        self.pool_timeout = pool_timeout
+        super(_PoolTimeoutMixin, self).__init__(host, port, **kwargs)
+
+    def urlopen(self, method, url, *args, **kwargs):
+        kwargs.setdefault('pool_timeout', self.pool_timeout)
+        try:
+            return super(_PoolTimeoutMixin, self).urlopen(method, url, *args,
+                                                          **kwargs)
+        except (MaxRetryError, ProtocolError, TimeoutError):
+            # urllib3 1.9 only gives back the slot of a connection that failed
+            # when release_conn is set, and requests can't set it since it
+            # streams every body.  Without this a blocking pool shrinks by one
+            # connection with every failed request, until requests hang.
+            if not kwargs.get('release_conn'):
+                self._put_conn(None)
+            raise
+
+
+class _PoolTimeoutHTTPConnectionPool(_PoolTimeoutMixin, HTTPConnectionPool):
+    pass
+
+
+class _PoolTimeoutHTTPSConnectionPool(_PoolTimeoutMixin, HTTPSConnectionPool):
+    pass
+
+
+class _PoolTimeoutPoolManager(PoolManager):
+    pool_classes_by_scheme = dict(http=_PoolTimeoutHTTPConnectionPool,
+                                  https=_PoolTimeoutHTTPSConnectionPool)
+
+    def _new_pool(self, scheme, host, port):
+        kwargs = self.connection_pool_kw
+        if scheme == 'http':
+            kwargs = dict((key, value) for key, value in kwargs.items()
+                          if key not in SSL_KEYWORDS)
+        return self.pool_classes_by_scheme[scheme](host, port, **kwargs)
+
+
+class _PoolTimeoutAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose pools wait at most pool_timeout seconds for a free
+    connection
+    """
+
+    def __init__(self, pool_timeout, **kwargs):
+        self.pool_timeout = pool_timeout
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=DEFAULT_POOLBLOCK,
+                         **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _PoolTimeoutPoolManager(
+            num_pools=connections, maxsize=maxsize, block=block,
+            pool_timeout=self.pool_timeout, **pool_kwargs)
+
+
+def close_response(resp):
+    """
+    Closes a response from a PooledHTTPClient.  A connection whose body was
+    read in full goes back to the pool; one with body left unread, ex. an
+    image download the client aborted, is closed first, since the next
+    request sent on it would read the rest of the old response.
+
+    :type resp: requests.Response
+    """
+    connection = resp.raw._connection
+    if connection is not None and not resp.raw.closed:
+        # the socket stays open until the response's file is closed too
+        resp.raw.close()
+        connection.close()
+    resp.close()
+
+
+class PooledHTTPClient(object):
+    """
+    HTTP client for a single server that keeps up to max_connections
+    keep-alive connections open and reuses them across requests.  Requests
+    beyond max_connections wait for a free connection instead of opening new
+    ones, and every request has a connect and a read timeout in seconds.
+    A request that can't get a connection within pool_timeout seconds fails
+    with requests.ConnectionError.  A child process opens its own
+    connections rather than share sockets with its parent.
+    """
+
+    def __init__(self, base_url, max_connections=4, connect_timeout=3,
+                 read_timeout=10, pool_timeout=10):
+        self.logger = LOGGER
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self._pid = None
+        self._connect()
+
+    def _connect(self):
+        self._adapter = _PoolTimeoutAdapter(self.pool_timeout,
+                                            pool_connections=1,
+                                            pool_maxsize=self.max_connections,
+                                            pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self._pid = os.getpid()
+
+    def get(self, path, stream=False, headers=None):
+        """
+        GET path relative to the base url.  With stream set, the body isn't
+        read until requested and the connection goes back to the pool once
+        the body has been read or the response closed with
+        close_response.
+
+        :type path: str
+        :type stream: bool
+        :type headers: dict or NoneType
+        :return: requests.Response
+        :raises: requests.RequestException
+        """
+        return self.request('GET', path, stream=stream, headers=headers)
+
+    def head(self, path, headers=None):
+        """
+        HEAD path relative to the base url
+
+        :type path: str
+        :type headers: dict or NoneType
+        :return: requests.Response
+        :raises: requests.RequestException
+        """
+        return self.request('HEAD', path, headers=headers)
+
+    def request(self, method, path, stream=False, headers=None):
+        if self._pid != os.getpid():
+            self._connect()
+        url = urlparse.urljoin(self.base_url, path)
+        try:
+            resp = self.session.request(method, url, timeout=self.timeout,
+                                        stream=stream, headers=headers)
+        except requests.exceptions.SSLError:
+            raise
+        except EmptyPoolError:
+            raise requests.ConnectionError(
+                'No free connection to {} within {}s'.format(
+                    self.base_url, self.pool_timeout))
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError:
+            close_response(resp)
+            raise
+        return resp
+
+    @property
+    def stats(self):
+        """
+        Returns number of connections opened, and number of requests that
+        reused an already open connection
+
+        >>> {'opened': 2, 'reused': 118}
+
+        :return: dict
+        """
+        pools = self._adapter.poolmanager.pools
+        opened = requests_sent = 0
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+        return dict(opened=opened, reused=max(requests_sent - opened, 0))
@@ -0,0 +1,254 @@
+"""
+Size bounded on disk cache for cover art images
+"""
+import os
+import re
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+
+
+LOGGER = logging.getLogger(__name__)
+
+# digest is the SHA-1 of the image data
+CacheEntry = namedtuple('CacheEntry',
+                        ['key', 'path', 'size', 'mtime', 'digest'])
+
+_IMAGE_CACHES = dict()
+_IMAGE_CACHES_LOCK = threading.Lock()
+
+# image files written by earlier versions, named by cover ID rather than by
+# the SHA-1 of their key, ex. 1412345678.thumbnail or cover28102_145.jpg
+_LEGACY_FILE = re.compile(r'^(?![0-9a-f]{40}\.jpg$).+\.(jpg|thumbnail)$')
+
+
+def get_image_cache(directory, max_bytes=None):
+    """
+    Returns the shared ImageCache for directory, creating it on first use so
+    every service writing to the same directory shares one index and budget
+
+    :type directory: str
+    :type max_bytes: int or NoneType
+    :return: ImageCache
+    """
+    directory = os.path.realpath(directory)
+    with _IMAGE_CACHES_LOCK:
+        if directory not in _IMAGE_CACHES:
+            _IMAGE_CACHES[directory] = ImageCache(directory, max_bytes)
+        return _IMAGE_CACHES[directory]
+
+
+class ImageCache(object):
+    """
+    Stores image data by key in a directory, evicting the least recently
+    used images once the directory grows past max_bytes.
+
+    File names are the SHA-1 of the key, so any key maps to a safe, fixed
+    length file name.  An in memory index of the directory answers lookups
+    without touching the file system, and files are written to a temporary
+    file first and renamed into place so readers never see a partial image.
+    """
+    file_ext = '.jpg'
+    default_max_bytes = 256 * 1024 ** 2
+    # seconds after which a temporary file is taken to be left by a crash
+    # rather than being written by another process sharing the directory
+    stale_temp_age = 10 * 60
+
+    def __init__(self, directory, max_bytes=None):
+        self.logger = LOGGER
+        self.directory = directory
+        if max_bytes is None:
+            max_bytes = ImageCache.default_max_bytes
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._index)
+
+    def contains(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """
+        Returns CacheEntry for key and marks it as recently used, or None if
+        key isn't cached.  Picks up files written by other processes sharing
+        the directory.  The digest of files this process didn't write is
+        computed the first time they're requested.
+
+        :type key: str
+        :return: CacheEntry or NoneType
+        """
+        file_name = self._file_name(key)
+        with self._lock:
+            entry = self._index.pop(file_name, None)
+            if entry is not None:
+                if entry.key is None:
+                    # indexed from disk at startup
+                    entry = entry._replace(key=key)
+                self._index[file_name] = entry
+        if entry is None:
+            # not indexed by this process, check if another worker wrote it
+            try:
+                stat = os.stat(os.path.join(self.directory, file_name))
+            except OSError:
+                return None
+            entry = self._add(file_name, key, stat.st_size, stat.st_mtime)
+        if entry.digest is None:
+            entry = self._add_digest(file_name, entry)
+        return entry
+
+    def open(self, key):
+        """
+        Returns cached image for key as an open file, None if not cached
+
+        :type key: str
+        :return: file or NoneType
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        try:
+            return open(entry.path, 'rb')
+        except IOError:
+            # evicted by another process sharing the directory
+            self._remove(self._file_name(key))
+            return None
+
+    def put(self, key, data):
+        """
+        Atomically writes image data for key to the cache, evicting least
+        recently used images if the cache grows past max_bytes
+
+        :type key: str
+        :type data: str
+        :return: CacheEntry
+        :raises: OSError, IOError
+        """
+        self._make_directory()
+        file_name = self._file_name(key)
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                             prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(data)
+            os.chmod(temp_path, 0644)
+            os.rename(temp_path, os.path.join(self.directory, file_name))
+        except (OSError, IOError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.logger.info('Write image file: {} ({})'.format(file_name, key))
+        entry = self._add(file_name, key, len(data),
+                          os.path.getmtime(os.path.join(self.directory,
+                                                        file_name)),
+                          hashlib.sha1(data).hexdigest())
+        self._evict()
+        return entry
+
+    def _file_name(self, key):
+        return hashlib.sha1(key).hexdigest() + self.file_ext
+
+    def _add(self, file_name, key, size, mtime, digest=None):
+        entry = CacheEntry(key=key,
+                           path=os.path.join(self.directory, file_name),
+                           size=size, mtime=mtime, digest=digest)
+        with self._lock:
+            previous = self._index.pop(file_name, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            self._index[file_name] = entry
+            self._total_bytes += size
+        return entry
+
+    def _add_digest(self, file_name, entry):
+        digest = hashlib.sha1()
+        try:
+            with open(entry.path, 'rb') as img_file:
+                for chunk in iter(lambda: img_file.read(65536), ''):
+                    digest.update(chunk)
+        except IOError:
+            # evicted by another process sharing the directory
+            self._remove(file_name)
+            return None
+        entry = entry._replace(digest=digest.hexdigest())
+        with self._lock:
+            if file_name in self._index:
+                self._index[file_name] = entry
+        return entry
+
+    def _remove(self, file_name):
+        with self._lock:
+            entry = self._index.pop(file_name, None)
+            if entry is not None:
+                self._total_bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes or \
+                        len(self._index) <= 1:
+                    return
+                file_name, entry = self._index.popitem(last=False)
+                self._total_bytes -= entry.size
+            try:
+                os.remove(entry.path)
+                self.logger.debug('Evicted image file: {}'.format(file_name))
+            except OSError:
+                pass
+
+    def _make_directory(self):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+                self.logger.info('Creating image cache directory {}'.format(
+                    self.directory))
+            except OSError:
+                # created by another thread or process in the meantime
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def _load_index(self):
+        """
+        Indexes images already in the cache directory, least recently
+        accessed first.  Keys of files from a previous run are unknown until
+        they're requested again.  Temporary files left by a crash and image
+        files written by earlier versions are removed.
+        """
+        try:
+            file_names = os.listdir(self.directory)
+        except OSError:
+            return
+        found = list()
+        now = time.time()
+        for file_name in file_names:
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+                if _LEGACY_FILE.match(file_name) or (
+                        file_name.startswith('.tmp-') and
+                        now - stat.st_mtime > self.stale_temp_age):
+                    os.remove(path)
+                    self.logger.info('Removed leftover image file {}'.format(
+                        file_name))
+                    continue
+            except OSError:
+                continue
+            if not file_name.endswith(self.file_ext):
+                continue
+            found.append((stat.st_atime, file_name, stat))
+        for _, file_name, stat in sorted(found):
+            self._add(file_name, None, stat.st_size, stat.st_mtime)
+        self._evict()
@@ -0,0 +1,122 @@
+"""
+Incremental reader for key = value status lines in growing log files
+"""
+import os
+import re
+import threading
+import logging
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LogTail(object):
+    """
+    Keeps the latest value of each key matched by pattern in a log file,
+    reading only the bytes appended since the last update.
+
+    pattern must have two groups, the key and its value, both of which are
+    stored lower cased.  The file is identified by device and inode: when it's
+    replaced (rotated) or shrinks (truncated) it's read again from the end
+    backwards, block_size bytes at a time, only until every key in keys has
+    been found.  Keys not found in the new file keep their last known value.
+    """
+
+    def __init__(self, path, pattern, keys, block_size=65536):
+        """
+        :type path: str
+        :param pattern: compiled regex, or str compiled case insensitive
+        :param keys: keys to look for when reading backwards
+        :type keys: list of [str]
+        :type block_size: int
+        """
+        self.logger = LOGGER
+        self.path = path
+        if isinstance(pattern, basestring):
+            pattern = re.compile(pattern, re.IGNORECASE)
+        self.pattern = pattern
+        self.keys = frozenset(key.lower() for key in keys)
+        self.block_size = block_size
+        self.values = dict()
+        self._file_id = None
+        self._offset = 0
+        self._partial = ''
+        self._lock = threading.Lock()
+
+    def update(self):
+        """
+        Reads any new data from the log file, costing a stat() when nothing
+        has changed
+
+        :return: latest value of each key found
+        :rtype: dict
+        """
+        with self._lock:
+            try:
+                file_stat = os.stat(self.path)
+            except OSError as err:
+                self.logger.debug('Unable to read {}: {}'.format(self.path,
+                                                                 err))
+                return dict(self.values)
+            file_id = (file_stat.st_dev, file_stat.st_ino)
+            if file_id != self._file_id or file_stat.st_size < self._offset:
+                self._file_id = file_id
+                self._read_backwards(file_stat.st_size)
+            elif file_stat.st_size > self._offset:
+                self._read_forwards(file_stat.st_size)
+            return dict(self.values)
+
+    def _read_forwards(self, size):
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(self._offset)
+            data = self._partial + log_file.read(size - self._offset)
+        self._offset = size
+        # hold back an unfinished last line until the rest is written
+        end = data.rfind('\n') + 1
+        self._partial = data[end:]
+        self._match_lines(data[:end].splitlines())
+
+    def _read_backwards(self, size):
+        found = dict()
+        self._offset = None
+        self._partial = ''
+        # end of a line whose start is in the next block back
+        carry = ''
+        position = size
+        with open(self.path, 'rb') as log_file:
+            while position:
+                block_start = max(position - self.block_size, 0)
+                log_file.seek(block_start)
+                data = log_file.read(position - block_start) + carry
+                position = block_start
+                carry = ''
+                if self._offset is None:
+                    # an unfinished last line is read forwards once complete
+                    end = data.rfind('\n') + 1
+                    if not end and position:
+                        carry = data
+                        continue
+                    self._offset = position + end
+                    data = data[:end]
+                if position:
+                    first_line_end = data.find('\n') + 1
+                    carry, data = data[:first_line_end], data[first_line_end:]
+                    if not first_line_end:
+                        carry, data = data, ''
+                for line in reversed(data.splitlines()):
+                    for key, value in reversed(self._find(line)):
+                        found.setdefault(key, value)
+                if self.keys.issubset(found):
+                    break
+        if self._offset is None:
+            self._offset = 0
+        self.values.update(found)
+
+    def _match_lines(self, lines):
+        for line in lines:
+            for key, value in self._find(line):
+                self.values[key] = value
+
+    def _find(self, line):
+        return [(key.lower(), value.lower()) for key, value in
+                self.pattern.findall(line)]
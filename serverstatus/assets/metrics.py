@@ -0,0 +1,249 @@
+"""
+Prometheus metrics for the server, collected in the background so scrapes
+only ever read the latest snapshot
+"""
+import os
+import time
+import threading
+import logging
+
+import psutil
+
+from serverstatus.assets.background import PeriodicThread, monotonic
+from serverstatus.assets.sysinfo import get_partitions_usage
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Content-Type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METRIC_PREFIX = 'serverstatus_'
+
+# help text of every metric exported, all metrics are gauges
+METRICS = (
+    ('memory_total_bytes', 'Total physical memory'),
+    ('memory_available_bytes', 'Memory available without swapping'),
+    ('load_average', 'System load average over period'),
+    ('cpu_count', 'Number of logical CPUs'),
+    ('uptime_seconds', 'Seconds since the system booted'),
+    ('partition_size_bytes', 'Size of each configured partition'),
+    ('partition_used_bytes', 'Space used on each configured partition'),
+    ('partition_free_bytes', 'Space free on each configured partition'),
+    ('network_transmit_bytes_per_second', 'Rolling network upload rate'),
+    ('network_receive_bytes_per_second', 'Rolling network download rate'),
+    ('ping_rtt_seconds', 'Rolling round trip time statistic to target'),
+    ('ping_loss_ratio', 'Ratio of recent probes to target that were lost'),
+    ('service_up', 'Whether the service is online'),
+    ('collection_duration_seconds', 'Seconds taken collecting the metrics'),
+    ('collection_timestamp_seconds', 'Unix time the metrics were collected'),
+)
+
+
+def format_metrics(samples):
+    """
+    Returns samples in the Prometheus text exposition format, grouped by
+    metric in the order of METRICS
+
+    :param samples: list of [(name, labels, value)] where labels is a dict
+    :return: str
+    """
+    by_name = dict()
+    for name, labels, value in samples:
+        by_name.setdefault(name, list()).append((labels, value))
+    lines = list()
+    for name, help_text in METRICS:
+        if name not in by_name:
+            continue
+        full_name = METRIC_PREFIX + name
+        lines.append('# HELP {} {}'.format(full_name, help_text))
+        lines.append('# TYPE {} gauge'.format(full_name))
+        for labels, value in by_name[name]:
+            lines.append('{}{} {}'.format(full_name, _format_labels(labels),
+                                          repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+def history_values(samples):
+    """
+    Returns the values of samples kept in the history store, keyed by
+    history metric name.  Metrics with a label per target or partition are
+    named "<metric>:<label>".
+
+    :param samples: list of [(name, labels, value)]
+    :return: dict
+    """
+    values = dict()
+    memory = dict()
+    partitions = dict()
+    for name, labels, value in samples:
+        labels = labels or dict()
+        if name == 'load_average' and labels['period'] == '1m':
+            values['load_1m'] = value
+        elif name in ('memory_total_bytes', 'memory_available_bytes'):
+            memory[name] = value
+        elif name in ('network_transmit_bytes_per_second',
+                      'network_receive_bytes_per_second'):
+            values[name] = value
+        elif name == 'ping_rtt_seconds' and labels['stat'] == 'avg':
+            values['ping_rtt_seconds:' + labels['target']] = value
+        elif name == 'ping_loss_ratio':
+            values['ping_loss_ratio:' + labels['target']] = value
+        elif name in ('partition_size_bytes', 'partition_used_bytes'):
+            partitions.setdefault(labels['partition'], dict())[name] = value
+    if memory.get('memory_total_bytes'):
+        values['memory_used_ratio'] = 1 - float(
+            memory['memory_available_bytes']) / memory['memory_total_bytes']
+    for partition, usage in partitions.items():
+        if usage.get('partition_size_bytes'):
+            values['partition_used_ratio:' + partition] = float(
+                usage['partition_used_bytes']) / usage['partition_size_bytes']
+    return values
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape_label(value)) for
+                          name, value in sorted(labels.items())) + '}'
+
+
+def _escape_label(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace(
+        '"', '\\"')
+
+
+class MetricsCollector(PeriodicThread):
+    """
+    Collects metrics from the system and from APIFunctions every interval
+    seconds, and keeps them rendered in the Prometheus text format.  Scrapes
+    return the rendered text, so they never call psutil or an upstream
+    server themselves.  Each collection is also recorded in the history
+    store, if one is given.
+    """
+
+    def __init__(self, api_functions, interval=15, history=None):
+        """
+        :param api_functions: APIFunctions providing the network sampler,
+        latency prober, service status and config
+        :param history: HistoryStore or NoneType
+        """
+        PeriodicThread.__init__(self, interval, name='metrics-collector')
+        self.api_functions = api_functions
+        self.history = history
+        self._samples = None
+        self._rendered = None
+        self._collected_at = None
+        self._collect_lock = threading.Lock()
+
+    def tick(self):
+        with self._collect_lock:
+            # skip the first tick if a scrape has only just collected
+            if self._collected_at is None or \
+                    monotonic() - self._collected_at > self.interval / 2:
+                self._update()
+
+    def render(self):
+        """
+        Returns the latest metrics in the Prometheus text format, collecting
+        them first if nothing has been collected yet
+
+        :return: str
+        """
+        self._ensure_collected()
+        return self._rendered
+
+    def latest_samples(self):
+        """
+        Returns the latest samples as (name, labels, value) tuples, collecting
+        them first if nothing has been collected yet
+
+        :return: list of [tuple]
+        """
+        self._ensure_collected()
+        return self._samples
+
+    def _ensure_collected(self):
+        if self._rendered is None:
+            with self._collect_lock:
+                if self._rendered is None:
+                    self._update()
+        self.ensure_running()
+
+    def _update(self):
+        samples = self.collect()
+        self._samples = samples
+        self._rendered = format_metrics(samples)
+        self._collected_at = monotonic()
+        if self.history is not None:
+            self.history.record(time.time(), history_values(samples))
+
+    def collect(self):
+        """
+        Returns a sample for every metric as (name, labels, value) tuples
+
+        :return: list of [tuple]
+        """
+        start = monotonic()
+        samples = list()
+        for collect_section in (self._system_samples, self._partition_samples,
+                                self._network_samples, self._ping_samples,
+                                self._service_samples):
+            try:
+                samples.extend(collect_section())
+            except Exception as err:
+                self.logger.error('Collecting {} failed: {}'.format(
+                    collect_section.__name__, err))
+        samples.append(('collection_duration_seconds', None,
+                        monotonic() - start))
+        samples.append(('collection_timestamp_seconds', None, time.time()))
+        return samples
+
+    @staticmethod
+    def _system_samples():
+        mem_info = psutil.virtual_memory()
+        samples = [('memory_total_bytes', None, mem_info.total),
+                   ('memory_available_bytes', None, mem_info.available),
+                   ('cpu_count', None, psutil.cpu_count()),
+                   ('uptime_seconds', None, time.time() - psutil.boot_time())]
+        for period, average in zip(('1m', '5m', '15m'), os.getloadavg()):
+            samples.append(('load_average', dict(period=period), average))
+        return samples
+
+    def _partition_samples(self):
+        partitions = self.api_functions.config.get('PARTITIONS', dict())
+        samples = list()
+        prober = self.api_functions._get_mount_prober()
+        for name, usage in get_partitions_usage(partitions,
+                                                prober=prober).items():
+            labels = dict(partition=name, mountpoint=partitions[name])
+            samples.extend([('partition_size_bytes', labels, usage.total),
+                            ('partition_used_bytes', labels, usage.used),
+                            ('partition_free_bytes', labels, usage.free)])
+        return samples
+
+    def _network_samples(self):
+        rates = self.api_functions._get_network_sampler().get_rates()
+        return [('network_transmit_bytes_per_second', None, rates['sent']),
+                ('network_receive_bytes_per_second', None, rates['received'])]
+
+    def _ping_samples(self):
+        samples = list()
+        stats = self.api_functions._get_latency_prober().get_all_stats()
+        for target, target_stats in stats.items():
+            if not target_stats['samples']:
+                continue
+            for stat in ('min', 'avg', 'max', 'mdev', 'jitter'):
+                samples.append(('ping_rtt_seconds',
+                                dict(target=target, stat=stat),
+                                target_stats[stat] / 1000.0))
+            samples.append(('ping_loss_ratio', dict(target=target),
+                            target_stats['loss'] / 100.0))
+        return samples
+
+    def _service_samples(self):
+        return [('service_up', dict(service=service),
+                 int(status.get('text') != 'Offline')) for service, status in
+                self.api_functions.services().items()]
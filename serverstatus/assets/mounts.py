@@ -0,0 +1,353 @@
+"""
+Index of the system's mounts parsed from /proc/self/mountinfo, re-read only
+when the kernel reports the mount table has changed, and disk usage probes
+that can't hang the caller on an unresponsive network mount
+"""
+import os
+import re
+import select
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+
+import psutil
+
+from serverstatus.assets.background import PeriodicThread, monotonic
+
+
+LOGGER = logging.getLogger(__name__)
+
+MOUNTINFO_PATH = '/proc/self/mountinfo'
+
+# device is "major:minor", shared by every mount of the same filesystem.
+# root is the directory of the filesystem mounted, "/" unless a bind mount.
+Mount = namedtuple('Mount', ['mount_id', 'parent_id', 'device', 'root',
+                             'mountpoint', 'fstype', 'source'])
+
+# disk usage of a mount that didn't answer before the deadline
+UNRESPONSIVE = 'unresponsive'
+
+# mountinfo escapes space, tab, newline and backslash as octal
+_OCTAL_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def _unescape(field):
+    return _OCTAL_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), field)
+
+
+def parse_mountinfo(text):
+    """
+    Returns a Mount for every line of /proc/<pid>/mountinfo text, in mount
+    order.  See proc(5) for the format, ex.
+        36 35 98:0 /mnt1 /mnt/parent rw,noatime master:1 - ext3 /dev/root rw
+
+    :type text: str
+    :return: list of [Mount]
+    """
+    mounts = list()
+    for line in text.splitlines():
+        fields = line.split()
+        try:
+            separator = fields.index('-', 6)
+            mounts.append(Mount(
+                mount_id=int(fields[0]), parent_id=int(fields[1]),
+                device=fields[2], root=_unescape(fields[3]),
+                mountpoint=_unescape(fields[4]),
+                fstype=fields[separator + 1],
+                source=_unescape(fields[separator + 2])))
+        except (ValueError, IndexError):
+            LOGGER.warning('Skipping malformed mountinfo line: {}'.format(
+                line))
+    return mounts
+
+
+def _is_block_device(mount):
+    return mount.source.startswith('/dev/')
+
+
+class MountIndex(object):
+    """
+    Parsed mount table, kept until the kernel signals a mount or unmount.
+
+    The kernel flags a change to the mount table by raising POLLPRI and
+    POLLERR on open mountinfo files, so checking for changes is a single
+    poll() without reading or parsing anything.  On systems without
+    mountinfo the table is read from psutil on every call instead.
+    """
+
+    def __init__(self, path=MOUNTINFO_PATH):
+        self.logger = LOGGER
+        self.path = path
+        self._fd = None
+        self._poller = None
+        self._mounts = None
+        self._lock = threading.Lock()
+        try:
+            self._fd = os.open(path, os.O_RDONLY)
+        except OSError as err:
+            self.logger.warning(
+                ('Unable to open {} ({}).  Reading mounts from psutil '
+                 'instead').format(path, err))
+            return
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLPRI | select.POLLERR)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._poller.unregister(self._fd)
+                os.close(self._fd)
+                self._fd = self._poller = None
+
+    def invalidate(self):
+        """
+        Forces the mount table to be read again on next use
+        """
+        with self._lock:
+            self._mounts = None
+
+    def mounts(self):
+        """
+        Returns every mount in mount order
+
+        :return: tuple of (Mount)
+        """
+        if self._fd is None:
+            return tuple(self._read_psutil())
+        with self._lock:
+            if self._mounts is None or self._changed():
+                self._mounts = tuple(parse_mountinfo(self._read()))
+            return self._mounts
+
+    def visible(self):
+        """
+        Returns the mount visible at each mountpoint, the last one mounted
+        there, keyed by mountpoint
+
+        :return: OrderedDict
+        """
+        return OrderedDict((mount.mountpoint, mount) for mount in
+                           self.mounts())
+
+    def block_devices(self):
+        """
+        Returns one visible mount of each block device, preferring a mount
+        of the whole filesystem over bind mounts, so no filesystem is
+        counted twice.  Pseudo filesystems are left out.
+
+        :return: list of [Mount]
+        """
+        by_device = OrderedDict()
+        for mount in self.visible().values():
+            if not _is_block_device(mount):
+                continue
+            kept = by_device.get(mount.device)
+            if kept is None or (kept.root != '/' and mount.root == '/'):
+                by_device[mount.device] = mount
+        return by_device.values()
+
+    def _changed(self):
+        return bool(self._poller.poll(0))
+
+    def _read(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        chunks = list()
+        while True:
+            chunk = os.read(self._fd, 65536)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+
+    @staticmethod
+    def _read_psutil():
+        # psutil doesn't give device numbers, so block devices are keyed by
+        # their path and anything else by where it's mounted
+        for mount_id, partition in enumerate(
+                psutil.disk_partitions(all=True)):
+            device = partition.device
+            if not device.startswith('/dev/'):
+                device = partition.mountpoint
+            yield Mount(mount_id=mount_id, parent_id=None, device=device,
+                        root='/', mountpoint=partition.mountpoint,
+                        fstype=partition.fstype, source=partition.device)
+
+
+class _Probe(object):
+    """
+    read_usage(path) run in its own daemon thread.  A statvfs of a hung NFS
+    or CIFS mount blocks uninterruptibly, so the thread can't be cancelled;
+    it's left to finish whenever the server answers.
+    """
+
+    def __init__(self, read_usage, path):
+        self.read_usage = read_usage
+        self.path = path
+        self._usage = None
+        self._error = None
+        self._done = threading.Event()
+        thread = threading.Thread(target=self._run,
+                                  name='mount-probe {}'.format(path))
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout):
+        """
+        :return: True if the probe finished within timeout seconds
+        """
+        return self._done.wait(timeout)
+
+    def result(self):
+        """
+        :return: sdiskusage
+        :raises: OSError if disk usage couldn't be read
+        """
+        if self._error is not None:
+            raise self._error
+        return self._usage
+
+    def _run(self):
+        try:
+            self._usage = self.read_usage(self.path)
+        except OSError as err:
+            self._error = err
+        finally:
+            self._done.set()
+
+
+class MountProber(PeriodicThread):
+    """
+    Reads disk usage of mounts in isolated daemon threads with a deadline,
+    so a hung network mount costs a request at most timeout seconds.
+
+    Mounts that miss the deadline are quarantined: they're reported
+    UNRESPONSIVE straight away, without being probed on the request path,
+    and are probed again in the background every interval seconds until
+    they answer.  There's never more than one probe in flight per mount, so
+    a mount that stays hung ties up a single thread.
+    """
+
+    def __init__(self, timeout=2, interval=30):
+        PeriodicThread.__init__(self, interval, name='mount-prober')
+        self.timeout = timeout
+        self._probes = dict()
+        self._quarantined = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def quarantined(self):
+        """
+        Mount points currently quarantined
+
+        :return: list of [str]
+        """
+        with self._lock:
+            return sorted(mount.mountpoint for mount in
+                          self._quarantined.values())
+
+    def disk_usage(self, mount):
+        """
+        Returns disk usage of mount, or UNRESPONSIVE if it's quarantined or
+        doesn't answer within timeout seconds
+
+        :type mount: Mount
+        :return: sdiskusage or str
+        :raises: OSError if disk usage couldn't be read
+        """
+        usage = self.disk_usages([mount])[mount.device]
+        if isinstance(usage, OSError):
+            raise usage
+        return usage
+
+    def disk_usages(self, mounts):
+        """
+        Returns disk usage of each distinct device among mounts, keyed by
+        device.  Every mount is probed at once and they share one deadline,
+        so the call takes at most timeout seconds however many are hung.
+        Devices are mapped to UNRESPONSIVE if they're quarantined or don't
+        answer in time, and to the OSError raised if their usage couldn't be
+        read.
+
+        :param mounts: iterable of [Mount]
+        :return: dict
+        """
+        usage = dict()
+        probes = OrderedDict()
+        with self._lock:
+            for mount in mounts:
+                if mount.device in usage or mount.device in probes:
+                    continue
+                if mount.device in self._quarantined:
+                    usage[mount.device] = UNRESPONSIVE
+                else:
+                    probes[mount.device] = (mount, self._probe(mount))
+        deadline = monotonic() + self.timeout
+        missed = list()
+        for device, (mount, probe) in probes.items():
+            if not probe.wait(max(deadline - monotonic(), 0)):
+                self.logger.warning(
+                    '{} did not answer within {}s, quarantining it'.format(
+                        mount.mountpoint, self.timeout))
+                missed.append(mount)
+                usage[device] = UNRESPONSIVE
+                continue
+            try:
+                usage[device] = probe.result()
+            except OSError as err:
+                usage[device] = err
+        if missed:
+            with self._lock:
+                for mount in missed:
+                    self._quarantined[mount.device] = mount
+            self.ensure_running()
+        return usage
+
+    def tick(self):
+        with self._lock:
+            quarantined = self._quarantined.items()
+        for device, mount in quarantined:
+            with self._lock:
+                probe = self._probe(mount)
+            if probe.wait(self.timeout):
+                self.logger.info('{} is responding again'.format(
+                    mount.mountpoint))
+                with self._lock:
+                    self._quarantined.pop(device, None)
+
+    @staticmethod
+    def _read_usage(path):
+        return psutil.disk_usage(path)
+
+    def _probe(self, mount):
+        # reuses the probe in flight for the mount, if any
+        probe = self._probes.get(mount.device)
+        if probe is None or probe.done:
+            probe = _Probe(self._read_usage, mount.mountpoint)
+            self._probes[mount.device] = probe
+        return probe
+
+
+_mount_index = None
+_mount_index_pid = None
+_mount_index_lock = threading.Lock()
+
+
+def get_mount_index():
+    """
+    Returns the mount index shared by the process, opening it on first use.
+    A child process opens its own, since the file offset and change events
+    of an inherited descriptor are shared with the parent.
+
+    :return: MountIndex
+    """
+    global _mount_index, _mount_index_pid
+    with _mount_index_lock:
+        if _mount_index is None or _mount_index_pid != os.getpid():
+            if _mount_index is not None:
+                _mount_index.close()
+            _mount_index = MountIndex()
+            _mount_index_pid = os.getpid()
+        return _mount_index
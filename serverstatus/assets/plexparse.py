@@ -0,0 +1,115 @@
+"""
+Lightweight parsers for Plex Media Server responses.
+
+Both parsers return the same shape xmltodict gives for Plex XML, limited to
+the data the Plex service reads: every attribute of the MediaContainer, and
+only the attributes in PLEX_ATTRIBUTES for each of its direct children.
+Attribute names are prefixed with "@", and children are grouped by tag as a
+single OrderedDict, or a list when there's more than one.
+
+>>> {'MediaContainer': {'@size': '1', 'Video': {'@title': 'Brazil', ...}}}
+"""
+from collections import OrderedDict
+from cStringIO import StringIO
+from xml.etree.cElementTree import iterparse
+
+
+# attributes of media items read by the Plex service
+PLEX_ATTRIBUTES = frozenset([
+    'addedAt', 'duration', 'grandparentThumb', 'grandparentTitle', 'index',
+    'key', 'leafCount', 'librarySectionID', 'librarySectionTitle',
+    'originallyAvailableAt', 'parentIndex', 'parentSummary', 'parentTitle',
+    'rating', 'ratingKey', 'summary', 'thumb', 'title', 'type', 'updatedAt',
+    'viewOffset'])
+
+# XML element name for each media type found in Plex JSON responses
+PLEX_JSON_TYPE_TAGS = dict(movie='Video', episode='Video', clip='Video',
+                           track='Track', photo='Photo', show='Directory',
+                           season='Directory', artist='Directory',
+                           album='Directory')
+
+
+def parse_plex_xml(xml_data, attributes=PLEX_ATTRIBUTES):
+    """
+    Incrementally parses a Plex XML response, keeping only the attributes
+    needed and discarding every element once it's been read, so memory use
+    doesn't grow with the size of the nested media data.
+
+    :type xml_data: str
+    :type attributes: frozenset
+    :return: OrderedDict
+    """
+    container = OrderedDict()
+    children = OrderedDict()
+    root = None
+    depth = 0
+    for event, elem in iterparse(StringIO(xml_data),
+                                 events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                root = elem
+                container.update(('@' + name, value) for name, value in
+                                 elem.attrib.items())
+            elif depth == 2:
+                children.setdefault(elem.tag, list()).append(OrderedDict(
+                    ('@' + name, value) for name, value in elem.attrib.items()
+                    if name in attributes))
+        else:
+            depth -= 1
+            if depth == 1:
+                # drop the child element, and everything under it
+                root.clear()
+    return OrderedDict(MediaContainer=_group_children(container, children))
+
+
+def parse_plex_json(json_data, attributes=PLEX_ATTRIBUTES):
+    """
+    Converts a decoded Plex JSON response into the xmltodict shape the Plex
+    service reads.  Handles both the current format, with children listed
+    under "Metadata"/"Directory"/etc. keys, and the older format with
+    children in "_children" tagged by "_elementType".
+
+    :type json_data: dict
+    :type attributes: frozenset
+    :return: OrderedDict
+    """
+    if 'MediaContainer' in json_data:
+        json_data = json_data['MediaContainer']
+    container = OrderedDict()
+    children = OrderedDict()
+    for name, value in json_data.items():
+        if name == '_children':
+            for child in value:
+                tag = child.get('_elementType', 'Directory')
+                children.setdefault(tag, list()).append(
+                    _json_attributes(child, attributes))
+        elif isinstance(value, list):
+            for child in value:
+                if not isinstance(child, dict):
+                    continue
+                tag = PLEX_JSON_TYPE_TAGS.get(child.get('type'), name)
+                children.setdefault(tag, list()).append(
+                    _json_attributes(child, attributes))
+        elif not isinstance(value, dict) and not name.startswith('_'):
+            container['@' + name] = _json_value(value)
+    return OrderedDict(MediaContainer=_group_children(container, children))
+
+
+def _json_attributes(item, attributes):
+    return OrderedDict(('@' + name, _json_value(value)) for name, value in
+                       item.items() if name in attributes and
+                       not isinstance(value, (dict, list)))
+
+
+def _json_value(value):
+    # XML attributes are always text, match what the XML parsers return
+    if isinstance(value, bool):
+        return u'1' if value else u'0'
+    return unicode(value)
+
+
+def _group_children(container, children):
+    for tag, items in children.items():
+        container[tag] = items[0] if len(items) == 1 else items
+    return container
@@ -1,8 +1,9 @@
 import os
+import hashlib
 import logging
-import urllib2
-import urlparse
-from collections import OrderedDict
+import threading
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
 from operator import itemgetter
 from time import localtime, strftime
 import datetime
@@ -10,16 +11,35 @@ from cStringIO import StringIO
 
 from PIL import Image, ImageOps
 import libsonic
+import requests
 import xmltodict
 
 from serverstatus import app
+from serverstatus.assets.background import WorkQueue
+from serverstatus.assets.httpclient import get_http_client
+from serverstatus.assets.imagecache import get_image_cache
+from serverstatus.assets.logtail import LogTail
+from serverstatus.assets.plexparse import parse_plex_json, parse_plex_xml
 import serverstatus.assets.exceptions as exceptions
 
 
 LOGGER = logging.getLogger(__name__)
 
+# cover art served by /img: etag is None for images browsers mustn't cache,
+# last_modified is a timestamp or None, and load returns the image data.
+# path is set for images cached on disk, and upstream for images streamed
+# from the media server, as a function taking the request method and headers
+# to forward and returning a streamed requests.Response
+CoverArt = namedtuple('CoverArt', ['etag', 'last_modified', 'load', 'path',
+                                   'upstream'])
+CoverArt.__new__.__defaults__ = (None, None)
+
 
 class Service(object):
+    # True for servers reached over the network, whose being offline counts
+    # against their circuit breaker
+    remote = False
+
     def __init__(self, service_config):
         assert isinstance(service_config, dict)
         self.logger = LOGGER
@@ -32,6 +52,9 @@ class Service(object):
         self._server_full_url = None
         self._resolved_status_mapping = dict()
         self._temp_img_dir = app.config.get('TEMP_IMAGES', '/tmp')
+        self._image_cache = get_image_cache(
+            self._temp_img_dir,
+            app.config.get('IMAGE_CACHE', dict()).get('max_bytes'))
 
     @property
     def service_name(self):
@@ -42,6 +65,20 @@ class Service(object):
         self._resolved_status_mapping = self._map_connection_status()
         return self._resolved_status_mapping
 
+    def online_status_mapping(self):
+        """
+        Returns status_mapping, raising ServiceOfflineError instead if a
+        remote server is offline, so callers can count it as a failure
+
+        :return: dict
+        :raises: exceptions.ServiceOfflineError
+        """
+        mapping = self.status_mapping
+        if self.remote and not self._connect_status:
+            raise exceptions.ServiceOfflineError(
+                '{} is offline'.format(self._service_name))
+        return mapping
+
     @property
     def connection_status(self):
         self._connect_status = self._test_server_connection()
@@ -78,9 +115,28 @@ class Service(object):
             pass
         return output
 
+    @classmethod
+    def offline_status_mapping(cls, service_name, external_url=None):
+        """
+        Returns the offline status mapping for a service, without contacting
+        it, for services that couldn't be loaded or are known to be down
+
+        :type service_name: str
+        :type external_url: str or NoneType
+        :return: dict
+        """
+        output = cls._status_mappings_dict()['False']
+        output['title'] = cls._service_title(service_name)
+        if external_url:
+            output['external_url'] = external_url
+        return {service_name: output}
+
     def _add_service_name_to_status_mapping(self):
+        return self._service_title(self._service_name)
+
+    @staticmethod
+    def _service_title(service_name):
         delim = '-'
-        service_name = self._service_name
         if delim in service_name:
             title = service_name.split(delim)
             title = ' '.join([w.title() for w in title])
@@ -143,6 +199,62 @@ class Service(object):
         base_path = 'img/'
         return ''.join([base_path, service_name, '?'])
 
+    @staticmethod
+    def _cover_art_etag(name, digest):
+        """
+        Returns strong ETag for cover art from its name (ID and size) and a
+        hash of its content
+
+        >>> 'subsonic-28102-145-3f786850e387550f'
+
+        :type name: str
+        :type digest: str
+        :return: str
+        """
+        return '{}-{}'.format(name, digest[:16])
+
+    def _cached_cover_art(self, key, name, fetch):
+        """
+        Returns CoverArt for the image cached under key, fetching and caching
+        the image first if it isn't cached yet.  The ETag is always that of
+        the cached image, so a client holding a copy of an image that has
+        since been replaced is sent the new one.
+
+        :type key: str
+        :param name: cover ID and size used in the ETag
+        :type name: str
+        :param fetch: function returning image data as a str
+        :return: CoverArt
+        """
+        entry = self._image_cache.get(key)
+        if entry is None:
+            return self._fetch_cover_art(key, name, fetch)
+        return CoverArt(etag=self._cover_art_etag(name, entry.digest),
+                        last_modified=entry.mtime,
+                        load=lambda: self._image_cache.open(key) or fetch(),
+                        path=entry.path)
+
+    def _fetch_cover_art(self, key, name, fetch):
+        """
+        Fetches an image and caches it under key
+
+        :return: CoverArt
+        """
+        img_data = fetch()
+        try:
+            entry = self._image_cache.put(key, img_data)
+        except (OSError, IOError) as err:
+            self.logger.error(
+                'Failed to write cover art file for {}: {}'.format(key, err))
+            return CoverArt(
+                etag=self._cover_art_etag(
+                    name, hashlib.sha1(img_data).hexdigest()),
+                last_modified=None, load=lambda: img_data)
+        return CoverArt(etag=self._cover_art_etag(name, entry.digest),
+                        last_modified=entry.mtime,
+                        load=lambda: self._image_cache.open(key) or img_data,
+                        path=entry.path)
+
     def _test_file_path(self, file_path_key):
         # //TODO Needed
         output = None
@@ -157,6 +269,8 @@ class Service(object):
 
 
 class SubSonic(Service):
+    remote = True
+
     def __init__(self, server_info):
         Service.__init__(self, server_info)
         self._service_name = 'subsonic'
@@ -206,6 +320,25 @@ class SubSonic(Service):
                 size = 2000
             return self.conn.getCoverArt(aid=cover_art_id, size=size)
 
+    def cover_art(self, cover_art_id, size=None):
+        """
+        Returns CoverArt for a Subsonic cover.  Each size is cached on disk,
+        so it's only fetched from Subsonic once.
+
+        :type cover_art_id: int
+        :type size: int or NoneType
+        :return: CoverArt
+        """
+        assert isinstance(cover_art_id, int)
+        if any([size is None, size <= 0, type(size) is not int]):
+            size = None
+        elif size > 2000:
+            size = 2000
+        name = 'subsonic-{}-{}'.format(cover_art_id, size or 'full')
+        key = 'subsonic/cover{}_{}'.format(cover_art_id, size or 'full')
+        return self._cached_cover_art(
+            key, name, lambda: self.get_cover_art(cover_art_id, size).read())
+
     def now_playing(self):
         """
         Returns now playing entries from Subsonic server in list format.  Each
@@ -242,6 +375,8 @@ class SubSonic(Service):
     def set_output_directory(self, directory):
         # //TODO remove extraneous code
         self._temp_img_dir = directory
+        self._image_cache = get_image_cache(directory,
+                                            self._image_cache.max_bytes)
         return self._temp_img_dir == directory
 
     def _test_server_connection(self):
@@ -249,18 +384,17 @@ class SubSonic(Service):
         Test if we're able to connect to Subsonic server.
 
         :return: bool - True if able to connect, false otherwise
-        :raise: exceptions.SubsonicConnectionError
         """
-        connection_status = False
         try:
             connection_status = self.conn.ping()
-            assert connection_status
-        except AssertionError:
-            err = 'Unable to reach Subsonic server'
-            self.logger.error(err)
-            # raise exceptions.SubsonicConnectionError(err)
-        finally:
-            return connection_status
+        except Exception as err:
+            # libsonic raises urllib2 and socket errors as they are
+            self.logger.error(
+                'Unable to reach Subsonic server: {}'.format(err))
+            return False
+        if not connection_status:
+            self.logger.error('Unable to reach Subsonic server')
+        return connection_status
 
     def _create_cover_art_file(self, cover_art_id, size=None):
         """
@@ -272,26 +406,18 @@ class SubSonic(Service):
         # set default image size in pixels
         if size is None:
             size = 600
-        img_data = self.conn.getCoverArt(aid=cover_art_id, size=size)
-        cover_dir = self._temp_img_dir  # temp storage for created image files
-        filename = 'cover'
-        ext = '.jpg'
-        short_filepath = filename + str(cover_art_id) + '_' + str(size) + ext
-        full_filepath = os.path.join(cover_dir, short_filepath)
-        if not os.path.exists(cover_dir):
-            # check if filepath exists.  Attempt to create if it doesn't
+        key = 'subsonic/cover{}_{}'.format(cover_art_id, size)
+        entry = self._image_cache.get(key)
+        if entry is None:
+            img_data = self.conn.getCoverArt(aid=cover_art_id, size=size)
             try:
-                os.mkdir(cover_dir)
-            except IOError:
+                entry = self._image_cache.put(key, img_data.read())
+            except (OSError, IOError) as err:
                 self.logger.error(
-                    'Failed to create cover art directory: {}'.format(
-                        full_filepath))
+                    'Failed to write cover art file for {}: {}'.format(
+                        key, err))
                 return
-        if not os.path.isfile(full_filepath):
-            self.logger.info('Write cover art file: {}'.format(full_filepath))
-            with open(full_filepath, 'wb') as img_file:
-                img_file.write(img_data.read())
-        return full_filepath
+        return entry.path
 
     def _get_entry_info(self, entry, min_size=None, max_size=None):
         """
@@ -347,23 +473,26 @@ class SubSonic(Service):
 
 
 class CheckCrashPlan(Service):
+    # status values read from the CrashPlan log
+    status_keys = ('scanning', 'backupenabled')
+    status_pattern = r'\b(scanning|backupenabled)\s*=\s*(\w+)'
+
     def __init__(self, server_info):
         Service.__init__(self, server_info)
         self._service_name = 'backups'
         self.file_path = self._test_file_path('logfile_path')
+        self._log_tail = LogTail(self.file_path, self.status_pattern,
+                                 self.status_keys) if self.file_path else None
         self._connect_status = self._test_server_connection()
         self._resolved_status_mapping = self._map_connection_status()
 
     def _test_server_connection(self):
-        items_to_keep = ['scanning', 'backupenabled']
-        with open(self.file_path, 'r') as log_file:
-            items = [line.lower().split() for line in log_file.readlines()
-                     for x in items_to_keep if x in line.lower()]
-        # remove "=" from list
-        for item in items:
-            item.remove('=')
-        items_values = [True if item[1] == 'true' else False for item in items]
-        if all(items_values):
+        if self._log_tail is None:
+            return False
+        status_values = self._log_tail.update()
+        items_values = [status_values.get(key) == 'true' for key in
+                        self.status_keys if key in status_values]
+        if items_values and all(items_values):
             return 'BackupServerActive'
         elif any(items_values):
             return 'Waiting'
@@ -397,6 +526,13 @@ class Plex(Service):
     Provides media metadata information from Plex
     """
     url_scheme = 'http://'
+    remote = True
+    # file extension and size in pixels of each cover art variant
+    cover_art_variants = (('.jpg', (568, 852)), ('.thumbnail', (144, 214)))
+    # in memory placeholder JPEGs keyed by size, served until cover art exists
+    _placeholder_images = dict()
+    # number of TV seasons to keep episode metadata for
+    season_metadata_cache_size = 128
 
     def __init__(self, server_config):
         Service.__init__(self, server_config)
@@ -404,6 +540,14 @@ class Plex(Service):
         self.service_config = server_config
         self._service_name = 'plex'
         self.server_internal_url_and_port = self._get_full_url_and_port
+        # one keep-alive connection pool per Plex server
+        self._max_connections = server_config.get('max_connections', 4)
+        self._http = get_http_client(
+            self.server_internal_url_and_port,
+            max_connections=self._max_connections,
+            connect_timeout=server_config.get('connect_timeout', 3),
+            read_timeout=server_config.get('read_timeout', 10),
+            pool_timeout=server_config.get('pool_timeout', 10))
         try:
             self._server_full_url = server_config['external_url']
         except KeyError as err:
@@ -417,6 +561,24 @@ class Plex(Service):
         self._transcodes = 0
         self._cover_mapping = dict()
         self._img_base_url = self._build_external_img_path(self._service_name)
+        self._cover_art_queue = WorkQueue(self._save_cover_art,
+                                          name='plex-cover-art')
+        # ratingKey: (updatedAt, MediaContainer) for recently added seasons
+        self._season_metadata = OrderedDict()
+        self._season_metadata_lock = threading.Lock()
+        self._metadata_pool = None
+        self._metadata_pool_lock = threading.Lock()
+
+    def close(self):
+        """
+        Closes the thread pool prefetching season metadata, waiting for
+        fetches already running to finish
+        """
+        with self._metadata_pool_lock:
+            pool, self._metadata_pool = self._metadata_pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     def recently_added(self, num_results=None):
         """
@@ -430,6 +592,9 @@ class Plex(Service):
             videos = sorted(videos, key=itemgetter('@addedAt'), reverse=True)
             # trim the list to the number of results we want
             videos_trimmed = videos[:num_results]
+            self._prefetch_season_metadata(
+                [video for video in videos_trimmed if
+                 video['@type'] == 'season'])
             return [self._get_video_data(video) for video in videos_trimmed]
 
         if not self._connect_status:
@@ -524,31 +689,71 @@ class Plex(Service):
         :return: binary
         :raises: exceptions.PlexImageError
         """
+        return self.cover_art(plex_id, thumbnail, local).load()
 
-        def open_image(ext):
-            try:
-                return open(os.path.join(self._temp_img_dir, plex_id + ext),
-                            'rb')
-            except IOError as img_err:
-                raise exceptions.PlexImageError(img_err)
-
-        thumbnail = thumbnail is not None
-        local = local is not None
-        if self._cover_mapping is None:
-            # if _cover_mapping is empty we need to initialize Now Playing
-            self.now_playing()
-        if thumbnail:
-            resp = open_image('.thumbnail')
-        elif local:
-            resp = open_image('.jpg')
-        else:
+    def cover_art(self, plex_id, thumbnail=None, local=None):
+        """
+        Returns CoverArt for a Plex item, with the same arguments as
+        get_cover_image.  Images served from Plex are identified by their
+        Plex path, which changes whenever the artwork is updated, so they're
+        never fetched only to compute an ETag.  Placeholders served while the
+        cover art is being written aren't cacheable.  Items not listed by
+        this process, ex. since a restart, raise PlexImageError.
+
+        :type plex_id: str
+        :type thumbnail: bool or NoneType
+        :type local: bool or NoneType
+        :return: CoverArt
+        :raises: exceptions.PlexImageError
+        """
+
+        def fetch_image(method='GET', headers=None):
             try:
-                resp = urllib2.urlopen(
-                    urlparse.urljoin(self.server_internal_url_and_port,
-                                     self._cover_mapping[plex_id]))
-            except (TypeError, urllib2.HTTPError) as err:
+                return self._http.request(method, cover_loc, stream=True,
+                                          headers=headers)
+            except requests.RequestException as err:
                 raise exceptions.PlexImageError(err)
-        return resp
+
+        cover_loc = (self._cover_mapping or dict()).get(plex_id)
+        if thumbnail is None and local is None:
+            if cover_loc is None:
+                raise exceptions.PlexImageError(
+                    'No cover art found for {}'.format(plex_id))
+            return CoverArt(
+                etag=self._cover_art_etag('plex-{}'.format(plex_id),
+                                          hashlib.sha1(cover_loc).hexdigest()),
+                last_modified=None,
+                load=lambda: fetch_image().iter_content(65536),
+                upstream=fetch_image)
+        ext = '.thumbnail' if thumbnail is not None else '.jpg'
+        key = self._cover_art_key(plex_id, ext)
+        placeholder_size = dict(self.cover_art_variants)[ext]
+        entry = self._image_cache.get(key)
+        if entry is None:
+            if cover_loc is None:
+                raise exceptions.PlexImageError(
+                    'No cover art found for {}'.format(plex_id))
+            # cover art hasn't been written by the queue yet
+            self._queue_cover_art(cover_loc)
+            return CoverArt(etag=None, last_modified=None,
+                            load=lambda: self._get_placeholder_image(
+                                placeholder_size))
+        return CoverArt(
+            etag=self._cover_art_etag('plex-{}{}'.format(plex_id, ext),
+                                      entry.digest),
+            last_modified=entry.mtime,
+            load=lambda: self._image_cache.open(key) or
+            self._get_placeholder_image(placeholder_size),
+            path=entry.path)
+
+    @property
+    def http_stats(self):
+        """
+        Returns connections opened and reused by the Plex connection pool
+
+        :return: dict
+        """
+        return self._http.stats
 
     @property
     def transcodes(self):
@@ -668,45 +873,66 @@ class Plex(Service):
                 default=internal_url, config_val='internal_url')
         return ''.join([Plex.url_scheme, internal_url, ':', port])
 
-    def _get_plex_api_data(self, api_call, api_suffix=None):
+    def _get_plex_api_response(self, api_call, api_suffix=None, headers=None):
         """
-        Call plex api, and return XML data
-
-        For /status/sessions:
-        >>> '<MediaContainer size="0"></MediaContainer>'
+        Call plex api, and return the response
 
         :param api_call:
-        :return: str
+        :return: requests.Response
         :raises: exceptions.PlexConnectionError
         """
         if api_suffix is None:
             # no extra api call for this
             api_suffix = ''
+        full_api_call = ''.join(
+            [self._get_api_url_suffix(api_call), api_suffix])
         try:
-            full_api_call = ''.join(
-                [self._get_api_url_suffix(api_call), api_suffix])
-            resp = urllib2.urlopen(
-                urlparse.urljoin(self.server_internal_url_and_port,
-                                 full_api_call))
-            output = resp.read()
-        except urllib2.URLError as err:
+            return self._http.get(full_api_call, headers=headers)
+        except requests.RequestException as err:
             self.logger.error('Error connecting to Plex')
             raise exceptions.PlexConnectionError(err)
-        else:
-            resp.close()
-        return output
+
+    def _get_plex_api_data(self, api_call, api_suffix=None):
+        """
+        Call plex api, and return XML data
+
+        For /status/sessions:
+        >>> '<MediaContainer size="0"></MediaContainer>'
+
+        :param api_call:
+        :return: str
+        :raises: exceptions.PlexConnectionError
+        """
+        return self._get_plex_api_response(api_call, api_suffix).content
 
     def _get_xml_convert_to_json(self, api_key, api_suffix=None):
         """
-        Gets Plex data based on api key and converts Plex XML response to JSON
-        format
+        Gets Plex data based on api key in the dict format xmltodict returns
+        for Plex XML, limited to the attributes the Plex class reads.
+
+        Asks Plex for JSON unless json_api is False in the config.  XML
+        responses, from servers that only speak XML, are parsed incrementally
+        with iterparse instead of building the whole document tree.
 
         :type api_key: str
         :type api_suffix: unknown or str
-        :return:
+        :return: OrderedDict
+        :raises: exceptions.PlexAPIDataError
         """
-        xml_data = self._get_plex_api_data(api_key, api_suffix)
-        return self._convert_xml_to_json(xml_data)
+        headers = None
+        if self.service_config.get('json_api', True):
+            headers = {'Accept': 'application/json'}
+        resp = self._get_plex_api_response(api_key, api_suffix, headers)
+        try:
+            if 'json' in resp.headers.get('content-type', ''):
+                return parse_plex_json(resp.json())
+            return parse_plex_xml(resp.content)
+        except (ValueError, SyntaxError) as err:
+            # malformed JSON raises ValueError, malformed XML a SyntaxError
+            msg = 'Plex returned data that could not be parsed: {}'.format(
+                err)
+            self.logger.error(msg)
+            raise exceptions.PlexAPIDataError(msg)
 
     def _get_video_data(self, video, get_type=None):
         is_now_playing = get_type == 'nowplaying'
@@ -747,8 +973,7 @@ class Plex(Service):
                 # add common elements to video dict
         else:
             plex_path_to_art = video['@thumb']
-        self._save_cover_art(self.server_internal_url_and_port +
-                             plex_path_to_art)
+        self._queue_cover_art(plex_path_to_art)
         arturlmapped_value = os.path.basename(plex_path_to_art)
         video_data.update(type=vidtype,
                           art_external_url=''.join([self._img_base_url,
@@ -761,52 +986,85 @@ class Plex(Service):
         video_data['rating'] = float(video.get('@rating', 0))
         return video_data
 
+    @staticmethod
+    def _cover_art_key(plex_id, ext):
+        """
+        Returns image cache key for a cover art variant
+
+        >>> 'plex/1412345678.thumbnail'
+
+        :type plex_id: str
+        :type ext: str
+        :return: str
+        """
+        return ''.join(['plex/', plex_id, ext])
+
+    def _cover_art_keys(self, cover_loc):
+        """
+        Returns image cache key and size of each cover art variant for the
+        cover art at Plex path cover_loc as (key, size) tuples
+
+        :type cover_loc: str
+        :return: list of [tuple]
+        """
+        plex_id = str(cover_loc.split('/')[-1])
+        return [(self._cover_art_key(plex_id, ext), size) for ext, size in
+                self.cover_art_variants]
+
+    def _queue_cover_art(self, cover_loc):
+        """
+        Queues cover art at Plex path cover_loc to be downloaded and resized
+        in the background, unless every variant is already cached
+
+        :type cover_loc: str
+        :return: bool - True if cover art was queued
+        """
+        if all(self._image_cache.contains(key) for key, _ in
+               self._cover_art_keys(cover_loc)):
+            return False
+        return self._cover_art_queue.put(cover_loc)
+
     def _save_cover_art(self, cover_loc):
+        missing = [(key, size) for key, size in
+                   self._cover_art_keys(cover_loc)
+                   if not self._image_cache.contains(key)]
+        if not missing:
+            # every variant is already cached, skip downloading the image
+            self.logger.debug('Image files already cached for: {}'.
+                              format(cover_loc))
+            return
         # retrieve image data from Plex server metadata
-        img_data = StringIO(urllib2.urlopen(
-            urlparse.urljoin(self.server_internal_url_and_port,
-                             cover_loc)).read())
-        # check if temp directory exists, if not attempt to create directory
-        if not os.path.exists(self._temp_img_dir):
-            try:
-                os.mkdir(self._temp_img_dir)
-                self.logger.info('Creating temporary image directory {}'.
-                                 format(self._temp_img_dir))
-            except OSError as err:
-                self.logger.error(('Failure creating temporary image directory'
-                                   ' {}.\nError message {}').format(
-                    self._temp_img_dir, err))
-                raise
+        img_data = StringIO(self._http.get(cover_loc).content)
         img = Image.open(img_data)
-        exts = ('.jpg', '.thumbnail')
-        sizes = [(568, 852), (144, 214)]
-        # create filepaths to temp images in temp directory
-        img_filepaths = [os.path.join(self._temp_img_dir, ''.join(
-            [str(cover_loc.split('/')[-1]), ext])) for ext in exts]
-        # index 0 = size tuple
-        # index 1 = path to file
-        size_and_fps = zip(sizes, img_filepaths)
-        for img_file in size_and_fps:
+        for key, size in missing:
             # preserve original file for multiple manipulations
             temp_img = img.copy()
-            size = img_file[0]
-            filepath = img_file[1]
-            if not os.path.exists(filepath):
-                # create plex cover art file if file does not exist
-                try:
-                    temp_img = ImageOps.fit(image=temp_img, size=size,
-                                            method=Image.ANTIALIAS)
-                    temp_img.save(filepath, "JPEG")
-                    self.logger.info(
-                        'Write image file: {}'.format(filepath))
-                except IOError as pil_err:
-                    self.logger.error(
-                        'Image file write failure at {}.  Reason: {}'.
-                        format(filepath, pil_err))
-            else:
-                self.logger.debug('Image file already exists at: {}'.
-                                  format(filepath))
-        return img_filepaths[0]
+            # create plex cover art file since it isn't cached
+            try:
+                temp_img = ImageOps.fit(image=temp_img, size=size,
+                                        method=Image.ANTIALIAS)
+                output = StringIO()
+                temp_img.save(output, "JPEG")
+                self._image_cache.put(key, output.getvalue())
+            except (IOError, OSError) as pil_err:
+                self.logger.error(
+                    'Image file write failure for {}.  Reason: {}'.
+                    format(key, pil_err))
+
+    @classmethod
+    def _get_placeholder_image(cls, size):
+        """
+        Returns a blank JPEG of size (width, height) in pixels to stand in for
+        cover art that hasn't been processed yet
+
+        :type size: tuple
+        :return: str
+        """
+        if size not in cls._placeholder_images:
+            img_data = StringIO()
+            Image.new('RGB', size, (34, 34, 34)).save(img_data, 'JPEG')
+            cls._placeholder_images[size] = img_data.getvalue()
+        return cls._placeholder_images[size]
 
     def _get_tv_show_data(self, video, get_type=None):
         is_now_playing = get_type == 'nowplaying'
@@ -825,10 +1083,7 @@ class Plex(Service):
         if isinstance(video_data['season'], int):
             video_data['season'] = '{0:02d}'.format(video_data['season'])
         if not is_now_playing:
-            json_show_data = self._get_xml_convert_to_json('serverinfo',
-                                                           video['@key'].
-                                                           lstrip('/'))
-            video = json_show_data['MediaContainer']
+            video = self._get_season_metadata(video)
             video_data.update(rating=video.get('@grandparentContentRating', ''),
                               studio=video['@grandparentStudio'])
             try:
@@ -852,3 +1107,75 @@ class Plex(Service):
         if video['@summary'] != '':
             video_data['summary'] = video['@summary']
         return video_data
+
+    def _get_cached_season_metadata(self, season):
+        """
+        Returns cached episode metadata for season, None if it's not cached
+        or Plex has updated the season since it was cached
+
+        :type season: OrderedDict
+        :return: OrderedDict or NoneType
+        """
+        updated_at = season.get('@updatedAt')
+        if updated_at is None:
+            return None
+        rating_key = season.get('@ratingKey', season['@key'])
+        with self._season_metadata_lock:
+            cached = self._season_metadata.pop(rating_key, None)
+            if cached is None or cached[0] != updated_at:
+                return None
+            # move to the end as most recently used
+            self._season_metadata[rating_key] = cached
+        return cached[1]
+
+    def _get_season_metadata(self, season):
+        """
+        Returns the MediaContainer of episodes in a recently added season.
+        Cached by the season's ratingKey and updatedAt, so an unchanged season
+        costs no requests to Plex.
+
+        :type season: OrderedDict
+        :return: OrderedDict
+        :raises: exceptions.PlexConnectionError
+        """
+        container = self._get_cached_season_metadata(season)
+        if container is not None:
+            return container
+        json_show_data = self._get_xml_convert_to_json(
+            'serverinfo', season['@key'].lstrip('/'))
+        container = json_show_data['MediaContainer']
+        with self._season_metadata_lock:
+            self._season_metadata[season.get('@ratingKey', season['@key'])] = (
+                season.get('@updatedAt'), container)
+            while len(self._season_metadata) > self.season_metadata_cache_size:
+                self._season_metadata.popitem(last=False)
+        return container
+
+    def _prefetch_season_metadata(self, seasons):
+        """
+        Fetches metadata of seasons missing from the season cache
+        concurrently over the connection pool.  Plex has no endpoint to list
+        the children of several items at once, so this is as close to a
+        batched lookup as the API allows.  Failures are left for
+        _get_season_metadata to raise.
+
+        :type seasons: list of [OrderedDict]
+        """
+
+        def fetch(season):
+            try:
+                self._get_season_metadata(season)
+            except (exceptions.PlexConnectionError, KeyError) as err:
+                self.logger.warning(
+                    'Prefetching season metadata failed: {}'.format(err))
+
+        misses = [season for season in seasons if
+                  self._get_cached_season_metadata(season) is None]
+        if len(misses) < 2:
+            return
+        with self._metadata_pool_lock:
+            if self._metadata_pool is None:
+                self._metadata_pool = ThreadPool(
+                    processes=self._max_connections)
+            pool = self._metadata_pool
+        pool.map(fetch, misses)
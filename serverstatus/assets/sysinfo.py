@@ -1,14 +1,19 @@
 import datetime
-import subprocess
+import errno
 import os
-import time
+import socket
+import struct
+import threading
 import urllib2
-from collections import OrderedDict
-from math import floor, log
+from collections import OrderedDict, deque
+from math import floor, log, sqrt
 import logging
 
 import psutil
 
+from serverstatus.assets.background import PeriodicThread, monotonic
+from serverstatus.assets.mounts import UNRESPONSIVE, get_mount_index
+
 
 logger = logging.getLogger(__name__)
 
@@ -50,39 +55,195 @@ def get_wan_ip(site='http://myip.dnsdynamic.org/'):
     return urllib2.urlopen(site).read()
 
 
-def get_partitions(partitions=None):
-    if partitions is None:
-        partitions = psutil.disk_partitions(all=True)
-    return {p[1]: psutil.disk_usage(p[1]) for p in partitions if p[0] != 0}
+def tcp_ping(host, port=53, timeout=2):
+    """
+    Returns the time in milliseconds to complete a TCP handshake with host,
+    or None if the connection failed or timed out.  Needs no privileges or
+    subprocess.
+
+    :param host: str
+    :param port: int
+    :param timeout: float
+    :return: float or NoneType
+    """
+    start = monotonic()
+    try:
+        conn = socket.create_connection((host, port), timeout)
+    except (socket.error, socket.timeout):
+        return None
+    rtt = (monotonic() - start) * 1000.0
+    conn.close()
+    return rtt
+
+
+def _icmp_checksum(packet):
+    if len(packet) % 2:
+        packet += '\0'
+    total = sum(struct.unpack('!{}H'.format(len(packet) // 2), packet))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
 
 
-def get_ping(host="8.8.8.8", kind='avg', num=4):
-    # solution from http://stackoverflow.com/questions/316866/ping-a-site-in-python
-    """
-    returns ping time to selected site
-        host: site, ip address to ping
-        kind:
-        num: number of pings to host
+# errors creating an ICMP datagram socket meaning the system doesn't allow
+# them, rather than a transient failure
+_ICMP_UNAVAILABLE = (errno.EPERM, errno.EACCES, errno.EPROTONOSUPPORT)
+
 
-    :param host: string
-    :param kind: string
-    :param num: int
-    :return: float
+def icmp_ping(host, timeout=2, sequence=0):
     """
-    assert kind in ['max', 'avg', 'mdev', 'min']
-    assert type(int(num)) is int
-    ping = subprocess.Popen(["ping", "-c", str(num), host], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, error = ping.communicate()
-    out = out.split('\n')
+    Returns the round trip time in milliseconds of an ICMP echo request sent
+    over an unprivileged ICMP datagram socket, or None if no reply arrived
+    before the timeout or the request couldn't be sent, ex. while the
+    network is unreachable.
+
+    Datagram ICMP sockets are only allowed for groups listed in the
+    net.ipv4.ping_group_range sysctl; socket.error is raised otherwise.
+
+    :param host: str
+    :param timeout: float
+    :param sequence: int
+    :return: float or NoneType
+    :raises: socket.error
+    """
+    echo_request, echo_reply = 8, 0
+    sequence &= 0xffff
+    payload = 'server-status-ping'
+    header = struct.pack('!BBHHH', echo_request, 0, 0, 0, sequence)
+    checksum = _icmp_checksum(header + payload)
+    packet = struct.pack('!BBHHH', echo_request, 0, checksum, 0,
+                         sequence) + payload
     try:
-        out = [x for x in out if x.startswith('rtt')][0]
-        out_mapped = zip(out.split()[1].split('/'), out.split()[3].split('/'))
-        out_mapped = {x[0]: x[1] for x in out_mapped}
-        out = out_mapped[kind]
-    except IndexError:
-        # most likely no ping returned, system offline
-        out = 0
-    return float(out)
+        conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_ICMP)
+    except socket.error as err:
+        if err.errno in _ICMP_UNAVAILABLE:
+            raise
+        logger.warning('Unable to open ICMP socket: {}'.format(err))
+        return None
+    try:
+        address = socket.gethostbyname(host)
+        start = monotonic()
+        deadline = start + timeout
+        conn.sendto(packet, (address, 0))
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            conn.settimeout(remaining)
+            try:
+                data = conn.recv(1024)
+            except socket.timeout:
+                return None
+            # the kernel strips the IP header from datagram ICMP replies
+            reply_type, _, _, _, reply_sequence = struct.unpack('!BBHHH',
+                                                                data[:8])
+            if reply_type == echo_reply and reply_sequence == sequence:
+                return (monotonic() - start) * 1000.0
+    except socket.error:
+        # includes gaierror, unresolvable hosts are lost probes as well
+        return None
+    finally:
+        conn.close()
+
+
+def summarize_latency(samples):
+    """
+    Returns ping style statistics for a list of round trip times in
+    milliseconds, where None marks a lost probe, ex.
+        {'min': 11.2, 'avg': 13.9, 'max': 18.4, 'mdev': 2.1, 'jitter': 1.7,
+         'loss': 0.0, 'samples': 30}
+    jitter is the mean difference between consecutive round trip times, and
+    loss is a percentage of the samples
+
+    :param samples: list
+    :return: dict
+    """
+    rtts = [rtt for rtt in samples if rtt is not None]
+    output = dict(min=0.0, avg=0.0, max=0.0, mdev=0.0, jitter=0.0,
+                  loss=0.0, samples=len(samples))
+    if samples:
+        output['loss'] = round(
+            (len(samples) - len(rtts)) * 100.0 / len(samples), 1)
+    if not rtts:
+        return output
+    avg = sum(rtts) / len(rtts)
+    variance = sum(rtt ** 2 for rtt in rtts) / len(rtts) - avg ** 2
+    output.update(min=min(rtts), avg=avg, max=max(rtts),
+                  mdev=sqrt(max(variance, 0)))
+    if len(rtts) > 1:
+        output['jitter'] = sum(abs(current - previous) for previous, current
+                               in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+    return output
+
+
+class LatencyProber(PeriodicThread):
+    """
+    Probes each target every interval seconds in the background and keeps
+    the last window round trip times per target, so latency lookups don't
+    have to wait on the network.
+
+    mode is either 'tcp' (time a TCP handshake with port) or 'icmp' (echo
+    request over an unprivileged ICMP datagram socket).  ICMP falls back to
+    TCP for good if the system doesn't allow unprivileged ICMP sockets;
+    other errors only lose that probe.
+    """
+    modes = ('tcp', 'icmp')
+
+    def __init__(self, targets=None, mode='tcp', port=53, interval=10,
+                 window=30, timeout=2):
+        PeriodicThread.__init__(self, interval, name='latency-prober')
+        if targets is None:
+            targets = ['8.8.8.8']
+        assert mode in LatencyProber.modes
+        self.targets = list(targets)
+        self.mode = mode
+        self.port = port
+        self.timeout = timeout
+        self._sequence = 0
+        self._results = {target: deque(maxlen=int(window)) for target in
+                         self.targets}
+        self._lock = threading.Lock()
+
+    def tick(self):
+        for target in self.targets:
+            rtt = self._probe(target)
+            with self._lock:
+                self._results[target].append(rtt)
+
+    def get_stats(self, target=None):
+        """
+        Returns latency statistics for target, defaults to the first
+        configured target.  See summarize_latency for the output format.
+
+        :param target: str or NoneType
+        :return: dict
+        """
+        if target is None:
+            target = self.targets[0]
+        with self._lock:
+            samples = list(self._results[target])
+        return summarize_latency(samples)
+
+    def get_all_stats(self):
+        """
+        Returns latency statistics for every target keyed by target
+
+        :return: dict
+        """
+        return {target: self.get_stats(target) for target in self.targets}
+
+    def _probe(self, target):
+        if self.mode == 'icmp':
+            self._sequence += 1
+            try:
+                return icmp_ping(target, self.timeout, self._sequence)
+            except socket.error as err:
+                logger.warning(
+                    ('Unprivileged ICMP sockets unavailable ({}).  '
+                     'Falling back to TCP probes').format(err))
+                self.mode = 'tcp'
+        return tcp_ping(target, self.port, self.timeout)
 
 
 def get_system_uptime():
@@ -127,64 +288,208 @@ def return_network_io():
     return [network_io.bytes_sent, network_io.bytes_recv]
 
 
-def get_network_speed(sleep=1):
-    assert type(sleep) is int
-    start_time = datetime.datetime.now()
-    start_data = return_network_io()
-    time.sleep(sleep)
-    time_delta = datetime.datetime.now() - start_time
-    end_data = return_network_io()
+def calculate_network_speed(start_time, start_data, end_time, end_data):
+    """
+    Returns upload and download speed in megabits per second between two
+    network IO samples, ex. {'up': 0.4213, 'down': 12.0751}
+
+    :param start_time: float - monotonic timestamp of first sample
+    :param start_data: list - [bytes_sent, bytes_recv] of first sample
+    :param end_time: float - monotonic timestamp of second sample
+    :param end_data: list - [bytes_sent, bytes_recv] of second sample
+    :return: dict
+    """
     bits = 8
-    return dict(up=convert_bytes((end_data[0] - start_data[0]) / time_delta.seconds * bits, 'MB'),
-                down=convert_bytes((end_data[1] - start_data[1]) / time_delta.seconds * bits, 'MB'))
+    rates = calculate_network_rates(start_time, start_data, end_time,
+                                    end_data)
+    return dict(up=convert_bytes(rates['sent'] * bits, 'MB'),
+                down=convert_bytes(rates['received'] * bits, 'MB'))
 
 
-def get_total_system_space(digits=1):
+def calculate_network_rates(start_time, start_data, end_time, end_data):
     """
-    returns total system disk space formatted, ex.
-        {'total': '8,781.9 GB', 'used': '3,023.0 GB', 'pct': 34.4, 'free': '5,313.4 GB'}
+    Returns bytes sent and received per second between two network IO
+    samples, ex. {'sent': 52662.5, 'received': 1509387.5}.  Takes the same
+    arguments as calculate_network_speed.
 
-    :rtype : dict
-    :param digits: int
     :return: dict
     """
-    assert type(digits) is int
-    all_partitions = psutil.disk_partitions(all=True)
-    # limit total disk space to those paritions mounted in "/dev/"
-    partitions_to_keep = [partition for partition in all_partitions if partition.device.startswith('/dev/')]
-    partitions = get_partitions(partitions_to_keep)
-    disk_space = dict(total=sum([partitions[partition].total for partition in partitions]),
-                      used=sum([partitions[partition].used for partition in partitions]),
-                      free=sum([partitions[partition].free for partition in partitions]))
-    disk_space_formatted = {k: convert_bytes(disk_space[k], 'GB', True, digits, True) for k in disk_space}
-    disk_space_formatted['pct'] = round(float(disk_space['used']) / float(disk_space['total']) * 100.0, digits)
-    return disk_space_formatted
+    time_delta = float(end_time - start_time)
+    if time_delta <= 0:
+        return dict(sent=0.0, received=0.0)
+    # counters go backwards if the interface is reset, report 0 instead
+    sent, received = [max(end - start, 0) for start, end in
+                      zip(start_data, end_data)]
+    return dict(sent=sent / time_delta, received=received / time_delta)
 
 
-def get_partitions_space(partitions, digits=1, sort='alpha'):
+class NetworkSpeedSampler(PeriodicThread):
     """
-    {'Home': {'total': '168.8 GB', 'pct': 44.4, 'free': '85.3 GB', 'used': '74.9 GB'},
-        'Incoming': {'total': '293.3 GB', 'pct': 48.2, 'free': '137.0 GB', 'used': '141.4 GB'}}
-    :param partitions:
-    :param digits:
-    :return:
+    Reads the network IO counters every interval seconds in the background
+    and keeps enough samples to report the average transfer rate over the
+    last window intervals, so callers never have to sleep waiting for a
+    second sample.
     """
-    assert type(partitions) is dict
-    system_partitions = get_partitions()
-    # return disk space for each partition listed in config
-    # test if listed partition actually exists in system first to avoid throwing an error
-    disk_space = {p: system_partitions[partitions[p]] for p in partitions if partitions[p] in system_partitions}
-    disk_space_formatted = {p: dict(total=convert_bytes(disk_space[p].total, 'GB', True, digits, True),
-                                    used=convert_bytes(disk_space[p].used, 'GB', True, digits, True),
-                                    free=convert_bytes(disk_space[p].free, 'GB', True, digits, True)) for p in
-                            disk_space}
-    for p in disk_space:
-        disk_space_formatted[p]['pct'] = round(float(disk_space[p].used) / float(disk_space[p].total) * 100.0,
-                                               digits)
+
+    def __init__(self, interval=1, window=5):
+        PeriodicThread.__init__(self, interval, name='network-speed-sampler')
+        # one sample more than the window so the rate spans window intervals
+        self._samples = deque(maxlen=int(window) + 1)
+        self._lock = threading.Lock()
+
+    def tick(self):
+        sample = (monotonic(), return_network_io())
+        with self._lock:
+            self._samples.append(sample)
+
+    def get_speed(self):
+        """
+        Returns the latest rolling upload and download speed in megabits per
+        second.  Both are 0 until the sampler has taken two samples.
+
+        :return: dict
+        """
+        with self._lock:
+            if len(self._samples) < 2:
+                return dict(up=0.0, down=0.0)
+            start_time, start_data = self._samples[0]
+            end_time, end_data = self._samples[-1]
+        return calculate_network_speed(start_time, start_data, end_time,
+                                       end_data)
+
+    def get_rates(self):
+        """
+        Returns the latest rolling bytes sent and received per second.  Both
+        are 0 until the sampler has taken two samples.
+
+        :return: dict
+        """
+        with self._lock:
+            if len(self._samples) < 2:
+                return dict(sent=0.0, received=0.0)
+            start_time, start_data = self._samples[0]
+            end_time, end_data = self._samples[-1]
+        return calculate_network_rates(start_time, start_data, end_time,
+                                       end_data)
+
+
+def _usage_by_device(mounts, prober=None):
+    """
+    Returns disk usage of each distinct device among mounts, keyed by
+    device, so each filesystem is statvfs'd once however many times it's
+    mounted.  Devices whose usage can't be read map to None, and those that
+    didn't answer the prober in time to UNRESPONSIVE.
+
+    :param mounts: iterable of [Mount]
+    :param prober: MountProber, or None to read usage directly
+    :return: OrderedDict
+    """
+    mounts = list(mounts)
+    if prober is not None:
+        # probed all at once, so hung mounts share a single deadline
+        probed = prober.disk_usages(mounts)
+    usage = OrderedDict()
+    for mount in mounts:
+        if mount.device in usage:
+            continue
+        try:
+            if prober is None:
+                usage[mount.device] = psutil.disk_usage(mount.mountpoint)
+            elif isinstance(probed[mount.device], OSError):
+                raise probed[mount.device]
+            else:
+                usage[mount.device] = probed[mount.device]
+        except OSError as err:
+            logger.warning('Unable to read disk usage of {}: {}'.format(
+                mount.mountpoint, err))
+            usage[mount.device] = None
+    return usage
+
+
+def _configured_mounts(partitions, mount_index):
+    # only paths that are mount points, to avoid reporting the filesystem of
+    # whatever directory an unmounted partition's path is in
+    visible = mount_index.visible()
+    return {name: visible[path] for name, path in partitions.items() if
+            path in visible}
+
+
+def _format_space(total, used, free, digits):
+    space = {k: convert_bytes(v, 'GB', True, digits, True) for k, v in
+             dict(total=total, used=used, free=free).items()}
+    space['pct'] = round(float(used) / total * 100.0, digits) if total else 0.0
+    return space
+
+
+def get_storage(partitions, digits=1, sort='alpha', mount_index=None,
+                prober=None):
+    """
+    Returns total disk space of the system's block devices, and disk space
+    of each partition listed in config that's mounted, formatted, ex.
+        {'total': {'total': '8,781.9 GB', 'used': '3,023.0 GB', 'pct': 34.4,
+                   'free': '5,313.4 GB'},
+         'paths': {'Home': {'total': '168.8 GB', 'pct': 44.4,
+                            'free': '85.3 GB', 'used': '74.9 GB'}, ...}}
+
+    Mounts come from the mount index, and only block devices and configured
+    partitions are statvfs'd, each device once.  The total counts every
+    block device once, however many places it's mounted.  Partitions that
+    don't answer the prober in time are returned as {'unresponsive': True}
+    and left out of the total.
+
+    :param partitions: mapping of partition name to mount point
+    :type partitions: dict
+    :param digits: int
+    :param sort: 'alpha' to order paths by name
+    :param mount_index: MountIndex, defaults to the shared index
+    :param prober: MountProber, or None to read usage directly
+    :return: dict
+    """
+    assert type(partitions) is dict and type(digits) is int
+    if mount_index is None:
+        mount_index = get_mount_index()
+    block_devices = list(mount_index.block_devices())
+    configured = _configured_mounts(partitions, mount_index)
+    usage = _usage_by_device(block_devices + configured.values(), prober)
+    block_usage = [usage[mount.device] for mount in block_devices if
+                   usage[mount.device] not in (None, UNRESPONSIVE)]
+    total = _format_space(sum(u.total for u in block_usage),
+                          sum(u.used for u in block_usage),
+                          sum(u.free for u in block_usage), digits)
+    paths = dict()
+    for name, mount in configured.items():
+        device_usage = usage[mount.device]
+        if device_usage == UNRESPONSIVE:
+            paths[name] = dict(unresponsive=True)
+        elif device_usage is not None:
+            paths[name] = _format_space(device_usage.total, device_usage.used,
+                                        device_usage.free, digits)
     if sort.lower() == 'alpha':
         # place in ordered dictionary so paths always display in alphabetical order on page
-        disk_space_formatted = OrderedDict(sorted(disk_space_formatted.items(), key=lambda x: x[0]))
-    return disk_space_formatted
+        paths = OrderedDict(sorted(paths.items(), key=lambda x: x[0]))
+    return dict(total=total, paths=paths)
+
+
+def get_partitions_usage(partitions, mount_index=None, prober=None):
+    """
+    Returns disk usage in bytes for each partition listed in config that's
+    mounted and responding, keyed by partition name, ex.
+        {'Home': sdiskusage(total=181190025216, used=80422862848,
+                            free=91591495680, percent=46.8)}
+
+    :param partitions: mapping of partition name to mount point
+    :type partitions: dict
+    :param mount_index: MountIndex, defaults to the shared index
+    :param prober: MountProber, or None to read usage directly
+    :return: dict
+    """
+    assert type(partitions) is dict
+    if mount_index is None:
+        mount_index = get_mount_index()
+    configured = _configured_mounts(partitions, mount_index)
+    usage = _usage_by_device(configured.values(), prober)
+    return {name: usage[mount.device] for name, mount in configured.items()
+            if usage[mount.device] not in (None, UNRESPONSIVE)}
 
 
 def get_load_average():
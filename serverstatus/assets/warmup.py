@@ -0,0 +1,136 @@
+"""
+Warms up a worker's services and caches in the background when the app
+starts, so the first requests don't pay for connecting to every server, and
+starts the metrics collector so history is recorded from then on
+"""
+import os
+import threading
+import logging
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from serverstatus.assets.background import monotonic
+
+
+LOGGER = logging.getLogger(__name__)
+
+# sections called to fill the API cache and start the background samplers
+DEFAULT_SECTIONS = ('system_info', 'storage', 'network_speed', 'ping',
+                    'services', 'plex_transcodes', 'media', 'forecast')
+
+
+def _elapsed_ms(start):
+    return round((monotonic() - start) * 1000, 1)
+
+
+class WarmUp(threading.Thread):
+    """
+    Loads every service concurrently, then calls each section once so its
+    result is cached, timing every step, and starts sampling metrics into
+    the history store unless metrics is False, ex. in collector mode where
+    the collector samples them for every worker.  The worker is ready once
+    every step has finished, whether it succeeded or not, or once timeout
+    seconds have passed, so an offline server can't keep a worker out of
+    rotation.
+    """
+
+    def __init__(self, api_functions, sections=DEFAULT_SECTIONS, timeout=60,
+                 workers=4, metrics=True):
+        threading.Thread.__init__(self, name='warm-up')
+        self.daemon = True
+        self.logger = LOGGER
+        self.api_functions = api_functions
+        self.timeout = timeout
+        self.workers = workers
+        self.metrics = metrics
+        # warm-up threads don't survive a fork, see BackEndCalls.start_warmup
+        self.pid = os.getpid()
+        self._started_at = None
+        self._elapsed_ms = None
+        self._services = OrderedDict(
+            (name, dict(status='pending')) for _, name, _, _ in
+            api_functions._service_classes)
+        self._sections = OrderedDict(
+            (section, dict(status='pending')) for section in sections)
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        if self._elapsed_ms is not None:
+            return True
+        return self._started_at is not None and \
+            monotonic() - self._started_at >= self.timeout
+
+    def status(self):
+        """
+        Returns whether the worker is ready, and the outcome and time taken
+        of each step so far, ex.
+            {'ready': False, 'state': 'warming', 'elapsed_ms': 812.4,
+             'services': {'plex': {'status': 'ok', 'elapsed_ms': 640.2},
+                          'subsonic': {'status': 'pending'}, ...},
+             'sections': {'storage': {'status': 'ok', 'elapsed_ms': 2.1},
+                          ...}}
+        state is 'pending', 'warming', 'timed_out' or 'ready'.
+
+        :return: dict
+        """
+        if self._elapsed_ms is not None:
+            state, elapsed_ms = 'ready', self._elapsed_ms
+        elif self._started_at is None:
+            state, elapsed_ms = 'pending', 0.0
+        else:
+            elapsed_ms = _elapsed_ms(self._started_at)
+            state = 'timed_out' if self.ready else 'warming'
+        with self._lock:
+            services = OrderedDict((name, dict(result)) for name, result in
+                                   self._services.items())
+            sections = OrderedDict((name, dict(result)) for name, result in
+                                   self._sections.items())
+        return dict(ready=self.ready, state=state, elapsed_ms=elapsed_ms,
+                    services=services, sections=sections)
+
+    def run(self):
+        self._started_at = monotonic()
+        pool = ThreadPool(processes=self.workers)
+        try:
+            pool.map(self._load_service, self.api_functions._service_classes)
+            pool.map(self._prime_section, self._sections.keys())
+        finally:
+            pool.close()
+        if self.metrics:
+            self._start_metrics()
+        self._elapsed_ms = _elapsed_ms(self._started_at)
+        self.logger.info('Warm-up finished in {}ms'.format(self._elapsed_ms))
+
+    def _load_service(self, service):
+        attrib, name = service[:2]
+        start = monotonic()
+        status = self.api_functions._load_service(*service)
+        result = dict(status=status, elapsed_ms=_elapsed_ms(start))
+        if status in ('error', 'unavailable'):
+            result['error'] = self.api_functions._get_breaker(
+                attrib).status['last_error']
+        with self._lock:
+            self._services[name] = result
+
+    def _prime_section(self, section):
+        start = monotonic()
+        try:
+            getattr(self.api_functions, section)()
+            result = dict(status='ok')
+        except Exception as err:
+            self.logger.warning('Warming up {} failed: {}'.format(section,
+                                                                  err))
+            result = dict(status='error', error=str(err))
+        result['elapsed_ms'] = _elapsed_ms(start)
+        with self._lock:
+            self._sections[section] = result
+
+    def _start_metrics(self):
+        # history is only recorded while the collector runs, so it's started
+        # with the worker rather than by the first /metrics or /api/history
+        try:
+            self.api_functions._get_metrics_collector().ensure_running()
+        except Exception as err:
+            self.logger.warning(
+                'Starting the metrics collector failed: {}'.format(err))
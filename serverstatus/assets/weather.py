@@ -1,17 +1,53 @@
 # coding=utf-8
 from collections import namedtuple
 from time import localtime, strftime
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
 import logging
 
 import forecastio
 
+from serverstatus import app
+from serverstatus.assets.background import PeriodicThread
 from serverstatus.assets.exceptions import MissingForecastIOKey
 
 
 LOGGER = logging.getLogger(__name__)
 
 
+class ForecastRefresher(PeriodicThread):
+    """
+    Refreshes a Forecast every interval seconds in the background.  Workers
+    sharing a cache file take turns, so forecast.io is only called once per
+    interval however many are running.
+    """
+
+    def __init__(self, forecast, interval):
+        PeriodicThread.__init__(self, interval, name='forecast-refresher')
+        self.forecast = forecast
+
+    def tick(self):
+        # skip ticks where the forecast was only just fetched, whether by
+        # this process or, as found in the cache file, by another one
+        self.forecast.refresh(max_age=self.interval / 2)
+
+
 class Forecast(object):
+    """
+    Forecast from forecast.io, refreshed every refresh_interval seconds in
+    the background, so requests are answered from memory without using up
+    the daily API call quota.
+
+    The last response is kept in cache_file, and reused on restart while
+    it's fresher than refresh_interval and was fetched with the same API
+    key, location and units.
+    """
+
     def __init__(self, weather_config):
         assert type(weather_config) is dict
         self.logger = LOGGER
@@ -26,14 +62,48 @@ class Forecast(object):
         self.lat = weather_config.get('Latitude', 37.4225)
         self.lng = weather_config.get('Longitude', 122.1653)
         self.units = weather_config.get('units', 'us')
-        self.forecast = self._get_forecast_io()
+        self.refresh_interval = weather_config.get('refresh_interval', 600)
+        self.cache_file = weather_config.get('cache_file', os.path.join(
+            app.config['DATA_LOCATION'], 'server-status-forecast.json'))
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [self.api_key, self.lat, self.lng, self.units])).hexdigest()
+        self.forecast = None
+        self.updated_at = None
+        self._lock = threading.Lock()
+        self._refresher = ForecastRefresher(self, self.refresh_interval)
+        loaded = self._load_cache_file()
+        if not loaded or self.age() >= self.refresh_interval:
+            try:
+                self.reload_data()
+            except Exception as err:
+                if not loaded:
+                    raise
+                self.logger.error(
+                    'Unable to refresh forecast, using saved one: {}'.format(
+                        err))
+
+    def age(self):
+        """
+        Returns seconds since the forecast was fetched from forecast.io
+
+        :return: float
+        """
+        return max(time.time() - self.updated_at, 0)
 
     def get_data(self):
-        json = self.forecast.json
-        current = json['currently']
-        hourly = json['hourly']
-        minutely = json['minutely']
-        daily = json['daily']['data'][0]
+        """
+        Returns the latest forecast, with the unix time it was fetched at in
+        updated_at and that time of day as text in updated.  Nothing in it
+        changes until the forecast is refreshed.
+        """
+        self._refresher.ensure_running()
+        with self._lock:
+            forecast_json = self.forecast
+            updated_at = self.updated_at
+        current = forecast_json['currently']
+        hourly = forecast_json['hourly']
+        minutely = forecast_json['minutely']
+        daily = forecast_json['daily']['data'][0]
         output = dict(current_summary=current['summary'],
                       current_summary_icon=self._get_weather_icons(current['icon']),
                       current_temp=u'{:0.0f}°'.format(round(current['temperature'], 0)),
@@ -45,18 +115,103 @@ class Forecast(object):
                       sunrise=self._convert_time_to_text(daily['sunriseTime']),
                       url_link='{url}{lat},{lng}'.format(
                           url=self.forcastio_link_url,
-                          lat=self.lat, lng=self.lng))
+                          lat=self.lat, lng=self.lng),
+                      updated_at=updated_at,
+                      updated=self._convert_time_to_text(int(updated_at)))
         if output['current_windspeed'] != 0:
             output['current_windbearing'] = self._get_wind_bearing_text(current['windBearing'])
         return output
 
+    def refresh(self, max_age):
+        """
+        Fetches a new forecast, unless the one in memory or in the cache file
+        was fetched less than max_age seconds ago.  Processes sharing the
+        cache file refresh one at a time, so each sees the forecast fetched
+        by the one before it.
+
+        :type max_age: float
+        :return: True if a new forecast was fetched
+        """
+        try:
+            lock_file = open(self.cache_file + '.lock', 'a')
+        except IOError as err:
+            self.logger.warning('Unable to lock {}: {}'.format(
+                self.cache_file, err))
+            lock_file = None
+        try:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._load_cache_file()
+            if self.age() <= max_age:
+                return False
+            self.reload_data()
+            return True
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
     def reload_data(self):
-        self.forecast.update()
+        """
+        Fetches the forecast from forecast.io and saves it to the cache file
+        """
+        forecast_json = self._get_forecast_io().json
+        updated_at = time.time()
+        with self._lock:
+            self.forecast = forecast_json
+            self.updated_at = updated_at
+        try:
+            self._write_cache_file(forecast_json, updated_at)
+        except (OSError, IOError) as err:
+            self.logger.warning('Unable to save forecast to {}: {}'.format(
+                self.cache_file, err))
 
     def _get_forecast_io(self):
         return forecastio.load_forecast(self.api_key, self.lat, self.lng,
                                         units=self.units)
 
+    def _load_cache_file(self):
+        """
+        Loads the forecast saved by a previous run, if it was fetched with
+        the same key, location and units
+
+        :return: True if a forecast was loaded
+        """
+        try:
+            with open(self.cache_file) as cache_file:
+                cached = json.load(cache_file)
+            if cached['fingerprint'] != self.fingerprint:
+                return False
+            if (self.updated_at is not None and
+                    cached['updated_at'] <= self.updated_at):
+                # not newer than the forecast already in memory
+                return True
+            with self._lock:
+                self.forecast = cached['forecast']
+                self.updated_at = cached['updated_at']
+        except (IOError, ValueError, KeyError, TypeError) as err:
+            self.logger.debug('No usable forecast in {}: {}'.format(
+                self.cache_file, err))
+            return False
+        return True
+
+    def _write_cache_file(self, forecast_json, updated_at):
+        # write to a temporary file and rename it into place, so a crash
+        # never leaves a partial forecast behind
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(dict(fingerprint=self.fingerprint,
+                               updated_at=updated_at,
+                               forecast=forecast_json), temp_file)
+            os.rename(temp_path, self.cache_file)
+        except (OSError, IOError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
     @staticmethod
     def _get_weather_icons(weather_icon):
         assert type(weather_icon) is unicode
@@ -3,34 +3,147 @@ function wrappers module
 """
 
 import logging
-from inspect import stack, getmodule
+import threading
+from bisect import bisect_left
+from functools import wraps
 
+from serverstatus.assets.background import monotonic
 
-def logger(log_type):
+
+# upper bounds in milliseconds of the latency histogram buckets, growing by
+# about 19% per bucket from 10 microseconds to over 10 minutes
+LATENCY_BUCKETS = tuple(0.01 * 2 ** (i / 4.0) for i in range(100))
+
+_STATS = dict()
+_STATS_LOCK = threading.Lock()
+
+
+class FunctionStats(object):
     """
-    decorator to log output of functions
+    Call count, error count and latency histogram of one function.  Latency
+    percentiles are estimated from the histogram buckets, so they're
+    accurate to within a bucket's width.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms, failed=False):
+        bucket = bisect_left(LATENCY_BUCKETS, elapsed_ms)
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._buckets[bucket] += 1
+
+    def percentile(self, pct):
+        """
+        Returns estimated latency in milliseconds that pct percent of calls
+        completed within
+
+        :type pct: float
+        :return: float
+        """
+        with self._lock:
+            buckets = list(self._buckets)
+            calls = self.calls
+            max_ms = self.max_ms
+        if not calls:
+            return 0.0
+        rank = pct / 100.0 * calls
+        seen = 0
+        for bucket, count in enumerate(buckets):
+            seen += count
+            if seen >= rank and count:
+                if bucket == len(LATENCY_BUCKETS):
+                    return max_ms
+                return min(LATENCY_BUCKETS[bucket], max_ms)
+        return max_ms
+
+    def summary(self):
+        """
+        >>> {'calls': 120, 'errors': 1, 'mean_ms': 4.1, 'max_ms': 61.5,
+        ...  'p50_ms': 2.8, 'p95_ms': 13.5, 'p99_ms': 45.3}
+
+        :return: dict
+        """
+        with self._lock:
+            calls, errors = self.calls, self.errors
+            mean_ms = self.total_ms / calls if calls else 0.0
+            max_ms = self.max_ms
+        output = dict(calls=calls, errors=errors, mean_ms=round(mean_ms, 3),
+                      max_ms=round(max_ms, 3))
+        for pct in (50, 95, 99):
+            output['p{}_ms'.format(pct)] = round(self.percentile(pct), 3)
+        return output
+
+
+def get_stats():
+    """
+    Returns stats of every instrumented function keyed by module and
+    function name, ex. {'apifunctions.media': {'calls': 12, ...}}
+
+    :return: dict
+    """
+    with _STATS_LOCK:
+        stats = _STATS.items()
+    return {name: function_stats.summary() for name, function_stats in stats}
+
+
+def instrument(log_type):
+    """
+    decorator to time functions, recording call count, error count and
+    latency in get_stats(), and logging how long each call took
     :param log_type: logger level as string (debug, warn, info, etc)
     :type log_type: str
     """
-    def log_decorator(func):
+    def instrument_decorator(func):
         """
         wrapped function
         """
+        # resolved once here rather than on every call
+        log = getattr(logging.getLogger(func.__module__), log_type)
+        name = '{}.{}'.format(func.__module__.rsplit('.', 1)[-1],
+                              func.__name__)
+        with _STATS_LOCK:
+            function_stats = _STATS.setdefault(name, FunctionStats())
+
+        @wraps(func)
         def wrapped(*args, **kwargs):
-            # preserve calling module name for LOGGER
-            frm = stack()[1]
-            mod = getmodule(frm[0])
-            wrapped_logger = logging.getLogger(mod.__name__)
-            result = func(*args, **kwargs)
+            start = monotonic()
+            failed = True
             try:
-                getattr(wrapped_logger, log_type)(result)
-            except AttributeError as err:
-                wrapped_logger.error(err)
-            return result
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed_ms = (monotonic() - start) * 1000
+                function_stats.record(elapsed_ms, failed)
+                log('%s %s in %.1f ms', name,
+                    'failed' if failed else 'completed', elapsed_ms)
 
         return wrapped
 
-    return log_decorator
+    return instrument_decorator
+
+
+def cached(func):
+    """
+    decorator to serve a method's results from the instance's TTLCache
+    (self.cache), keyed by the method name
+    """
+    @wraps(func)
+    def wrapped(self, *args, **kwargs):
+        return self.cache.get(func.__name__,
+                              lambda: func(self, *args, **kwargs))
+
+    return wrapped
 
 
 def log_args(function):
@@ -16,19 +16,6 @@ var html_base_url = window.location.href + "html/";
         var $media = $(".media");
 
 
-        function load_systeminfo() {
-            $systeminfo.load("html/system_info", function () {
-                var $transcodes = $(".transcodes");
-                $transcodes.load("html/plex_transcodes");
-            });
-
-        }
-
-        var load_storage = $storage.load("html/storage");
-        var load_services = $services.load("html/services");
-        var load_weather = $weather.load("html/forecast");
-        var load_media = $media.load("html/media");
-
         function get_server_ip() {
             $.getJSON(api_base_url + "ip_address", function (data) {
                 $("#server_ip").text(data.wan_ip);
@@ -42,28 +29,24 @@ var html_base_url = window.location.href + "html/";
         }
 
         // FUNCTIONS TO UPDATE NETWORK SPEED AND PING
-        function update_ping() {
-            $.getJSON(api_base_url + "ping", function (data) {
-                $("#ping").text(data.ping + " ms");
-            });
+        function show_ping(data) {
+            $("#ping").text(data.ping + " ms");
         }
 
-        function update_network_speed() {
+        function show_network_speed(data) {
             var $downspeed = $("#download");
             var $downspeed_progressbar = $("#progress-bar-down");
             var $upspeed = $("#upload");
             var $upspeed_progressbar = $("#progress-bar-up");
-            $.getJSON(api_base_url + "network_speed", function (data) {
-                var up = data.up.toFixed(2);
-                var down = data.down.toFixed(2);
-                $downspeed.text(down + " Mbps");
-                $upspeed.text(up + " Mbps");
-                var down_progressbar_width = down * (10 / 6);
-                var up_progressbar_width = up * (10 / 6);
-                $downspeed_progressbar.css("width", down_progressbar_width + "%");
-                $upspeed_progressbar.css("width", up_progressbar_width + "%");
-            });
-        };
+            var up = data.up.toFixed(2);
+            var down = data.down.toFixed(2);
+            $downspeed.text(down + " Mbps");
+            $upspeed.text(up + " Mbps");
+            var down_progressbar_width = down * (10 / 6);
+            var up_progressbar_width = up * (10 / 6);
+            $downspeed_progressbar.css("width", down_progressbar_width + "%");
+            $upspeed_progressbar.css("width", up_progressbar_width + "%");
+        }
 
         // END FUNCTIONS TO UPDATE NETWORK SPEED AND PING
 
@@ -74,39 +57,90 @@ var html_base_url = window.location.href + "html/";
             return client_ip === server_ip;
         };
 
-        // Load at start of page
-        load_systeminfo();
-        load_storage;
-        load_services;
-        load_weather;
-        load_media;
-
-        update_network_speed();
-        update_ping();
-        //get_server_ip();
-        //get_client_ip();
-
-        // Refresh every 30 seconds
-        var refreshId = setInterval(function () {
-            load_systeminfo();
-        }, 30000);
-
-        // Refresh every 1 minute
-        var refreshId = setInterval(function () {
-            update_network_speed();
-            update_ping();
-
-            load_media;
-        }, 60000);
-
-        // Refresh every 10 minutes
-        var refreshId = setInterval(function () {
+        // Show each section's data, as html for sections with a template
+        var transcodes_html = "";
+        var section_handlers = {
+            system_info: function (data) {
+                $systeminfo.html(data.html);
+                $(".transcodes").html(transcodes_html);
+            },
+            plex_transcodes: function (data) {
+                transcodes_html = data.html;
+                $(".transcodes").html(transcodes_html);
+            },
+            storage: function (data) {
+                $storage.html(data.html);
+            },
+            services: function (data) {
+                $services.html(data.html);
+            },
+            forecast: function (data) {
+                $weather.html(data.html);
+            },
+            media: function (data) {
+                $media.html(data.html);
+            },
+            network_speed: show_network_speed,
+            ping: show_ping
+        };
+
+        // Server pushes sections as they change, one stream for every section
+        function subscribe_to_stream() {
+            var source = new EventSource("stream");
+            $.each(section_handlers, function (section, handler) {
+                source.addEventListener(section, function (event) {
+                    handler(JSON.parse(event.data));
+                });
+            });
+        }
+
+        // Fetch several sections in one request
+        function load_sections(sections) {
+            $.getJSON(api_base_url + "batch",
+                {sections: sections.join(","), render: 1},
+                function (batch) {
+                    $.each(batch.sections, function (section, result) {
+                        if (result.status !== "ok" &&
+                            result.status !== "offline") {
+                            return;
+                        }
+                        section_handlers[section](
+                            result.html !== undefined ? result : result.data);
+                    });
+                });
+        }
+
+        // Fall back to polling sections on timers
+        function poll_sections() {
+            // Load at start of page
+            load_sections(["system_info", "plex_transcodes", "storage",
+                "services", "forecast", "media", "network_speed", "ping"]);
             //get_server_ip();
             //get_client_ip();
-            load_storage;
-            load_weather;
-            load_services;
-        }, 600000);
+
+            // Refresh every 30 seconds
+            var refreshId = setInterval(function () {
+                load_sections(["system_info", "plex_transcodes"]);
+            }, 30000);
+
+            // Refresh every 1 minute
+            var refreshId = setInterval(function () {
+                load_sections(["network_speed", "ping", "media"]);
+            }, 60000);
+
+            // Refresh every 10 minutes
+            var refreshId = setInterval(function () {
+                //get_server_ip();
+                //get_client_ip();
+                load_sections(["storage", "forecast", "services"]);
+            }, 600000);
+        }
+
+        if (window.EventSource) {
+            subscribe_to_stream();
+        } else {
+            poll_sections();
+        }
     });
 
 
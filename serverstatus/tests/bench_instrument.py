@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmark of the per call overhead of wrappers.instrument on a no-op
+function, next to a bare call and the inspect.stack() based decorator it
+replaced.
+
+Each decorator is timed with its log level disabled, then enabled with
+records going to a NullHandler so formatting is counted but not I/O.
+
+    python serverstatus/tests/bench_instrument.py [number of calls]
+"""
+import imp
+import logging
+import os
+import sys
+import timeit
+from functools import wraps
+from inspect import stack, getmodule
+
+# load the modules directly to skip initializing the flask app
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'assets')
+for package in ('serverstatus', 'serverstatus.assets'):
+    sys.modules.setdefault(package, imp.new_module(package))
+imp.load_source('serverstatus.assets.background',
+                os.path.join(ASSETS, 'background.py'))
+wrappers = imp.load_source('serverstatus.assets.wrappers',
+                           os.path.join(ASSETS, 'wrappers.py'))
+
+
+def previous_logger(log_type):
+    """
+    wrappers.logger as it was before instrument replaced it
+    """
+    def log_decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            frm = stack()[1]
+            mod = getmodule(frm[0])
+            wrapped_logger = logging.getLogger(mod.__name__)
+            result = func(*args, **kwargs)
+            try:
+                getattr(wrapped_logger, log_type)(result)
+            except AttributeError as err:
+                wrapped_logger.error(err)
+            return result
+        return wrapped
+    return log_decorator
+
+
+def noop():
+    return None
+
+
+def measure(func, number, repeat=5):
+    """
+    Returns best time per call in microseconds
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+def main(number=10000):
+    root = logging.getLogger()
+    root.addHandler(logging.NullHandler())
+    functions = [
+        ('bare call', noop, number),
+        ('instrument', wrappers.instrument('debug')(noop), number),
+        # inspect.stack() reads the source of every frame, so fewer calls
+        ('previous logger', previous_logger('debug')(noop),
+         max(number // 100, 10))]
+    print '{:<20}{:>16}{:>16}'.format('decorator', 'disabled (us)',
+                                      'enabled (us)')
+    for name, func, calls in functions:
+        root.setLevel(logging.INFO)
+        disabled = measure(func, calls)
+        root.setLevel(logging.DEBUG)
+        enabled = measure(func, calls)
+        print '{:<20}{:>16.2f}{:>16.2f}'.format(name, disabled, enabled)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
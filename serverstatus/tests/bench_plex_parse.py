@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark of Plex response parsing: xmltodict over the whole document, the
+iterparse extractor used for XML responses, and the JSON response mode.
+
+Runs against a synthetic /library/recentlyAdded response, each parser in a
+forked child so peak memory isn't shared between them.
+
+    python serverstatus/tests/bench_plex_parse.py [number of items]
+"""
+import imp
+import json
+import os
+import resource
+import sys
+import timeit
+
+import xmltodict
+
+# load the parser module directly to skip initializing the flask app
+plexparse = imp.load_source('plexparse', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'assets',
+    'plexparse.py'))
+
+ITEM_ATTRIBUTES = dict(
+    type='movie', title='Brazil', titleSort='Brazil', studio='Embassy',
+    contentRating='R', summary='A bureaucrat in a retro-future world ' * 8,
+    rating='7.9', year='1985', tagline='It\'s only a state of mind.',
+    thumb='/library/metadata/1/thumb/1412345678', art='/library/metadata/1/art',
+    duration='8520000', originallyAvailableAt='1985-02-20',
+    addedAt='1412345678', updatedAt='1412345678', librarySectionID='1',
+    librarySectionTitle='Movies', ratingKey='1', key='/library/metadata/1')
+
+
+def build_xml(num_items):
+    item = ''.join(' {}="{}"'.format(key, value) for key, value in
+                   ITEM_ATTRIBUTES.items())
+    media = ('<Media id="1" duration="8520000" bitrate="10000" width="1920" '
+             'height="1080" videoCodec="h264" audioCodec="dca">'
+             '<Part id="1" key="/library/parts/1/file.mkv" '
+             'file="/mnt/movies/Brazil (1985).mkv" size="11811160064"/>'
+             '</Media><Genre tag="Comedy"/><Genre tag="Sci-Fi"/>'
+             '<Director tag="Terry Gilliam"/><Country tag="UK"/>')
+    videos = ''.join('<Video{}>{}</Video>'.format(item, media) for _ in
+                     range(num_items))
+    return '<MediaContainer size="{}">{}</MediaContainer>'.format(num_items,
+                                                                  videos)
+
+
+def build_json(num_items):
+    item = dict(ITEM_ATTRIBUTES)
+    item['Media'] = [dict(id=1, duration=8520000, Part=[
+        dict(id=1, file='/mnt/movies/Brazil (1985).mkv', size=11811160064)])]
+    item['Genre'] = [dict(tag='Comedy'), dict(tag='Sci-Fi')]
+    return json.dumps(dict(MediaContainer=dict(
+        size=num_items, Metadata=[item] * num_items)))
+
+
+def measure(parse, data, repeat=5):
+    """
+    Returns best parse time in seconds, and peak memory growth in KB while
+    parsing, measured in a forked child
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = parse(data)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        del result
+        best = min(timeit.repeat(lambda: parse(data), number=1,
+                                 repeat=repeat))
+        os.write(write_fd, json.dumps([best, peak]))
+        os._exit(0)
+    os.close(write_fd)
+    output = os.read(read_fd, 1024)
+    os.waitpid(pid, 0)
+    return json.loads(output)
+
+
+def main(num_items=5000):
+    xml_data = build_xml(num_items)
+    json_data = build_json(num_items)
+    parsers = [
+        ('xmltodict.parse', xmltodict.parse, xml_data),
+        ('parse_plex_xml', plexparse.parse_plex_xml, xml_data),
+        ('json + parse_plex_json',
+         lambda data: plexparse.parse_plex_json(json.loads(data)), json_data)]
+    print '{} items, XML {:.1f} KB, JSON {:.1f} KB'.format(
+        num_items, len(xml_data) / 1024.0, len(json_data) / 1024.0)
+    print '{:<24}{:>12}{:>16}'.format('parser', 'time (ms)', 'peak mem (KB)')
+    for name, parse, data in parsers:
+        best, peak = measure(parse, data)
+        print '{:<24}{:>12.1f}{:>16}'.format(name, best * 1000, peak)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
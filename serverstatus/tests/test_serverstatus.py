@@ -1,15 +1,64 @@
+import os
+import errno
+import hashlib
+import imp
+import json
+import logging
+import shutil
+import BaseHTTPServer
+import socket
+import SocketServer
+import tempfile
+import threading
+import time
 import urllib2
 import unittest
+import zlib
 from collections import OrderedDict
 from copy import deepcopy
+from cStringIO import StringIO
 
-from flask import Flask
+import requests
+from flask import Flask, render_template, request
 from flask.ext.testing import LiveServerTestCase
+from requests.packages.urllib3.exceptions import ProtocolError
+from werkzeug.http import parse_accept_header, quote_etag
 
 from serverstatus import app
 from serverstatus.assets.apifunctions import APIFunctions
-from serverstatus.assets.services import ServerSync, SubSonic
+from serverstatus.assets.background import PeriodicThread, WorkQueue
+from serverstatus.assets.broadcast import Broadcaster, SnapshotPoller
+from serverstatus.assets.cache import TTLCache
+from serverstatus.assets.circuitbreaker import CircuitBreaker
+from serverstatus.assets.collector import Collector, SnapshotReader, \
+    SnapshotWriter
+from serverstatus.assets.compression import CompressionCache, negotiate, \
+    precompress_static
+from serverstatus.assets.exceptions import CollectorRunningError, \
+    ServiceUnavailableError
+from serverstatus.assets.fragments import FragmentCache
+from serverstatus.assets.history import HistoryStore, RingBuffer
+from serverstatus.assets.httpclient import PooledHTTPClient
+from serverstatus.assets.imagecache import ImageCache
+from serverstatus.assets.logtail import LogTail
+from serverstatus.assets.metrics import MetricsCollector, format_metrics, \
+    history_values
+from serverstatus.assets.mounts import UNRESPONSIVE, Mount, MountIndex, \
+    MountProber, parse_mountinfo
+from serverstatus.assets.plexparse import parse_plex_json, parse_plex_xml
+from serverstatus.assets.services import CheckCrashPlan, CoverArt, Plex, \
+    ServerSync, SubSonic
+from serverstatus.assets.sysinfo import NetworkSpeedSampler, \
+    LatencyProber, calculate_network_speed, get_partitions_usage, \
+    get_storage, summarize_latency
+from serverstatus.assets.warmup import WarmUp
+import serverstatus.assets.sysinfo as sysinfo
 from serverstatus.assets.weather import Forecast
+from serverstatus.assets.wrappers import FunctionStats, get_stats, instrument
+from serverstatus.views import BACKENDCALLS
+
+# keeps requests made by the tests from warming up real services
+app.config['TESTING'] = True
 
 
 class TestApiFunctions(unittest.TestCase):
@@ -77,6 +126,176 @@ class TestApiFunctions(unittest.TestCase):
                 self.assertIsInstance(result[key], dict)
 
 
+class TestMediaFanOut(unittest.TestCase):
+    def setUp(self):
+        self.apifunctions = APIFunctions(
+            dict(MEDIA_TIMEOUTS=dict(default=0.2, slow=0.05)))
+
+    @staticmethod
+    def slow():
+        time.sleep(0.5)
+        return 'slow'
+
+    @staticmethod
+    def broken():
+        raise ValueError('server error')
+
+    def test_sections_isolated(self):
+        sources = OrderedDict([('fast', lambda: 'fast'), ('slow', self.slow),
+                               ('broken', self.broken)])
+        results = self.apifunctions._gather_media(sources)
+        self.assertEqual(results['fast'], 'fast')
+        self.assertIs(results['slow'], None)
+        self.assertIs(results['broken'], None)
+        self.assertEqual(results['media_status'],
+                         dict(fast='ok', slow='unavailable',
+                              broken='unavailable'))
+
+    def test_last_result_served_when_stale(self):
+        self.apifunctions._gather_media(OrderedDict(slow=lambda: 'old'))
+        results = self.apifunctions._gather_media(
+            OrderedDict(slow=self.slow))
+        self.assertEqual(results['slow'], 'old')
+        self.assertEqual(results['media_status'], dict(slow='stale'))
+
+    def test_pool_closed(self):
+        self.apifunctions._gather_media(OrderedDict(slow=self.slow))
+        pool = self.apifunctions._media_pool
+        self.apifunctions.close()
+        self.assertIsNone(self.apifunctions._media_pool)
+        pool.join()
+        # a closed APIFunctions starts a new pool if it's used again
+        results = self.apifunctions._gather_media(
+            OrderedDict(slow=lambda: 'new'))
+        self.assertEqual(results['slow'], 'new')
+        self.apifunctions.close()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=2,
+                                      base_delay=0.05, max_delay=0.1)
+        self.calls = 0
+
+    def broken(self):
+        self.calls += 1
+        raise socket.error('connection refused')
+
+    def fail(self, times):
+        for _ in range(times):
+            with self.assertRaises(socket.error):
+                self.breaker.call(self.broken)
+
+    def test_opens_after_threshold(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(ServiceUnavailableError):
+            self.breaker.call(self.broken)
+        self.assertEqual(self.calls, 2)
+
+    def test_half_open_trial(self):
+        self.fail(2)
+        time.sleep(0.06)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        # only one trial call at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+
+    def test_backoff_doubles_to_max(self):
+        self.fail(2)
+        first_delay = self.breaker.status['retry_in']
+        time.sleep(0.06)
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertGreater(self.breaker.status['retry_in'], first_delay)
+        self.assertLessEqual(self.breaker.status['retry_in'], 0.1)
+
+    def test_offline_services_fail_fast(self):
+        config = dict(CIRCUIT_BREAKER=dict(failure_threshold=1,
+                                           base_delay=60),
+                      SERVERSYNC_INFO=dict(lockfile_path='/nonexistent'))
+        apifunctions = APIFunctions(config)
+        apifunctions.plex = Plex.__new__(Plex)
+        apifunctions.plex.now_playing = self.broken
+        apifunctions._gather_media(OrderedDict(plex_nowplaying=lambda: (
+            apifunctions._call_service('plex', apifunctions.plex.now_playing))))
+        services = apifunctions.services()
+        self.assertEqual(services['plex']['text'], 'Offline')
+        self.assertEqual(services['subsonic']['text'], 'Offline')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(apifunctions.circuit_breakers()['plex']['state'],
+                         CircuitBreaker.OPEN)
+
+    def test_offline_subsonic_counted(self):
+        config = dict(CIRCUIT_BREAKER=dict(failure_threshold=3,
+                                           base_delay=60),
+                      CACHE_TTL=dict(services=0),
+                      SERVERSYNC_INFO=dict(lockfile_path='/nonexistent'))
+        apifunctions = APIFunctions(config)
+        apifunctions.subsonic = UnreachableSubSonic()
+        for _ in range(4):
+            services = apifunctions.services()
+            self.assertEqual(services['subsonic']['text'], 'Offline')
+        self.assertEqual(apifunctions.subsonic.pings, 3)
+        self.assertEqual(
+            apifunctions.circuit_breakers()['subsonic']['state'],
+            CircuitBreaker.OPEN)
+
+    def test_forecast_offline(self):
+        config = dict(CIRCUIT_BREAKER=dict(failure_threshold=1,
+                                           base_delay=60))
+        apifunctions = APIFunctions(config)
+        self.assertEqual(apifunctions.forecast(), dict(offline=True))
+        with app.test_request_context():
+            html = render_template('forecast.html',
+                                   values=apifunctions.forecast())
+        self.assertIn('Forecast unavailable', html)
+
+    def test_created_once_across_threads(self):
+        apifunctions = APIFunctions(SlowConfig())
+        created = []
+
+        def create():
+            created.append(apifunctions._get_breaker('plex'))
+            created.append(apifunctions._get_mount_prober())
+
+        threads = [threading.Thread(target=create) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(created), 8)
+        self.assertEqual(len(set(id(item) for item in created)), 2)
+
+
+class SlowConfig(dict):
+    """
+    Config widening the window between checking for and creating the
+    objects APIFunctions creates on first use
+    """
+    def get(self, key, default=None):
+        time.sleep(0.01)
+        return dict.get(self, key, default)
+
+
+class UnreachableSubSonic(SubSonic):
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.service_config = dict()
+        self._service_name = 'subsonic'
+        self._services_status_mapping = self._status_mappings_dict()
+        self._connect_status = None
+        self.conn = self
+        self.pings = 0
+
+    def ping(self):
+        self.pings += 1
+        raise socket.error('connection refused')
+
+
 class TestSubSonicServer(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
@@ -129,6 +348,92 @@ class TestSubSonicServer(unittest.TestCase):
         self.assertFalse(self.subsonic.connection_status)
 
 
+class OfflinePlex(Plex):
+    """
+    Plex with canned season metadata in place of a Plex server
+    """
+    def __init__(self):
+        self.requests = []
+        self._max_connections = 2
+        self._metadata_pool = None
+        self._metadata_pool_lock = threading.Lock()
+        self._season_metadata = OrderedDict()
+        self._season_metadata_lock = threading.Lock()
+
+    def _get_xml_convert_to_json(self, api_key, api_suffix=None):
+        self.requests.append(api_suffix)
+        return dict(MediaContainer=OrderedDict(
+            [('@grandparentStudio', 'HBO'), ('Video', [])]))
+
+
+class TestPlexSeasonMetadata(unittest.TestCase):
+    def setUp(self):
+        self.plex = OfflinePlex()
+        self.seasons = [
+            {'@ratingKey': str(key), '@updatedAt': '1412345678',
+             '@key': '/library/metadata/{}/children'.format(key)} for key in
+            range(3)]
+
+    def test_unchanged_seasons_cached(self):
+        self.plex._prefetch_season_metadata(self.seasons)
+        self.assertEqual(len(self.plex.requests), 3)
+        for season in self.seasons:
+            self.plex._get_season_metadata(season)
+        self.assertEqual(len(self.plex.requests), 3)
+
+    def test_updated_season_refetched(self):
+        self.plex._get_season_metadata(self.seasons[0])
+        self.seasons[0]['@updatedAt'] = '1412349999'
+        self.plex._get_season_metadata(self.seasons[0])
+        self.assertEqual(self.plex.requests,
+                         ['library/metadata/0/children'] * 2)
+
+    def test_pool_closed(self):
+        self.plex._prefetch_season_metadata(self.seasons)
+        pool = self.plex._metadata_pool
+        self.plex.close()
+        self.assertIsNone(self.plex._metadata_pool)
+        # a closed pool refuses new work
+        self.assertRaises(AssertionError, pool.map, len, ['closed'])
+
+
+class TestPlexParsers(unittest.TestCase):
+    recently_added_xml = (
+        '<MediaContainer size="2" identifier="com.plexapp.plugins.library">'
+        '<Video type="movie" title="Brazil" thumb="/library/metadata/1/thumb/5"'
+        ' addedAt="1412345678" studio="Embassy">'
+        '<Media id="1" duration="8520000"><Part id="1" file="/x.mkv"/></Media>'
+        '</Video>'
+        '<Directory type="season" title="Season 1" ratingKey="7" '
+        'updatedAt="1412349999" key="/library/metadata/7/children"/>'
+        '</MediaContainer>')
+
+    def test_xml_matches_xmltodict_for_used_attributes(self):
+        parsed = parse_plex_xml(self.recently_added_xml)
+        container = parsed['MediaContainer']
+        self.assertEqual(container['@size'], '2')
+        self.assertEqual(container['@identifier'],
+                         'com.plexapp.plugins.library')
+        self.assertEqual(dict(container['Video']),
+                         {'@type': 'movie', '@title': 'Brazil',
+                          '@thumb': '/library/metadata/1/thumb/5',
+                          '@addedAt': '1412345678'})
+        self.assertEqual(container['Directory']['@ratingKey'], '7')
+
+    def test_json_matches_xml_shape(self):
+        json_data = dict(MediaContainer=dict(
+            size=2, allowSync=True,
+            Metadata=[dict(type='episode', title='Pilot', index=1,
+                           Media=[dict(id=1)]),
+                      dict(type='episode', title='Second', index=2)]))
+        container = parse_plex_json(json_data)['MediaContainer']
+        self.assertEqual(container['@size'], u'2')
+        self.assertEqual(container['@allowSync'], u'1')
+        self.assertEqual([video['@index'] for video in container['Video']],
+                         [u'1', u'2'])
+        self.assertNotIn('@Media', container['Video'][0])
+
+
 class TestForecastIO(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
@@ -141,6 +446,79 @@ class TestForecastIO(unittest.TestCase):
             Forecast(config)
 
 
+class OfflineForecast(Forecast):
+    """
+    Forecast answered from a canned forecast.io response
+    """
+    calls = list()
+    offline = False
+
+    def _get_forecast_io(self):
+        if OfflineForecast.offline:
+            raise IOError('forecast.io unreachable')
+        OfflineForecast.calls.append(self.units)
+        return type('FakeForecast', (object,), dict(json=dict(
+            currently=dict(summary=u'Clear', icon=u'clear-day',
+                           temperature=61.2, apparentTemperature=60.7,
+                           windSpeed=3.1, windBearing=270),
+            minutely=dict(summary=u'Clear for the hour.'),
+            hourly=dict(summary=u'Clear throughout the day.'),
+            daily=dict(data=[dict(sunriseTime=1412258400,
+                                  sunsetTime=1412300400)]))))
+
+
+class TestForecastCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.config = dict(Forecast_io_API_key='key', Latitude=37.8,
+                           Longitude=-122.4, refresh_interval=600,
+                           cache_file=os.path.join(self.tempdir, 'fc.json'))
+        del OfflineForecast.calls[:]
+        OfflineForecast.offline = False
+
+    def tearDown(self):
+        OfflineForecast.offline = False
+        shutil.rmtree(self.tempdir)
+
+    def test_persisted_across_restarts(self):
+        data = OfflineForecast(self.config).get_data()
+        self.assertEqual(data['current_temp'], u'61\xb0')
+        self.assertEqual(OfflineForecast.calls, ['us'])
+        # a restart reuses the saved forecast without calling forecast.io
+        restarted = OfflineForecast(self.config)
+        self.assertEqual(OfflineForecast.calls, ['us'])
+        self.assertEqual(restarted.get_data()['updated_at'],
+                         data['updated_at'])
+        # but not one fetched for other settings
+        self.config['units'] = 'si'
+        OfflineForecast(self.config)
+        self.assertEqual(OfflineForecast.calls, ['us', 'si'])
+
+    def test_stale_forecast_used_while_offline(self):
+        forecast = OfflineForecast(self.config)
+        forecast._write_cache_file(forecast.forecast, time.time() - 3600)
+        OfflineForecast.offline = True
+        self.assertGreaterEqual(OfflineForecast(self.config).age(), 3600)
+        self.config['Forecast_io_API_key'] = 'otherkey'
+        with self.assertRaises(IOError):
+            OfflineForecast(self.config)
+
+    def test_refreshed_once_across_processes(self):
+        forecast = OfflineForecast(self.config)
+        other_process = OfflineForecast(self.config)
+        forecast._write_cache_file(forecast.forecast, time.time() - 3600)
+        forecast.updated_at = time.time() - 3600
+        other_process.updated_at = time.time() - 3600
+        self.assertTrue(forecast.refresh(max_age=300))
+        self.assertEqual(len(OfflineForecast.calls), 2)
+        # the other process finds the new forecast in the cache file
+        self.assertFalse(other_process.refresh(max_age=300))
+        self.assertEqual(len(OfflineForecast.calls), 2)
+        self.assertEqual(other_process.updated_at, forecast.updated_at)
+        # values are the same in every process, whatever the forecast's age
+        self.assertEqual(other_process.get_data(), forecast.get_data())
+
+
 class TestServerSync(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
@@ -159,6 +537,1393 @@ class TestServerSync(unittest.TestCase):
         self.assertFalse(serversync.connection_status)
 
 
+class TestCrashPlanLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, 'app.log')
+        self.write('w', 'scanning = false\n', 'backupEnabled = true\n',
+                   'x' * 40 + '\n', 'scanning = true\n', 'y' * 40 + '\n')
+        self.log_tail = LogTail(self.log_path, CheckCrashPlan.status_pattern,
+                                CheckCrashPlan.status_keys, block_size=16)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, mode, *lines):
+        with open(self.log_path, mode) as log_file:
+            log_file.write(''.join(lines))
+
+    def test_latest_values_read_backwards(self):
+        self.assertEqual(self.log_tail.update(),
+                         dict(scanning='true', backupenabled='true'))
+
+    def test_appended_lines(self):
+        self.log_tail.update()
+        self.write('a', 'backupenabled = fal')
+        self.assertEqual(self.log_tail.update()['backupenabled'], 'true')
+        self.write('a', 'se\n')
+        self.assertEqual(self.log_tail.update()['backupenabled'], 'false')
+
+    def test_truncated_and_rotated(self):
+        self.log_tail.update()
+        self.write('w', 'scanning = false\n')
+        self.assertEqual(self.log_tail.update(),
+                         dict(scanning='false', backupenabled='true'))
+        os.rename(self.log_path, self.log_path + '.1')
+        self.write('w', 'scanning = true\n', 'backupenabled = false\n',
+                   'z' * 80 + '\n')
+        self.assertEqual(self.log_tail.update(),
+                         dict(scanning='true', backupenabled='false'))
+
+    def test_status(self):
+        crashplan = CheckCrashPlan(dict(logfile_path=self.log_path))
+        self.assertEqual(crashplan.connection_status, 'BackupServerActive')
+        self.write('a', 'scanning = false\n')
+        self.assertEqual(crashplan.connection_status, 'Waiting')
+
+
+class TestInstrumentation(unittest.TestCase):
+    @staticmethod
+    @instrument('debug')
+    def instrumented(fail=False):
+        if fail:
+            raise ValueError('failed')
+        return 'result'
+
+    def test_calls_and_errors_counted(self):
+        before = get_stats()['test_serverstatus.instrumented']
+        self.assertEqual(self.instrumented(), 'result')
+        with self.assertRaises(ValueError):
+            self.instrumented(fail=True)
+        after = get_stats()['test_serverstatus.instrumented']
+        self.assertEqual(after['calls'], before['calls'] + 2)
+        self.assertEqual(after['errors'], before['errors'] + 1)
+
+    def test_percentiles(self):
+        function_stats = FunctionStats()
+        for elapsed_ms in range(1, 101):
+            function_stats.record(float(elapsed_ms))
+        summary = function_stats.summary()
+        self.assertEqual(summary['calls'], 100)
+        self.assertEqual(summary['max_ms'], 100)
+        # within one bucket (19%) of the exact percentile
+        for pct in (50, 95, 99):
+            self.assertLessEqual(abs(summary['p{}_ms'.format(pct)] - pct),
+                                 pct * 0.19)
+
+    def test_stats_api(self):
+        stats = APIFunctions(dict()).stats()
+        self.assertIn('functions', stats)
+        self.assertIn('http', stats)
+
+
+class TestMountIndex(unittest.TestCase):
+    mountinfo = '\n'.join([
+        '1 0 8:1 / / rw,relatime - ext4 /dev/sda1 rw',
+        '2 1 0:5 / /proc rw - proc proc rw',
+        '3 1 8:1 /srv /mnt/bind rw - ext4 /dev/sda1 rw',
+        '4 1 8:17 / /mnt/media\\040files rw shared:1 - xfs /dev/sdb1 rw',
+        '5 1 8:33 / /mnt/over rw - ext4 /dev/sdc1 rw',
+        '6 5 0:40 / /mnt/over rw - tmpfs tmpfs rw',
+        'malformed line'])
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'mountinfo')
+        self.write(self.mountinfo)
+        self.index = MountIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tempdir)
+
+    def write(self, text):
+        with open(self.path, 'w') as mountinfo:
+            mountinfo.write(text)
+
+    def test_parse(self):
+        mounts = parse_mountinfo(self.mountinfo)
+        self.assertEqual(len(mounts), 6)
+        self.assertEqual(mounts[2].root, '/srv')
+        self.assertEqual(mounts[3].mountpoint, '/mnt/media files')
+        self.assertEqual(mounts[3].fstype, 'xfs')
+        self.assertEqual(mounts[3].source, '/dev/sdb1')
+
+    def test_block_devices_deduplicated(self):
+        # the bind mount of sda1 and the overmounted sdc1 aren't counted
+        self.assertEqual([mount.mountpoint for mount in
+                          self.index.block_devices()],
+                         ['/', '/mnt/media files'])
+        self.assertEqual(self.index.visible()['/mnt/over'].fstype, 'tmpfs')
+
+    def test_cached_until_changed(self):
+        mounts = self.index.mounts()
+        self.write('1 0 8:1 / / rw - ext4 /dev/sda1 rw')
+        self.assertIs(self.index.mounts(), mounts)
+        self.index.invalidate()
+        self.assertEqual(len(self.index.mounts()), 1)
+
+    def test_storage(self):
+        self.write('\n'.join([
+            '1 0 8:1 / / rw - ext4 /dev/sda1 rw',
+            '2 1 8:1 /tmp {} rw - ext4 /dev/sda1 rw'.format(self.tempdir)]))
+        partitions = dict(Root='/', Temp=self.tempdir, Missing='/not/mounted')
+        storage = get_storage(partitions, mount_index=self.index)
+        self.assertEqual(storage['paths'].keys(), ['Root', 'Temp'])
+        # both mounts are the same filesystem, so it's only counted once
+        self.assertEqual(storage['total'], storage['paths']['Root'])
+        usage = get_partitions_usage(partitions, mount_index=self.index)
+        self.assertEqual(sorted(usage), ['Root', 'Temp'])
+
+    def test_storage_unresponsive(self):
+        self.write('\n'.join([
+            '1 0 8:1 / / rw - ext4 /dev/sda1 rw',
+            '2 1 0:50 / /mnt/nas rw - nfs nas:/export rw']))
+        prober = HungMountProber(timeout=0.05)
+        partitions = dict(Root='/', NAS='/mnt/nas')
+        storage = get_storage(partitions, mount_index=self.index,
+                              prober=prober)
+        self.assertEqual(storage['paths']['NAS'], dict(unresponsive=True))
+        self.assertEqual(storage['total'], storage['paths']['Root'])
+        usage = get_partitions_usage(partitions, mount_index=self.index,
+                                     prober=prober)
+        self.assertEqual(usage.keys(), ['Root'])
+        with app.test_request_context():
+            html = render_template('storage.html', values=storage)
+        self.assertIn('Unresponsive', html)
+        HungMountProber.nas_answering.set()
+        prober.stop()
+
+
+class HungMountProber(MountProber):
+    """
+    Prober whose probes of /mnt/nas* block until the NAS is answering
+    """
+    nas_answering = threading.Event()
+    probes_started = list()
+
+    @classmethod
+    def _read_usage(cls, path):
+        if path.startswith('/mnt/nas'):
+            cls.probes_started.append(path)
+            cls.nas_answering.wait()
+        return MountProber._read_usage('/')
+
+
+class TestMountProber(unittest.TestCase):
+    root = Mount(mount_id=1, parent_id=0, device='8:1', root='/',
+                 mountpoint='/', fstype='ext4', source='/dev/sda1')
+    nas = Mount(mount_id=2, parent_id=1, device='0:50', root='/',
+                mountpoint='/mnt/nas', fstype='nfs', source='nas:/export')
+
+    def setUp(self):
+        HungMountProber.nas_answering.clear()
+        del HungMountProber.probes_started[:]
+        self.prober = HungMountProber(timeout=0.05, interval=0.05)
+
+    def tearDown(self):
+        HungMountProber.nas_answering.set()
+        self.prober.stop()
+
+    def test_unresponsive_mount_quarantined(self):
+        self.assertEqual(self.prober.disk_usage(self.root).total,
+                         MountProber._read_usage('/').total)
+        start = time.time()
+        self.assertEqual(self.prober.disk_usage(self.nas), UNRESPONSIVE)
+        self.assertEqual(self.prober.quarantined, ['/mnt/nas'])
+        # quarantined mounts answer straight away, without a new probe
+        self.assertEqual(self.prober.disk_usage(self.nas), UNRESPONSIVE)
+        self.assertLess(time.time() - start, 0.5)
+        time.sleep(0.2)
+        # background probes wait on the hung probe instead of adding more
+        self.assertEqual(HungMountProber.probes_started, ['/mnt/nas'])
+        HungMountProber.nas_answering.set()
+        for _ in range(40):
+            if not self.prober.quarantined:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.prober.quarantined, [])
+        self.assertNotEqual(self.prober.disk_usage(self.nas), UNRESPONSIVE)
+
+    def test_hung_mounts_share_deadline(self):
+        prober = HungMountProber(timeout=0.2)
+        nas_backup = self.nas._replace(mount_id=3, device='0:51',
+                                       mountpoint='/mnt/nas-backup')
+        start = time.time()
+        try:
+            usage = prober.disk_usages([self.nas, self.root, nas_backup,
+                                        self.root])
+            self.assertLess(time.time() - start, 0.35)
+            self.assertEqual(prober.quarantined,
+                             ['/mnt/nas', '/mnt/nas-backup'])
+        finally:
+            prober.stop()
+            HungMountProber.nas_answering.set()
+            # let its background probes finish before the next test
+            prober.join(5)
+        self.assertEqual(usage['0:50'], UNRESPONSIVE)
+        self.assertEqual(usage['0:51'], UNRESPONSIVE)
+        self.assertEqual(usage['8:1'].total, MountProber._read_usage('/').total)
+
+
+class TestNetworkSpeed(unittest.TestCase):
+    def test_fractional_seconds(self):
+        # 1 MB sent in half a second is 16 Mbps
+        speed = calculate_network_speed(10.0, [0, 0], 10.5, [1048576, 0])
+        self.assertAlmostEqual(speed['up'], 16.0)
+        self.assertEqual(speed['down'], 0)
+
+    def test_counter_reset(self):
+        speed = calculate_network_speed(0.0, [500, 500], 1.0, [100, 100])
+        self.assertEqual(speed, dict(up=0, down=0))
+
+    def test_sampler_without_samples(self):
+        sampler = NetworkSpeedSampler(interval=1, window=5)
+        self.assertEqual(sampler.get_speed(), dict(up=0.0, down=0.0))
+
+    def test_sampler_rolling_window(self):
+        sampler = NetworkSpeedSampler(interval=1, window=2)
+        for _ in range(4):
+            sampler.tick()
+        self.assertEqual(len(sampler._samples), 3)
+        self.assertTrue(isinstance(sampler.get_speed()['down'], float))
+
+
+class TestLatencyProber(unittest.TestCase):
+    def test_summarize_latency(self):
+        stats = summarize_latency([10.0, None, 14.0, 12.0])
+        self.assertEqual(stats['min'], 10.0)
+        self.assertEqual(stats['max'], 14.0)
+        self.assertAlmostEqual(stats['avg'], 12.0)
+        self.assertAlmostEqual(stats['jitter'], 3.0)
+        self.assertEqual(stats['loss'], 25.0)
+        self.assertEqual(stats['samples'], 4)
+
+    def test_summarize_no_replies(self):
+        stats = summarize_latency([None, None])
+        self.assertEqual(stats['avg'], 0.0)
+        self.assertEqual(stats['loss'], 100.0)
+
+    def test_tcp_probe(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        port = listener.getsockname()[1]
+        prober = LatencyProber(targets=['127.0.0.1'], port=port, window=2)
+        for _ in range(3):
+            prober.tick()
+        listener.close()
+        stats = prober.get_stats()
+        self.assertEqual(stats['samples'], 2)
+        self.assertEqual(stats['loss'], 0.0)
+
+    def test_icmp_kept_while_network_unreachable(self):
+        prober = LatencyProber(targets=['127.0.0.1'], mode='icmp', port=1)
+        fake_socket = imp.new_module('socket')
+        fake_socket.__dict__.update(socket.__dict__)
+        try:
+            sysinfo.socket = fake_socket
+            fake_socket.socket = UnreachableSocket
+            prober.tick()
+            self.assertEqual(prober.mode, 'icmp')
+            fake_socket.socket = ForbiddenSocket
+            prober.tick()
+            self.assertEqual(prober.mode, 'tcp')
+        finally:
+            sysinfo.socket = socket
+        self.assertEqual(prober.get_stats()['loss'], 100.0)
+
+
+class UnreachableSocket(object):
+    def __init__(self, *args):
+        pass
+
+    def sendto(self, packet, address):
+        raise socket.error(errno.ENETUNREACH, 'Network is unreachable')
+
+    def close(self):
+        pass
+
+
+class ForbiddenSocket(object):
+    def __init__(self, *args):
+        raise socket.error(errno.EACCES, 'Permission denied')
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def loader(self):
+        self.calls.append(None)
+        return len(self.calls)
+
+    def test_fresh_value_cached(self):
+        cache = TTLCache(dict(default=60))
+        self.assertEqual(cache.get('key', self.loader), 1)
+        self.assertEqual(cache.get('key', self.loader), 1)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_stale_value_served_while_refreshing(self):
+        cache = TTLCache(dict(key=0.01))
+        self.assertEqual(cache.get('key', self.loader), 1)
+        time.sleep(0.02)
+        # expired value is returned right away, refresh runs in background
+        self.assertEqual(cache.get('key', self.loader), 1)
+        for _ in range(100):
+            if cache._entries['key'][0] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache._entries['key'][0], 2)
+
+    def test_zero_ttl_disables_cache(self):
+        cache = TTLCache(dict(key=0))
+        cache.get('key', self.loader)
+        cache.get('key', self.loader)
+        self.assertEqual(len(self.calls), 2)
+
+
+class CountingThread(PeriodicThread):
+    def __init__(self):
+        PeriodicThread.__init__(self, 0.01, name='counting')
+        self.ticks = 0
+
+    def tick(self):
+        self.ticks += 1
+
+
+class TestPeriodicThread(unittest.TestCase):
+    def test_restarted_after_fork(self):
+        thread = CountingThread()
+        thread.ensure_running()
+        time.sleep(0.05)
+        pid = os.fork()
+        if pid == 0:
+            # the thread isn't running in the child until restarted
+            ticks = thread.ticks
+            time.sleep(0.05)
+            stopped = thread.ticks == ticks
+            thread.ensure_running()
+            time.sleep(0.05)
+            os._exit(0 if stopped and thread.ticks > ticks else 1)
+        deadline = time.time() + 5
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished or time.time() > deadline:
+                break
+            time.sleep(0.01)
+        thread.stop()
+        self.assertTrue(finished)
+        self.assertEqual(status, 0)
+
+    def test_func_called(self):
+        ticked = threading.Event()
+
+        def refresh():
+            ticked.set()
+
+        thread = PeriodicThread(0.01, refresh)
+        self.assertEqual(thread.name, 'refresh')
+        thread.ensure_running()
+        self.assertTrue(ticked.wait(1))
+        thread.stop()
+        thread.join(1)
+
+    def test_tick_without_func(self):
+        self.assertRaises(NotImplementedError, PeriodicThread(1).tick)
+
+
+class TestWorkQueue(unittest.TestCase):
+    def test_duplicate_keys_ignored(self):
+        release = threading.Event()
+        processed = []
+
+        def work(key):
+            release.wait(1)
+            processed.append(key)
+
+        queue = WorkQueue(work)
+        self.assertTrue(queue.put('/library/metadata/1/thumb/1'))
+        self.assertFalse(queue.put('/library/metadata/1/thumb/1'))
+        self.assertTrue(queue.put('/library/metadata/2/thumb/1'))
+        release.set()
+        queue.join()
+        self.assertEqual(processed, ['/library/metadata/1/thumb/1',
+                                     '/library/metadata/2/thumb/1'])
+        self.assertFalse(queue.is_pending('/library/metadata/1/thumb/1'))
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_and_open(self):
+        cache = ImageCache(self.directory)
+        entry = cache.put('plex/1412345678.jpg', 'jpeg data')
+        self.assertEqual(entry.size, 9)
+        self.assertEqual(cache.open('plex/1412345678.jpg').read(), 'jpeg data')
+        self.assertIs(cache.get('plex/missing.jpg'), None)
+        # no temporary files left behind
+        self.assertEqual(os.listdir(self.directory),
+                         [os.path.basename(entry.path)])
+
+    def test_least_recently_used_evicted(self):
+        cache = ImageCache(self.directory, max_bytes=20)
+        cache.put('first', 'x' * 10)
+        cache.put('second', 'x' * 10)
+        cache.get('first')
+        cache.put('third', 'x' * 10)
+        self.assertTrue(cache.contains('first'))
+        self.assertFalse(cache.contains('second'))
+        self.assertTrue(cache.contains('third'))
+        self.assertEqual(cache.total_bytes, 20)
+
+    def test_index_loaded_from_directory(self):
+        ImageCache(self.directory).put('cover1', 'x' * 10)
+        cache = ImageCache(self.directory)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('cover1').size, 10)
+        # digest of files from a previous run computed when requested
+        self.assertEqual(cache.get('cover1').digest,
+                         hashlib.sha1('x' * 10).hexdigest())
+
+    def test_leftovers_removed(self):
+        entry = ImageCache(self.directory).put('cover1', 'x' * 10)
+        for file_name in ('.tmp-crashed', '.tmp-writing', '1412345678.jpg',
+                          '1412345678.thumbnail', 'cover28102_145.jpg',
+                          'notes.txt'):
+            with open(os.path.join(self.directory, file_name), 'w') as f:
+                f.write('x')
+        an_hour_ago = time.time() - 3600
+        os.utime(os.path.join(self.directory, '.tmp-crashed'),
+                 (an_hour_ago, an_hour_ago))
+        cache = ImageCache(self.directory)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['.tmp-writing', os.path.basename(entry.path),
+                          'notes.txt'])
+
+
+class OfflineSubSonic(SubSonic):
+    """
+    SubSonic with cover art served from memory in place of a Subsonic server
+    """
+    def __init__(self, image_directory):
+        self.logger = logging.getLogger(__name__)
+        self._image_cache = ImageCache(image_directory)
+        self.requests = []
+        self.conn = self
+
+    def getCoverArt(self, aid, size=None):
+        self.requests.append((aid, size))
+        return StringIO('cover {} {}'.format(aid, size))
+
+
+class TestCoverArtCaching(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.subsonic = OfflineSubSonic(self.directory)
+        self.loads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self):
+        self.loads += 1
+        return 'jpeg data'
+
+    def test_subsonic_sizes_cached(self):
+        cover_art = self.subsonic.cover_art(28102, 145)
+        self.assertEqual(cover_art.load().read(), 'cover 28102 145')
+        self.assertTrue(cover_art.etag.startswith('subsonic-28102-145-'))
+        self.assertEqual(self.subsonic.cover_art(28102, 145).etag,
+                         cover_art.etag)
+        self.subsonic.cover_art(28102, 500)
+        self.assertEqual(self.subsonic.requests,
+                         [(28102, 145), (28102, 500)])
+
+    def cover_art_response(self, etag):
+        headers = {'If-None-Match': quote_etag(etag)}
+        with app.test_request_context('/img/subsonic', headers=headers):
+            return BACKENDCALLS._cover_art_response(
+                self.subsonic.cover_art(28102, 145), request)
+
+    def test_replaced_image_sent(self):
+        etag = self.subsonic.cover_art(28102, 145).etag
+        self.assertEqual(self.cover_art_response(etag).status_code, 304)
+        self.subsonic._image_cache.put('subsonic/cover28102_145', 'new cover')
+        resp = self.cover_art_response(etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], quote_etag(etag))
+        # an ETag for the same cover but other content isn't trusted
+        # without a cached copy to compare it with
+        shutil.rmtree(self.directory)
+        self.subsonic._image_cache = ImageCache(self.directory)
+        resp = self.cover_art_response('subsonic-28102-145-0123456789abcdef')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.subsonic.requests, [(28102, 145)] * 2)
+
+    def test_plex_unknown_cover(self):
+        plex = Plex.__new__(Plex)
+        plex._cover_mapping = dict()
+        plex._image_cache = ImageCache(self.directory)
+        api_functions = BACKENDCALLS.api_functions
+        BACKENDCALLS.api_functions = type('PlexCovers', (object,), dict(
+            _get_plex_cover_art=lambda _, args: plex.cover_art(**args)))()
+        client = app.test_client()
+        try:
+            resp = client.get('/img/plex?1412345678', headers={
+                'If-None-Match': '"plex-1412345678-0123456789abcdef"'})
+            self.assertEqual(resp.status_code, 404)
+            resp = client.get('/img/plex?1412345678')
+            self.assertEqual(resp.status_code, 404)
+            resp = client.get('/img/plex?1412345678&thumbnail=1')
+            self.assertEqual(resp.status_code, 404)
+        finally:
+            BACKENDCALLS.api_functions = api_functions
+
+    def test_not_modified(self):
+        cover_art = CoverArt(etag='subsonic-1-145-abc', last_modified=1e9,
+                             load=self.load)
+        headers = {'If-None-Match': '"subsonic-1-145-abc"'}
+        with app.test_request_context('/img/subsonic', headers=headers):
+            resp = BACKENDCALLS._cover_art_response(cover_art, request)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.loads, 0)
+        headers = {'If-Modified-Since': 'Sun, 09 Sep 2001 01:46:40 GMT'}
+        with app.test_request_context('/img/subsonic', headers=headers):
+            resp = BACKENDCALLS._cover_art_response(cover_art, request)
+        self.assertEqual(resp.status_code, 304)
+        with app.test_request_context('/img/subsonic'):
+            resp = BACKENDCALLS._cover_art_response(cover_art, request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['ETag'], '"subsonic-1-145-abc"')
+        self.assertIn('max-age', resp.headers['Cache-Control'])
+        self.assertEqual(self.loads, 1)
+
+    def test_placeholder_not_cacheable(self):
+        cover_art = CoverArt(etag=None, last_modified=None, load=self.load)
+        with app.test_request_context('/img/plex'):
+            resp = BACKENDCALLS._cover_art_response(cover_art, request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('ETag', resp.headers)
+        self.assertIn('no-cache', resp.headers['Cache-Control'])
+
+
+class FakeRawResponse(object):
+    closed = True
+    _connection = None
+
+
+class FakeUpstreamImage(object):
+    status_code = 206
+    headers = {'Content-Range': 'bytes 0-3/10', 'Content-Length': '4',
+               'Server': 'Plex'}
+
+    def __init__(self, method, headers):
+        self.method = method
+        self.request_headers = headers
+        self.raw = FakeRawResponse()
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(['jp', 'eg'])
+
+    def close(self):
+        self.closed = True
+
+
+class TestCoverArtStreaming(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        entry = ImageCache(self.directory).put('cover', '0123456789')
+        self.cover_art = CoverArt(etag='plex-1-abc', last_modified=entry.mtime,
+                                  load=lambda: None, path=entry.path)
+        self.image_config = app.config.get('IMAGE_CACHE')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        app.config['IMAGE_CACHE'] = self.image_config
+
+    def get(self, cover_art, method='GET', **headers):
+        with app.test_request_context('/img/plex', method=method,
+                                      headers=headers):
+            return BACKENDCALLS._cover_art_response(cover_art, request)
+
+    def test_whole_file(self):
+        resp = self.get(self.cover_art)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Length'], '10')
+        self.assertEqual(''.join(resp.response), '0123456789')
+
+    def test_byte_ranges(self):
+        resp = self.get(self.cover_art, Range='bytes=2-5')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(''.join(resp.response), '2345')
+        resp = self.get(self.cover_art, Range='bytes=-3')
+        self.assertEqual(''.join(resp.response), '789')
+        resp = self.get(self.cover_art, Range='bytes=20-30')
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp.headers['Content-Length'], '0')
+        # multiple ranges aren't served, so the whole image is sent
+        resp = self.get(self.cover_art, Range='bytes=0-1,4-5')
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('Content-Range', resp.headers)
+        self.assertEqual(''.join(resp.response), '0123456789')
+        # stale partial copy gets the whole image
+        resp = self.get(self.cover_art, Range='bytes=2-5',
+                        **{'If-Range': '"plex-1-old"'})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_head(self):
+        resp = self.get(self.cover_art, method='HEAD')
+        self.assertEqual(resp.headers['Content-Length'], '10')
+        self.assertEqual(list(resp.response), [])
+
+    def test_accel_redirect(self):
+        app.config['IMAGE_CACHE'] = dict(sendfile='x-accel-redirect',
+                                         sendfile_prefix='/cover-art/')
+        resp = self.get(self.cover_art)
+        self.assertEqual(resp.headers['X-Accel-Redirect'],
+                         '/cover-art/' + os.path.basename(self.cover_art.path))
+        self.assertEqual(list(resp.response), [])
+
+    def test_upstream_streamed(self):
+        requested = []
+
+        def upstream(method, headers):
+            requested.append(FakeUpstreamImage(method, headers))
+            return requested[-1]
+
+        cover_art = CoverArt(etag='plex-1-abc', last_modified=None,
+                             load=lambda: None, upstream=upstream)
+        resp = self.get(cover_art, Range='bytes=0-3')
+        upstream = requested[0]
+        self.assertEqual(upstream.request_headers, dict(Range='bytes=0-3'))
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 0-3/10')
+        self.assertNotIn('Server', resp.headers)
+        self.assertEqual(''.join(resp.response), 'jpeg')
+        resp.close()
+        self.assertTrue(upstream.closed)
+
+
+class FakeBatchFunctions(object):
+    def __init__(self):
+        self.release = threading.Event()
+        self.hung_calls = 0
+
+    def hung(self):
+        self.hung_calls += 1
+        self.release.wait(5)
+        return dict(hung=True)
+
+    def uptime(self):
+        return dict(uptime_formatted=dict(days='1 day', hours=None,
+                                          min='5 minutes'))
+
+    def ping(self):
+        return dict(ping='14')
+
+    def media(self):
+        return dict(summary='A bureaucrat in a retro-future world. ' * 50)
+
+    def broken(self):
+        raise ValueError('server error')
+
+    def _private(self):
+        return 'secret'
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.api_functions = BACKENDCALLS.api_functions
+        BACKENDCALLS.api_functions = FakeBatchFunctions()
+
+    def tearDown(self):
+        BACKENDCALLS.api_functions = self.api_functions
+
+    def test_sections_isolated(self):
+        batch = BACKENDCALLS.get_batch(['uptime', 'broken', 'nonexistent',
+                                        '_private', 'uptime'])
+        sections = batch['sections']
+        self.assertEqual(sorted(sections),
+                         ['_private', 'broken', 'nonexistent', 'uptime'])
+        self.assertEqual(sections['uptime']['status'], 'ok')
+        self.assertEqual(sections['uptime']['data'],
+                         FakeBatchFunctions().uptime())
+        self.assertEqual(sections['broken']['status'], 'error')
+        self.assertEqual(sections['broken']['error'], 'server error')
+        self.assertEqual(sections['nonexistent']['status'], 'not_found')
+        self.assertEqual(sections['_private']['status'], 'not_found')
+        self.assertNotIn('data', sections['_private'])
+        for section in sections.values():
+            self.assertIn('elapsed_ms', section)
+        self.assertIn('elapsed_ms', batch)
+
+    def test_render(self):
+        with app.test_request_context():
+            sections = BACKENDCALLS.get_batch(['uptime', 'ping'],
+                                              render=True)['sections']
+        self.assertIn('1 day', sections['uptime']['html'])
+        self.assertNotIn('data', sections['uptime'])
+        # no template for ping, so its data is returned
+        self.assertEqual(sections['ping']['data'], dict(ping='14'))
+
+    def test_timed_out_section_not_restarted(self):
+        batch_config = app.config.get('BATCH')
+        app.config['BATCH'] = dict(timeout=0.05)
+        try:
+            for _ in range(3):
+                sections = BACKENDCALLS.get_batch(['hung'])['sections']
+                self.assertEqual(sections['hung']['status'], 'timeout')
+            self.assertEqual(BACKENDCALLS.api_functions.hung_calls, 1)
+            BACKENDCALLS.api_functions.release.set()
+            app.config['BATCH'] = dict(timeout=5)
+            sections = BACKENDCALLS.get_batch(['hung'])['sections']
+        finally:
+            app.config['BATCH'] = batch_config
+        self.assertEqual(sections['hung']['data'], dict(hung=True))
+
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.api_functions = BACKENDCALLS.api_functions
+        BACKENDCALLS.api_functions = FakeBatchFunctions()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        BACKENDCALLS.api_functions = self.api_functions
+
+    def test_rendered_once_per_values(self):
+        cache = FragmentCache(lambda section, values: u'<p>{}\u2019</p>'
+                              .format(values['uptime']))
+        etag, html = cache.get('uptime', dict(uptime='1 day'))
+        self.assertEqual(html, '<p>1 day\xe2\x80\x99</p>')
+        self.assertEqual(cache.get('uptime', dict(uptime='1 day')),
+                         (etag, html))
+        self.assertEqual(cache.renders, 1)
+        new_etag, _ = cache.get('uptime', dict(uptime='2 days'))
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(cache.renders, 2)
+        # another section with the same values is its own fragment
+        self.assertNotEqual(cache.get('other', dict(uptime='2 days'))[0],
+                            new_etag)
+
+    def test_not_modified(self):
+        resp = self.client.get('/html/uptime')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('1 day', resp.data)
+        etag = resp.headers['ETag']
+        resp = self.client.get('/html/uptime',
+                               headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, '')
+        self.assertEqual(resp.headers['ETag'], etag)
+        self.assertEqual(resp.headers['Cache-Control'], 'no-cache')
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.api_functions = BACKENDCALLS.api_functions
+        BACKENDCALLS.api_functions = FakeBatchFunctions()
+        self.client = app.test_client()
+        self.static_folder = app.static_folder
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        BACKENDCALLS.api_functions = self.api_functions
+        app.static_folder = self.static_folder
+        shutil.rmtree(self.tempdir)
+
+    @staticmethod
+    def gunzip(data):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(parse_accept_header('gzip, deflate'),
+                                   ('br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate(parse_accept_header('gzip, br'),
+                                   ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate(parse_accept_header('gzip;q=0, *;q=0.5'),
+                                   ('gzip',)), None)
+        self.assertEqual(negotiate(parse_accept_header('*'), ('gzip',)),
+                         'gzip')
+        self.assertEqual(negotiate(parse_accept_header(''), ('gzip',)), None)
+
+    def test_compressed_once_per_body(self):
+        cache = CompressionCache(min_size=10)
+        body = 'x' * 100
+        compressed, encoding = cache.get('media', body, 'gzip')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(self.gunzip(compressed), body)
+        self.assertIs(cache.get('media', 'x' * 100, 'gzip')[0], compressed)
+        self.assertEqual(self.gunzip(cache.get('media', 'y' * 100,
+                                               'gzip')[0]), 'y' * 100)
+        self.assertEqual(cache.get('media', 'short', 'gzip'),
+                         ('short', None))
+        self.assertEqual(cache.get('media', body, None), (body, None))
+
+    def test_least_recently_used_dropped(self):
+        cache = CompressionCache(min_size=10, max_entries=2)
+        media = cache.get('media', 'x' * 100, 'gzip')[0]
+        cache.get('ping', 'y' * 100, 'gzip')
+        self.assertIs(cache.get('media', 'x' * 100, 'gzip')[0], media)
+        cache.get('storage', 'z' * 100, 'gzip')
+        self.assertEqual(sorted(cache._entries), ['media', 'storage'])
+
+    def test_batches_cached_apart(self):
+        headers = {'Accept-Encoding': 'gzip'}
+        self.client.get('/api/batch?sections=media,uptime', headers=headers)
+        self.client.get('/api/batch?sections=media,nonexistent',
+                        headers=headers)
+        self.assertEqual(
+            sorted(key for key in BACKENDCALLS._compression_cache._entries if
+                   key.startswith('batch')),
+            ['batch/api?media', 'batch/api?media,uptime'])
+
+    def test_html_etag_per_encoding(self):
+        compression_cache = BACKENDCALLS._compression_cache
+        BACKENDCALLS._compression_cache = CompressionCache(min_size=10)
+        self.addCleanup(setattr, BACKENDCALLS, '_compression_cache',
+                        compression_cache)
+        gzip = {'Accept-Encoding': 'gzip'}
+        plain = self.client.get('/html/uptime')
+        resp = self.client.get('/html/uptime', headers=gzip)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        etag = resp.headers['ETag']
+        self.assertEqual(etag, plain.headers['ETag'][:-1] + '-gzip"')
+        resp = self.client.get('/html/uptime',
+                               headers=dict(gzip, **{'If-None-Match': etag}))
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        # the identity body's ETag doesn't validate the gzip body
+        resp = self.client.get('/html/uptime', headers=dict(
+            gzip, **{'If-None-Match': plain.headers['ETag']}))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_api_and_html(self):
+        plain = self.client.get('/api/media')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+        resp = self.client.get('/api/media',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.gunzip(resp.data), plain.data)
+        self.assertLess(len(resp.data), len(plain.data))
+        # too small to be worth compressing
+        resp = self.client.get('/api/ping',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_precompressed_static(self):
+        os.mkdir(os.path.join(self.tempdir, 'js'))
+        script = 'function load_sections() {}\n' * 100
+        with open(os.path.join(self.tempdir, 'js', 'app.js'), 'w') as js:
+            js.write(script)
+        written = precompress_static(self.tempdir)
+        self.assertIn(os.path.join(self.tempdir, 'js', 'app.js.gz'), written)
+        self.assertEqual(precompress_static(self.tempdir), [])
+        app.static_folder = self.tempdir
+        plain = self.client.get('/static/js/app.js')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.data, script)
+        plain.close()
+        resp = self.client.get('/static/js/app.js',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.mimetype, plain.mimetype)
+        self.assertEqual(self.gunzip(resp.data), script)
+        resp.close()
+
+
+class SlowAPIFunctions(APIFunctions):
+    def _load_service(self, attrib, name, config_key, service_class):
+        if attrib == 'plex':
+            time.sleep(0.3)
+        return APIFunctions._load_service(self, attrib, name, config_key,
+                                          service_class)
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.warmup = BACKENDCALLS._warmup
+        self.client = app.test_client()
+
+    def tearDown(self):
+        BACKENDCALLS._warmup = self.warmup
+
+    def test_started_after_fork(self):
+        started = list()
+        BACKENDCALLS.start_warmup = lambda: started.append(os.getpid())
+        self.addCleanup(delattr, BACKENDCALLS, 'start_warmup')
+        gunicorn_conf = imp.load_source('gunicorn_conf', os.path.join(
+            app.config['APPLOCATION'], 'gunicorn.conf.py'))
+        gunicorn_conf.post_fork(None, None)
+        self.assertEqual(started, [os.getpid()])
+
+    def test_timings(self):
+        warmup = WarmUp(SlowAPIFunctions(dict()),
+                        sections=['system_info', 'storage'])
+        self.assertEqual(warmup.status()['state'], 'pending')
+        BACKENDCALLS._warmup = warmup
+        resp = self.client.get('/ready')
+        self.assertEqual(resp.status_code, 503)
+        warmup.start()
+        time.sleep(0.1)
+        status = warmup.status()
+        self.assertEqual(status['state'], 'warming')
+        self.assertEqual(status['services']['plex'], dict(status='pending'))
+        warmup.join(5)
+        resp = self.client.get('/ready')
+        self.assertEqual(resp.status_code, 200)
+        status = json.loads(resp.data)
+        self.assertEqual(status['state'], 'ready')
+        self.assertEqual(status['services']['plex']['status'],
+                         'not_configured')
+        self.assertGreaterEqual(status['services']['plex']['elapsed_ms'],
+                                300)
+        self.assertEqual(status['sections']['system_info']['status'], 'ok')
+        # no PARTITIONS in the config
+        self.assertEqual(status['sections']['storage']['status'], 'error')
+        self.assertIn('elapsed_ms', status['sections']['storage'])
+        # history is recorded from warm-up on, without waiting for a scrape
+        history = warmup.api_functions._history
+        for _ in range(100):
+            if history.metrics:
+                break
+            time.sleep(0.05)
+        self.assertIn('load_1m', history.metrics)
+        warmup.api_functions._metrics_collector.stop()
+        warmup.api_functions._metrics_collector.join(5)
+
+    def test_not_started_while_testing(self):
+        BACKENDCALLS._warmup = None
+        resp = self.client.get('/ready')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['state'], 'disabled')
+        self.assertIsNone(BACKENDCALLS._warmup)
+
+    def test_ready_after_timeout(self):
+        warmup = WarmUp(SlowAPIFunctions(dict()), sections=[], timeout=0.05)
+        warmup.start()
+        time.sleep(0.1)
+        self.assertTrue(warmup.ready)
+        self.assertEqual(warmup.status()['state'], 'timed_out')
+        warmup.join(5)
+        self.assertEqual(warmup.status()['state'], 'ready')
+
+
+class FakeMetricsCollector(object):
+    def latest_samples(self):
+        return [('load_average', dict(period='1m'), 0.5)]
+
+
+class FakeCollectedFunctions(FakeBatchFunctions):
+    plex = None
+
+    def __init__(self):
+        FakeBatchFunctions.__init__(self)
+        self.history = HistoryStore(raw_points=10, minute_points=5,
+                                    hour_points=3)
+        self.history.record(time.time(), dict(load_1m=0.5))
+
+    def forecast(self):
+        raise ValueError('forecast.io unreachable')
+
+    def _get_metrics_collector(self):
+        return FakeMetricsCollector()
+
+    def _get_history(self):
+        return self.history
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+        self.collector_config = app.config.get('COLLECTOR')
+        self.api_functions = BACKENDCALLS.api_functions
+
+    def tearDown(self):
+        app.config['COLLECTOR'] = self.collector_config
+        BACKENDCALLS.api_functions = self.api_functions
+        BACKENDCALLS._snapshot_reader = None
+        shutil.rmtree(self.directory)
+
+    def test_versions(self):
+        writer = SnapshotWriter(self.path, size=16)
+        reader = SnapshotReader(self.path)
+        self.assertIsNone(reader.read())
+        self.assertRaises(CollectorRunningError, SnapshotWriter, self.path)
+        self.assertEqual(writer.publish(json.dumps(dict(value=1))), 1)
+        snapshot = reader.read()
+        self.assertEqual(snapshot, dict(value=1))
+        # decoded once per version
+        self.assertIs(reader.read(), snapshot)
+        # grows past the size readers have mapped
+        large = dict(value='x' * 100000)
+        self.assertEqual(writer.publish(json.dumps(large)), 2)
+        self.assertEqual(reader.read(), large)
+        self.assertEqual(reader.version, 2)
+        writer.close()
+        # a restarted collector carries on from the last version
+        writer = SnapshotWriter(self.path)
+        self.assertEqual(writer.publish(json.dumps(dict(value=3))), 3)
+        self.assertEqual(reader.read(), dict(value=3))
+        # an unreadable snapshot leaves the one before
+        self.assertEqual(writer.publish('{"value": '), 4)
+        self.assertEqual(reader.read(), dict(value=3))
+        self.assertEqual(reader.version, 4)
+        writer.close()
+
+    def test_workers_read_snapshot(self):
+        app.config['COLLECTOR'] = dict(enabled=True, path=self.path,
+                                       max_age=60)
+        writer = SnapshotWriter(self.path)
+        collector = Collector(FakeCollectedFunctions(), writer,
+                              sections=['ping', 'broken', 'forecast'])
+        snapshot = collector.collect()
+        self.assertEqual(snapshot['sections']['broken'],
+                         dict(status='error', error='server error'))
+        writer.publish(json.dumps(snapshot))
+        BACKENDCALLS.api_functions = None
+        self.assertEqual(BACKENDCALLS.get_data('ping'),
+                         (dict(ping='14'), 200))
+        # never collected, so offline rather than an error
+        self.assertEqual(BACKENDCALLS.get_data('broken'),
+                         (dict(offline=True, error='server error'), 503))
+        resp = app.test_client().get('/html/forecast')
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Forecast unavailable', resp.data)
+        # a section that fails after being collected keeps its last data
+        collector.api_functions.ping = collector.api_functions.broken
+        snapshot = collector.collect()
+        self.assertEqual(snapshot['sections']['ping']['status'], 'stale')
+        writer.publish(json.dumps(snapshot))
+        resp = app.test_client().get('/api/ping')
+        self.assertEqual(json.loads(resp.data), dict(ping='14'))
+        self.assertEqual(resp.headers['Warning'], '110 - "Response is Stale"')
+        BACKENDCALLS.api_functions = FakeBatchFunctions()
+        output = BACKENDCALLS.get_batch(['ping'])['sections']['ping']
+        self.assertEqual((output['data'], output['stale']),
+                         (dict(ping='14'), True))
+        # sections not collected, or a stale snapshot, are computed locally
+        self.assertEqual(BACKENDCALLS.get_data('uptime')[0],
+                         FakeBatchFunctions().uptime())
+        snapshot['collected_at'] -= 120
+        snapshot['sections']['ping']['data'] = dict(ping='99')
+        writer.publish(json.dumps(snapshot))
+        self.assertEqual(BACKENDCALLS.get_data('ping')[0], dict(ping='14'))
+        writer.close()
+
+    def test_workers_read_metrics(self):
+        app.config['COLLECTOR'] = dict(enabled=True, path=self.path,
+                                       max_age=60)
+        client = app.test_client()
+        # workers don't collect metrics themselves, even without a snapshot
+        BACKENDCALLS.api_functions = None
+        self.assertEqual(client.get('/metrics').status_code, 503)
+        self.assertEqual(client.get('/api/history').status_code, 503)
+        writer = SnapshotWriter(self.path)
+        collector = Collector(FakeCollectedFunctions(), writer,
+                              sections=['ping'])
+        writer.publish(json.dumps(collector.collect()))
+        resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('serverstatus_load_average{period="1m"} 0.5',
+                      resp.data)
+        resp = client.get('/api/history')
+        self.assertEqual(json.loads(resp.data), dict(metrics=['load_1m']))
+        resp = client.get('/api/history?metric=load_1m&window=60')
+        self.assertEqual(json.loads(resp.data)['summary']['avg'], 0.5)
+        writer.close()
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = '<MediaContainer size="0"></MediaContainer>'
+        if self.path.startswith('/photo'):
+            # a slow image, the second half arrives later
+            self.send_response(200)
+            self.send_header('Content-Length', '131072')
+            self.end_headers()
+            self.wfile.write('\xff' * 65536)
+            self.wfile.flush()
+            time.sleep(0.5)
+            self.wfile.write('\xff' * 65536)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    # keep-alive connections left open don't hold up shutdown
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class TestPooledHTTPClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        client = PooledHTTPClient(self.base_url)
+        for _ in range(3):
+            resp = client.get('/status/sessions')
+            self.assertIn('MediaContainer', resp.content)
+        self.assertEqual(client.stats, dict(opened=1, reused=2))
+
+    def test_aborted_stream_not_reused(self):
+        client = PooledHTTPClient(self.base_url, max_connections=1)
+        cover_art = CoverArt(
+            etag=None, last_modified=None, load=lambda: None,
+            upstream=lambda method, headers: client.request(
+                method, '/photo/thumb', stream=True, headers=headers))
+        with app.test_request_context('/img/plex'):
+            resp = BACKENDCALLS._cover_art_response(cover_art, request)
+        # the browser goes away after the first chunk
+        self.assertEqual(len(next(iter(resp.response))), 65536)
+        resp.close()
+        resp = client.get('/status/sessions')
+        self.assertIn('MediaContainer', resp.content)
+
+    def test_pool_timeout(self):
+        client = PooledHTTPClient(self.base_url, max_connections=1,
+                                  pool_timeout=0.1)
+        resp = client.get('/status/sessions', stream=True)
+        # the only connection is held by the unread response
+        self.assertRaises(requests.ConnectionError, client.get,
+                          '/status/sessions')
+        self.assertIn('MediaContainer', resp.content)
+        self.assertIn('MediaContainer', client.get('/status/sessions').content)
+
+    def test_failed_connections_released(self):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        client = PooledHTTPClient(
+            'http://127.0.0.1:{}'.format(closed.getsockname()[1]),
+            max_connections=1)
+        closed.close()
+        errors = list()
+
+        def request_refused():
+            for _ in range(3):
+                try:
+                    client.get('/status/sessions')
+                except (requests.ConnectionError, ProtocolError) as err:
+                    errors.append(err)
+
+        # a pool slot lost to each failure would block the second request
+        requester = threading.Thread(target=request_refused)
+        requester.daemon = True
+        requester.start()
+        requester.join(5)
+        self.assertEqual(len(errors), 3)
+
+
+class TestBroadcast(unittest.TestCase):
+    def setUp(self):
+        self.broadcaster = Broadcaster(max_queued=2)
+        self.data = dict(system_info='{"html": "<div></div>"}')
+        self.poller = SnapshotPoller(self.broadcaster, self.data.get,
+                                     dict(system_info=0))
+
+    def test_nothing_collected_without_subscribers(self):
+        self.poller.tick()
+        self.assertEqual(self.broadcaster.latest(), [])
+
+    def test_only_changes_published(self):
+        subscription = self.broadcaster.subscribe()
+        self.poller.tick()
+        self.poller.tick()
+        self.assertEqual(subscription.qsize(), 1)
+        self.data['system_info'] = '{"html": "<div>changed</div>"}'
+        self.poller.tick()
+        self.assertEqual(subscription.qsize(), 2)
+        self.assertEqual(self.broadcaster.latest(),
+                         [(2, 'system_info', self.data['system_info'])])
+
+    def test_slow_subscriber_dropped(self):
+        subscription = self.broadcaster.subscribe()
+        for version in range(3):
+            self.broadcaster.publish('ping', str(version))
+        self.assertEqual(self.broadcaster.subscriber_count, 0)
+        self.assertTrue(subscription.closed)
+
+    def test_dropped_stream_ends(self):
+        broadcaster = BACKENDCALLS.broadcaster
+        poller = BACKENDCALLS._snapshot_poller
+        BACKENDCALLS.broadcaster = self.broadcaster
+        BACKENDCALLS._snapshot_poller = self.poller
+        # the poller isn't needed to publish
+        self.poller._launched = True
+        try:
+            resp = app.test_client().get('/stream', buffered=False)
+            events = iter(resp.response)
+            for version in range(3):
+                self.broadcaster.publish('ping', str(version))
+            # the latest data, then the stream ends rather than keep sending
+            # keep-alives
+            self.assertEqual(list(events),
+                             ['id: 3\nevent: ping\ndata: 2\n\n'])
+            resp.close()
+        finally:
+            BACKENDCALLS.broadcaster = broadcaster
+            BACKENDCALLS._snapshot_poller = poller
+
+
+class FakeSampler(object):
+    def __init__(self, result):
+        self.result = result
+
+    def __call__(self):
+        return self
+
+    def get_rates(self):
+        return self.result
+
+    def get_all_stats(self):
+        return self.result
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.apifunctions = APIFunctions(dict(PARTITIONS=dict(Root='/')))
+        self.apifunctions._get_network_sampler = FakeSampler(
+            dict(sent=1024.0, received=2048.0))
+        self.apifunctions._get_latency_prober = FakeSampler({'8.8.8.8': dict(
+            min=10.0, avg=12.5, max=20.0, mdev=1.0, jitter=2.0, loss=25.0,
+            samples=4)})
+        self.apifunctions.services = lambda: OrderedDict([
+            ('plex', dict(text='Online')), ('subsonic', dict(text='Offline'))])
+        self.collector = MetricsCollector(self.apifunctions, interval=60)
+
+    def tearDown(self):
+        self.collector.stop()
+
+    def test_format(self):
+        text = format_metrics([
+            ('service_up', dict(service='a"b'), 1),
+            ('memory_total_bytes', None, 1024)])
+        self.assertEqual(text.splitlines(), [
+            '# HELP serverstatus_memory_total_bytes Total physical memory',
+            '# TYPE serverstatus_memory_total_bytes gauge',
+            'serverstatus_memory_total_bytes 1024.0',
+            '# HELP serverstatus_service_up Whether the service is online',
+            '# TYPE serverstatus_service_up gauge',
+            'serverstatus_service_up{service="a\\"b"} 1.0'])
+
+    def test_render_from_snapshot(self):
+        text = self.collector.render()
+        self.assertIn('serverstatus_network_receive_bytes_per_second 2048.0',
+                      text)
+        self.assertIn('serverstatus_ping_rtt_seconds{stat="avg",'
+                      'target="8.8.8.8"} 0.0125', text)
+        self.assertIn('serverstatus_ping_loss_ratio{target="8.8.8.8"} 0.25',
+                      text)
+        self.assertIn('serverstatus_service_up{service="subsonic"} 0.0', text)
+        self.assertIn('serverstatus_partition_size_bytes{mountpoint="/",'
+                      'partition="Root"}', text)
+        # scrapes read the snapshot instead of collecting again
+        self.apifunctions.services = None
+        self.assertIs(self.collector.render(), text)
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = HistoryStore(raw_points=10, minute_points=5,
+                                    hour_points=3)
+
+    def test_ring_buffer_overwrites_oldest(self):
+        ring = RingBuffer(3)
+        for timestamp in range(5):
+            ring.append(timestamp, timestamp, timestamp, timestamp)
+        self.assertEqual(ring.oldest, 2)
+        self.assertEqual([list(column) for column in ring.since(3)],
+                         [[3, 4]] * 4)
+
+    def test_raw_window(self):
+        for timestamp in range(0, 100, 10):
+            self.history.record(timestamp, dict(load_1m=timestamp))
+        result = self.history.query('load_1m', 30, now=90)
+        self.assertIs(result['step'], None)
+        self.assertEqual([point[0] for point in result['points']],
+                         [60, 70, 80, 90])
+        self.assertEqual(result['summary'], dict(min=60, avg=75, max=90))
+
+    def test_downsampled_tiers(self):
+        # 10 minutes of samples every 10 seconds, raw tier only holds 10
+        for timestamp in range(0, 600, 10):
+            self.history.record(timestamp, dict(load_1m=timestamp % 60))
+        result = self.history.query('load_1m', 300, now=590)
+        self.assertEqual(result['step'], 60)
+        self.assertEqual(result['points'][-1], [540, 25, 0, 50])
+        result = self.history.query('load_1m', 300, now=590, max_points=2)
+        self.assertEqual(result['step'], 180)
+        self.assertEqual(len(result['points']), 2)
+
+    def test_unknown_metric(self):
+        with self.assertRaises(KeyError):
+            self.history.query('missing', 60, now=0)
+
+    def test_invalid_query_rejected(self):
+        client = app.test_client()
+        for query in ('points=0', 'points=-5', 'window=0', 'window=-60'):
+            resp = client.get('/api/history?metric=load_1m&' + query)
+            self.assertEqual(resp.status_code, 400)
+
+    def test_dump_and_load(self):
+        for timestamp in range(0, 600, 10):
+            self.history.record(timestamp, dict(load_1m=timestamp % 60))
+        loaded = HistoryStore.load(json.loads(json.dumps(
+            self.history.dump())))
+        self.assertEqual(loaded.metrics, ['load_1m'])
+        for window in (30, 300, 3600):
+            self.assertEqual(loaded.query('load_1m', window, now=590),
+                             self.history.query('load_1m', window, now=590))
+        # carries on accumulating where the dumped store left off
+        for history in (loaded, self.history):
+            history.record(600, dict(load_1m=1))
+        self.assertEqual(loaded.query('load_1m', 3600, now=600),
+                         self.history.query('load_1m', 3600, now=600))
+
+    def test_values_from_metrics(self):
+        values = history_values([
+            ('load_average', dict(period='1m'), 0.5),
+            ('load_average', dict(period='5m'), 0.4),
+            ('memory_total_bytes', None, 4096),
+            ('memory_available_bytes', None, 1024),
+            ('ping_rtt_seconds', dict(target='8.8.8.8', stat='avg'), 0.01),
+            ('partition_size_bytes', dict(partition='Root'), 100),
+            ('partition_used_bytes', dict(partition='Root'), 25)])
+        self.assertEqual(values, {'load_1m': 0.5, 'memory_used_ratio': 0.75,
+                                  'ping_rtt_seconds:8.8.8.8': 0.01,
+                                  'partition_used_ratio:Root': 0.25})
+
+
 class TestLiveServer(LiveServerTestCase):
     server_address = 'http://192.168.1.101/status/'
 
@@ -3,13 +3,62 @@ Routing file for flask app
 Handles routing for requests
 """
 
+import os
+import atexit
 import json
 import datetime
+import mimetypes
+import threading
+import time
+import Queue
+from collections import OrderedDict
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
-from flask import render_template, Response, request
+from flask import render_template, Response, request, safe_join, send_file
+from jinja2 import TemplateNotFound
+from werkzeug.http import http_date, is_resource_modified, \
+    parse_range_header, quote_etag
+from werkzeug.wsgi import wrap_file
 
 from serverstatus import app
 from assets import apifunctions
+from assets.background import monotonic
+from assets.broadcast import Broadcaster, SnapshotPoller
+from assets.collector import DEFAULT_PATH as SNAPSHOT_PATH, \
+    DEFAULT_SECTIONS as COLLECTOR_SECTIONS, Collector, SnapshotReader, \
+    SnapshotWriter
+from assets.compression import COMPRESSIBLE_EXTENSIONS, CompressionCache, \
+    negotiate, precompressed_path
+from assets.exceptions import PlexImageError, ServiceUnavailableError
+from assets.fragments import FragmentCache
+from assets.httpclient import close_response
+from assets.history import HistoryStore
+from assets.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, \
+    format_metrics
+from assets.warmup import DEFAULT_SECTIONS as WARMUP_SECTIONS, WarmUp
+
+# sections pushed by /stream as JSON data, all others as rendered html
+STREAM_JSON_SECTIONS = ('network_speed', 'ping')
+# seconds between keep-alive comments on idle streams
+STREAM_HEARTBEAT = 15
+# bytes read at a time when streaming images
+IMAGE_CHUNK_SIZE = 65536
+# Warning header of sections served from the collector's last good data
+STALE_WARNING = '110 - "Response is Stale"'
+# response headers passed through from upstream image requests
+UPSTREAM_IMAGE_HEADERS = ('Accept-Ranges', 'Content-Length', 'Content-Range',
+                          'Content-Type')
+
+
+@app.before_request
+def warm_up():
+    """
+    Starts warming up the worker on its first request, if it wasn't started
+    when the worker started, ex. under the debug server.  gunicorn starts it
+    from post_fork in gunicorn.conf.py, and wsgi.py starts it on import.
+    """
+    BACKENDCALLS.start_warmup()
 
 
 @app.route('/')
@@ -25,19 +74,91 @@ def index():
                            testing=app.config['TESTING'])
 
 
+@app.route('/ready')
+def ready():
+    """
+    Readiness check for load balancers at "http://www.example.com/ready".
+    Returns 200 once the worker has warmed up its services and caches, 503
+    until then, with the warm-up time of each service and section as JSON.
+    """
+    warmup = BACKENDCALLS.start_warmup()
+    if warmup is None:
+        values = dict(ready=True, state='disabled')
+    else:
+        values = warmup.status()
+    return Response(json.dumps(values), status=200 if values['ready'] else 503,
+                    mimetype='application/json')
+
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """
+    Returns history of a metric as JSON from
+    "http://www.example.com/api/history?metric=load_1m&window=3600&points=120"
+    where window is in seconds and points is the most points to return.
+    Lists the metrics recorded if no metric is given.
+    """
+    window = request.args.get('window', 60 * 60, type=int)
+    points = request.args.get('points', type=int)
+    if window <= 0 or (points is not None and points < 1):
+        return Response(json.dumps(dict(error='window and points must be '
+                                              'positive')),
+                        status=400, mimetype='application/json')
+    try:
+        values = BACKENDCALLS.get_history(request.args.get('metric'), window,
+                                          points)
+        status = 200
+    except KeyError:
+        values = dict(error='unknown metric')
+        status = 404
+    except ServiceUnavailableError as err:
+        values = dict(error=str(err))
+        status = 503
+    return Response(json.dumps(values), status=status,
+                    mimetype='application/json')
+
+
+@app.route('/api/batch', methods=['GET'])
+def get_batch():
+    """
+    Returns several API sections in one JSON document from
+    "http://www.example.com/api/batch?sections=system_info,storage,ping"
+    Sections are computed concurrently, each with its own status, time taken
+    and data, or error.  With render=1, sections that have a jinja template
+    are returned rendered as html instead of data.
+    """
+    sections = [section for section in
+                request.args.get('sections', '').split(',') if section]
+    render = request.args.get('render', 0, type=int)
+    values = BACKENDCALLS.get_batch(sections, render=bool(render))
+    # each combination of sections is a body of its own, cached separately
+    # so batches polled alternately don't recompress each other's
+    found = [section for section, output in values['sections'].items() if
+             output['status'] != 'not_found']
+    key = 'batch/{}?{}'.format('html' if render else 'api', ','.join(found))
+    return BACKENDCALLS.compressed_response(key, json.dumps(values),
+                                            request,
+                                            mimetype='application/json')
+
+
 @app.route('/api/<data>', methods=['GET'])
 def get_json(data):
     """
     Returns API data data based on "http://www.example.com/api/<data>" 
     call where <data> is function is a function in the APIFunction 
     class in the apifunctions module.  
-    Returns data in JSON format.
+    Returns data in JSON format, compressed if the client accepts it.
     """
-    values, status = BACKENDCALLS.get_data(data)
+    values, status, stale = BACKENDCALLS.get_section(data)
     json_data = json.dumps(values)
     # set mimetype to prevent client side manipulation since we're not using
     # jsonify
-    return Response(json_data, status=status, mimetype='application/json')
+    resp = BACKENDCALLS.compressed_response('api/' + data, json_data, request,
+                                            status=status,
+                                            mimetype='application/json')
+    if stale:
+        resp.headers['Warning'] = STALE_WARNING
+    return resp
 
 
 @app.route('/html/<data>')
@@ -47,17 +168,134 @@ def html_generator(data):
     call where <data> is a jinja template in the "templates" directory.
     Returns rendered html in plain text to client, so we use this data to 
     load divs via jQuery on the client side
+
+    The ETag is a fingerprint of the values rendered, followed by the
+    content encoding of compressed bodies, so clients revalidating an
+    unchanged fragment get 304 Not Modified.
     """
-    values, status = BACKENDCALLS.get_data(data)
+    values, status, stale = BACKENDCALLS.get_section(data)
     start = datetime.datetime.now()
-    rendered_html = render_template(data + '.html', values=values)
+    etag, rendered_html = BACKENDCALLS.render_fragment(data, values)
     app.logger.debug(
         'Render time for {}: {}'.format(data, datetime.datetime.now() - start))
     # set mimetype to prevent users browser from rendering rendered HTML
-    return Response(rendered_html, status=status, mimetype='text/plain')
+    resp = BACKENDCALLS.compressed_response('html/' + data, rendered_html,
+                                            request, status=status,
+                                            mimetype='text/plain')
+    # strong ETags differ between encodings of the same fragment
+    encoding = resp.headers.get('Content-Encoding')
+    if encoding is not None:
+        etag = '{}-{}'.format(etag, encoding)
+    if not is_resource_modified(request.environ, etag=etag):
+        resp = Response(status=304)
+        resp.vary.add('Accept-Encoding')
+    resp.set_etag(etag)
+    # fragments change at any time, so always revalidate
+    resp.cache_control.no_cache = True
+    if stale:
+        resp.headers['Warning'] = STALE_WARNING
+    return resp
+
+
+def static_file(filename):
+    """
+    Serves files in the static folder like flask's own static view, but
+    sends the precompressed .br or .gz variant next to the file when the
+    client accepts it.  Variants are built by "python setup.py
+    compress_static".
+    """
+    if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        return app.send_static_file(filename)
+    path = safe_join(app.static_folder, filename)
+    encoding = negotiate(request.accept_encodings)
+    compressed_path = precompressed_path(path, encoding)
+    if compressed_path is None:
+        resp = app.send_static_file(filename)
+    else:
+        resp = send_file(compressed_path, conditional=True,
+                         mimetype=mimetypes.guess_type(filename)[0],
+                         cache_timeout=app.get_send_file_max_age(filename))
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+app.view_functions['static'] = static_file
+
+
+@app.route('/stream')
+def stream():
+    """
+    Server-Sent Events stream at "http://www.example.com/stream".  Sends
+    the latest data of every section on connect, then each section again
+    whenever it changes.  Event names are section names; event data is JSON,
+    with rendered html in "html" for template sections.
+
+    Sections are collected once on the server for all connected clients.
+    Each open stream holds a connection, so run gunicorn with threaded or
+    async workers when using it.  A client too slow to keep up has its
+    stream ended, and reconnects.
+    """
+    subscription = BACKENDCALLS.subscribe()
 
+    def generate():
+        try:
+            for message in BACKENDCALLS.broadcaster.latest():
+                yield _format_event(*message)
+            while True:
+                try:
+                    message = subscription.get(timeout=STREAM_HEARTBEAT)
+                except Queue.Empty:
+                    message = None
+                if subscription.closed:
+                    # dropped for falling behind.  Ending the stream makes
+                    # the browser reconnect and start from the latest data
+                    return
+                if message is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield _format_event(*message)
+        finally:
+            BACKENDCALLS.broadcaster.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
+def _format_event(version, event, data):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(version, event, data)
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Returns server metrics in the Prometheus text format, from a snapshot
+    refreshed in the background
+    """
+    try:
+        return Response(BACKENDCALLS.get_metrics(), status=200,
+                        content_type=METRICS_CONTENT_TYPE)
+    except ServiceUnavailableError as err:
+        return Response('# {}\n'.format(err), status=503,
+                        content_type=METRICS_CONTENT_TYPE)
 
-@app.route('/img/<data>')
+
+def _read_file_range(img_file, start, stop):
+    try:
+        img_file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = img_file.read(min(IMAGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        img_file.close()
+
+
+@app.route('/img/<data>', methods=['GET', 'HEAD'])
 def get_img_data(data):
     """
     Returns image to client based on "http://www.example.com/img/<data>"
@@ -83,6 +321,35 @@ class BackEndCalls(object):
     def __init__(self):
         self.api_functions = None
         self.api_functions = self.get_api_functions()
+        self.broadcaster = Broadcaster()
+        self._snapshot_poller = None
+        self._snapshot_poller_lock = threading.Lock()
+        self._batch_pool = None
+        self._batch_in_flight = dict()
+        self._batch_lock = threading.Lock()
+        self._fragment_cache = None
+        self._compression_cache = None
+        self._warmup = None
+        self._warmup_lock = threading.Lock()
+        self._snapshot_reader = None
+        self._plex_covers_version = None
+        # (snapshot version, HistoryStore) of the collector's history
+        self._collected_history = None
+
+    def close(self):
+        """
+        Stops the worker's background threads and thread pools, run when the
+        worker exits
+        """
+        if self._snapshot_poller is not None:
+            self._snapshot_poller.stop()
+        with self._batch_lock:
+            if self._batch_pool is not None:
+                self._batch_pool.terminate()
+                self._batch_pool = None
+                self._batch_in_flight.clear()
+        if self.api_functions is not None:
+            self.api_functions.close()
 
     def get_api_functions(self):
         """
@@ -92,19 +359,71 @@ class BackEndCalls(object):
         self._load_apis()
         return self.api_functions
 
+    def start_warmup(self):
+        """
+        Starts warming up services and caches in the background, unless
+        already started in this process.  WARMUP in the config file sets the
+        sections primed and the seconds after which the worker counts as
+        ready regardless.  In collector mode only services are loaded, since
+        sections and metrics are read from the collector's snapshot.  Returns
+        None if warm-up is disabled, or the app is being tested.
+
+        :return: WarmUp or NoneType
+        """
+        warmup = self._warmup
+        if warmup is not None and warmup.pid == os.getpid():
+            return warmup
+        warmup_config = app.config.get('WARMUP', dict())
+        if not warmup_config.get('enabled', True) or app.config['TESTING']:
+            return None
+        sections = warmup_config.get('sections', WARMUP_SECTIONS)
+        if self.collector_mode:
+            sections = ()
+        with self._warmup_lock:
+            # a warm-up started before gunicorn forked didn't run here
+            if self._warmup is None or self._warmup.pid != os.getpid():
+                self._warmup = WarmUp(
+                    self.api_functions, sections=sections,
+                    timeout=warmup_config.get('timeout', 60),
+                    metrics=not self.collector_mode)
+                self._warmup.start()
+        return self._warmup
+
     def get_data(self, data):
         """
         From flask request at http://servername.com/api/{api_call} fetches
-        {api_call} from apifunctions module, and returns data.
+        {api_call} from apifunctions module, and returns data.  In collector
+        mode, collected sections are read from the collector's snapshot.
 
         Disallows public access to any function in apifunctions starting with
         "_" (underscore)
         :type data: unicode or LocalProxy
         :return:
         """
+        values, status, _ = self.get_section(data)
+        return values, status
+
+    def get_section(self, data):
+        """
+        Returns data like get_data, and whether it's stale.  In collector
+        mode, a section the collector failed to collect is its last good
+        data, marked stale, or {'offline': True, 'error': '...'} with status
+        503 if it has never been collected.
+
+        :type data: unicode or LocalProxy
+        :return: tuple of (values, status, bool)
+        """
         values = None
         status = 404
-        values = getattr(self.api_functions, str(data).lstrip('_'))()
+        section = str(data).lstrip('_')
+        collected = self._collected_section(section)
+        if collected is not None:
+            if collected['status'] == 'ok':
+                return collected['data'], 200, False
+            if collected['status'] == 'stale':
+                return collected['data'], 200, True
+            return dict(offline=True, error=collected['error']), 503, False
+        values = getattr(self.api_functions, section)()
         status = 200
         """
         try:
@@ -115,7 +434,260 @@ class BackEndCalls(object):
             # no api function for call, return empty json
         except:
             app.logger.error('An unknown error occurred')"""
-        return values, status
+        return values, status, False
+
+    @property
+    def collector_mode(self):
+        """
+        Whether COLLECTOR in the config file enables collector mode
+        """
+        return app.config.get('COLLECTOR', dict()).get('enabled', False)
+
+    def get_metrics(self):
+        """
+        Returns server metrics in the Prometheus text format.  In collector
+        mode they're formatted from the samples in the collector's snapshot,
+        workers never collect metrics themselves.
+
+        :return: str
+        :raises: ServiceUnavailableError in collector mode without a current
+        snapshot
+        """
+        if not self.collector_mode:
+            return self.api_functions._get_metrics()
+        return format_metrics(self._collected_metrics()['samples'])
+
+    def get_history(self, metric=None, window=60 * 60, max_points=None):
+        """
+        Returns history of metric like APIFunctions.history.  In collector
+        mode it's queried from the history store in the collector's snapshot,
+        loaded once per snapshot version.
+
+        :raises: KeyError if metric hasn't been recorded,
+        ServiceUnavailableError in collector mode without a current snapshot
+        """
+        if not self.collector_mode:
+            return self.api_functions.history(metric, window, max_points)
+        collected = self._collected_metrics()
+        version = self._snapshot_reader.version
+        cached = self._collected_history
+        if cached is None or cached[0] != version:
+            cached = (version, HistoryStore.load(collected['history']))
+            self._collected_history = cached
+        history = cached[1]
+        if metric is None:
+            return dict(metrics=history.metrics)
+        return history.query(metric, window, time.time(), max_points)
+
+    def _collected_metrics(self):
+        snapshot = self.read_snapshot()
+        if snapshot is None or 'metrics' not in snapshot:
+            raise ServiceUnavailableError(
+                'No current metrics from the collector')
+        return snapshot['metrics']
+
+    def read_snapshot(self):
+        """
+        Returns the collector's latest snapshot, or None if collector mode is
+        off, or the snapshot is missing or older than max_age seconds, in
+        which case sections are computed by this worker instead.  COLLECTOR
+        in the config file enables collector mode and sets the snapshot path.
+
+        :return: dict or NoneType
+        """
+        if not self.collector_mode:
+            return None
+        collector_config = app.config.get('COLLECTOR', dict())
+        if self._snapshot_reader is None:
+            self._snapshot_reader = SnapshotReader(
+                collector_config.get('path', SNAPSHOT_PATH))
+        snapshot = self._snapshot_reader.read()
+        if snapshot is None or time.time() - snapshot['collected_at'] > \
+                collector_config.get('max_age', 60):
+            app.logger.debug('No current snapshot, collecting here')
+            return None
+        return snapshot
+
+    def _collected_section(self, section):
+        snapshot = self.read_snapshot()
+        if snapshot is None:
+            return None
+        return snapshot['sections'].get(section)
+
+    def run_collector(self):
+        """
+        Runs the collector in the foreground until interrupted, publishing a
+        snapshot of the sections in COLLECTOR every interval seconds for the
+        workers to read.  Started by collector.py, once for all workers.
+        """
+        collector_config = app.config.get('COLLECTOR', dict())
+        writer = SnapshotWriter(collector_config.get('path', SNAPSHOT_PATH))
+        collector = Collector(
+            self.api_functions, writer,
+            sections=collector_config.get('sections', COLLECTOR_SECTIONS),
+            interval=collector_config.get('interval', 10))
+        app.logger.info('Collector publishing to {}'.format(writer.path))
+        try:
+            collector.run()
+        finally:
+            writer.close()
+
+    def collect_section(self, section):
+        """
+        Returns data for section as JSON text for the /stream endpoint.
+        Sections with a template are rendered to html first.
+
+        :type section: str
+        :return: str
+        """
+        values, _ = self.get_data(section)
+        if section in STREAM_JSON_SECTIONS:
+            return json.dumps(values)
+        _, rendered_html = self.render_fragment(section, values)
+        return json.dumps(dict(html=rendered_html))
+
+    def compressed_response(self, key, body, flask_request, status=200,
+                            mimetype='text/plain'):
+        """
+        Returns a response with body encoded as the client prefers, gzip or
+        brotli.  Compressed bodies are cached under key until body changes,
+        so an unchanged body is only compressed once.  COMPRESSION in the
+        config file sets the compression level, and the smallest body worth
+        compressing.
+
+        :type key: str
+        :type body: str
+        :type flask_request: werkzeug.local.Request
+        :return: flask.Response
+        """
+        if self._compression_cache is None:
+            compression_config = app.config.get('COMPRESSION', dict())
+            self._compression_cache = CompressionCache(
+                level=compression_config.get('level', 6),
+                min_size=compression_config.get('min_size', 512))
+        data, encoding = self._compression_cache.get(
+            key, body, negotiate(flask_request.accept_encodings))
+        resp = Response(data, status=status, mimetype=mimetype)
+        if encoding is not None:
+            resp.headers['Content-Encoding'] = encoding
+        resp.vary.add('Accept-Encoding')
+        return resp
+
+    def render_fragment(self, section, values):
+        """
+        Returns the fingerprint of values and section's template rendered
+        from them, reusing the last rendered html while values are unchanged
+
+        :type section: str
+        :return: tuple of (str, str) - ETag and utf-8 encoded html
+        """
+        if self._fragment_cache is None:
+            self._fragment_cache = FragmentCache(self._render_section,
+                                                 self._templates_version())
+        return self._fragment_cache.get(section, values)
+
+    @staticmethod
+    def _render_section(section, values):
+        with app.app_context():
+            return render_template(section + '.html', values=values)
+
+    @staticmethod
+    def _templates_version():
+        # last modified time of the templates, the same in every worker
+        templates = os.path.join(app.root_path, app.template_folder)
+        return str(max(os.path.getmtime(os.path.join(templates, name)) for
+                       name in os.listdir(templates)))
+
+    def get_batch(self, sections, render=False):
+        """
+        Computes sections concurrently on a bounded thread pool, and returns
+        each one's status ("ok", "offline", "error", "timeout" or
+        "not_found"), time taken in ms, and its data, rendered html, or error
+        message.  Sections served from the collector's last good data are
+        marked "stale": True.  BATCH in
+        the config file sets the number of workers, and the timeout in seconds
+        for the whole batch.  A section still running from an earlier batch
+        is waited on rather than started again, so a hung server can only
+        ever tie up one pool thread per section.
+
+        >>> {'elapsed_ms': 38.2, 'sections': {'ping': {'status': 'ok',
+        ...  'elapsed_ms': 0.1, 'data': {'ping': '14'}}, ...}}
+
+        :type sections: list of [str]
+        :type render: bool
+        :return: dict
+        """
+        batch_config = app.config.get('BATCH', dict())
+        start = monotonic()
+        deadline = start + batch_config.get('timeout', 30)
+        pending = OrderedDict()
+        output = OrderedDict()
+        with self._batch_lock:
+            if self._batch_pool is None:
+                self._batch_pool = ThreadPool(
+                    processes=batch_config.get('workers', 8))
+            for section in sections:
+                if section.startswith('_') or not callable(
+                        getattr(self.api_functions, section, None)):
+                    output[section] = dict(status='not_found',
+                                           elapsed_ms=0.0)
+                elif section not in pending:
+                    pending[section] = self._start_batch_section(section,
+                                                                 render)
+        for section, result in pending.items():
+            try:
+                output[section] = result.get(max(deadline - monotonic(), 0))
+            except TimeoutError:
+                output[section] = dict(
+                    status='timeout',
+                    elapsed_ms=round((monotonic() - start) * 1000, 1))
+        return dict(sections=output,
+                    elapsed_ms=round((monotonic() - start) * 1000, 1))
+
+    def _start_batch_section(self, section, render):
+        # callers hold _batch_lock
+        in_flight = self._batch_in_flight.get((section, render))
+        if in_flight is None or in_flight.ready():
+            in_flight = self._batch_pool.apply_async(self._batch_section,
+                                                     (section, render))
+            self._batch_in_flight[section, render] = in_flight
+        return in_flight
+
+    def _batch_section(self, section, render):
+        start = monotonic()
+        try:
+            values, status, stale = self.get_section(section)
+            output = dict(status='ok' if status == 200 else 'offline',
+                          data=values)
+            if render:
+                try:
+                    _, rendered_html = self.render_fragment(section, values)
+                    output = dict(status=output['status'], html=rendered_html)
+                except TemplateNotFound:
+                    pass
+            if stale:
+                output['stale'] = True
+        except Exception as err:
+            app.logger.error('Batch section {} failed: {}'.format(section,
+                                                                  err))
+            output = dict(status='error', error=str(err))
+        output['elapsed_ms'] = round((monotonic() - start) * 1000, 1)
+        return output
+
+    def subscribe(self):
+        """
+        Subscribes to section updates, starting the snapshot poller on first
+        use.  Intervals for each section come from STREAM in the config file.
+
+        :return: Subscription
+        """
+        with self._snapshot_poller_lock:
+            if self._snapshot_poller is None:
+                self._snapshot_poller = SnapshotPoller(
+                    self.broadcaster, self.collect_section,
+                    app.config.get('STREAM', dict(system_info=30)))
+        self._snapshot_poller.ensure_running()
+        return self.broadcaster.subscribe()
 
     def get_image_data(self, flask_request):
         """
@@ -140,18 +712,171 @@ class BackEndCalls(object):
                     parsed_values[arg] = request_args[arg]
             return parsed_values
 
-        resp = Response('null', status=404, mimetype='text/plain')
         # convert to string since flask requests returns unicode
         data_low = str(flask_request.view_args.get('data', None).lower())
-        if data_low == 'plex':
-            args = parse_request(flask_request.args)
-            resp = Response(
-                self.api_functions._get_plex_cover_art(args), status=200,
-                mimetype='image/jpeg')
-        elif data_low == 'subsonic':
-            resp = Response(self._check_subsonic_request(flask_request),
-                            status=200,
-                            mimetype='image/jpeg')
+        try:
+            if data_low == 'plex':
+                self._sync_plex_covers()
+                args = parse_request(flask_request.args)
+                cover_art = self.api_functions._get_plex_cover_art(args)
+            elif data_low == 'subsonic':
+                cover_art = self._check_subsonic_request(flask_request)
+            else:
+                return Response('null', status=404, mimetype='text/plain')
+            return self._cover_art_response(cover_art, flask_request)
+        except PlexImageError as err:
+            app.logger.warning(err)
+            return Response('null', status=404, mimetype='text/plain')
+
+    def _sync_plex_covers(self):
+        # Plex images listed by the collector are unknown to this worker
+        snapshot = self.read_snapshot()
+        if snapshot is None:
+            return
+        version = self._snapshot_reader.version
+        if version != self._plex_covers_version:
+            self.api_functions._add_plex_covers(snapshot['plex_covers'])
+            self._plex_covers_version = version
+
+    @classmethod
+    def _cover_art_response(cls, cover_art, flask_request):
+        """
+        Builds the response for cover art, with caching headers if it's
+        cacheable.  Answers conditional requests that match the ETag or
+        Last-Modified date with 304 Not Modified, without loading the image.
+
+        :type cover_art: serverstatus.assets.services.CoverArt
+        :type flask_request: werkzeug.local.Request
+        :return: flask.Response
+        """
+        if cover_art.etag is None:
+            resp = cls._cover_art_body(cover_art, flask_request)
+            resp.cache_control.no_cache = True
+            return resp
+        last_modified = None
+        if cover_art.last_modified is not None:
+            last_modified = datetime.datetime.utcfromtimestamp(
+                int(cover_art.last_modified))
+        if is_resource_modified(flask_request.environ, etag=cover_art.etag,
+                                last_modified=last_modified):
+            resp = cls._cover_art_body(cover_art, flask_request)
+        else:
+            resp = Response(status=304)
+        resp.set_etag(cover_art.etag)
+        if last_modified is not None:
+            resp.last_modified = last_modified
+        resp.cache_control.public = True
+        image_config = app.config.get('IMAGE_CACHE', dict())
+        resp.cache_control.max_age = image_config.get('max_age',
+                                                      30 * 24 * 60 * 60)
+        return resp
+
+    @classmethod
+    def _cover_art_body(cls, cover_art, flask_request):
+        """
+        Returns response with the cover art image: cached files are sent from
+        disk, images from the media server are streamed in chunks, and
+        anything else is loaded into memory
+
+        :type cover_art: serverstatus.assets.services.CoverArt
+        :type flask_request: werkzeug.local.Request
+        :return: flask.Response
+        """
+        if cover_art.path is not None:
+            try:
+                return cls._send_image_file(cover_art, flask_request)
+            except (OSError, IOError):
+                # evicted since it was looked up
+                pass
+        elif cover_art.upstream is not None:
+            return cls._stream_upstream_image(cover_art, flask_request)
+        return Response(cover_art.load(), status=200, mimetype='image/jpeg')
+
+    @staticmethod
+    def _send_image_file(cover_art, flask_request):
+        """
+        Sends a cached image file.  The front-end server sends the file when
+        IMAGE_CACHE sendfile is set in the config file, otherwise whole files
+        go through the WSGI server's file wrapper so it can use sendfile, and
+        single byte ranges are read from the file.  Multiple byte ranges are
+        ignored and the whole file sent, as RFC 7233 allows.
+
+        :type cover_art: serverstatus.assets.services.CoverArt
+        :type flask_request: werkzeug.local.Request
+        :return: flask.Response
+        :raises: OSError, IOError if the file no longer exists
+        """
+        image_config = app.config.get('IMAGE_CACHE', dict())
+        sendfile = image_config.get('sendfile')
+        size = os.path.getsize(cover_art.path)
+        resp = Response(status=200, mimetype='image/jpeg')
+        resp.content_length = size
+        if sendfile == 'x-sendfile':
+            resp.headers['X-Sendfile'] = cover_art.path
+            return resp
+        elif sendfile == 'x-accel-redirect':
+            resp.headers['X-Accel-Redirect'] = '/'.join([
+                image_config.get('sendfile_prefix', '/cover-art/').rstrip('/'),
+                os.path.basename(cover_art.path)])
+            return resp
+        resp.headers['Accept-Ranges'] = 'bytes'
+        byte_range = parse_range_header(flask_request.headers.get('Range'))
+        # a partial copy that's out of date is replaced with the whole image
+        validators = [quote_etag(cover_art.etag or '')]
+        if cover_art.last_modified is not None:
+            validators.append(http_date(cover_art.last_modified))
+        if_range = flask_request.headers.get('If-Range')
+        if if_range is not None and if_range not in validators:
+            byte_range = None
+        content_range = None
+        if byte_range is not None:
+            content_range = byte_range.make_content_range(size)
+            if content_range is None and len(byte_range.ranges) == 1:
+                resp.status_code = 416
+                resp.headers['Content-Range'] = 'bytes */{}'.format(size)
+                resp.content_length = 0
+                return resp
+        if content_range is not None:
+            resp.status_code = 206
+            resp.content_range = content_range
+            resp.content_length = content_range.stop - content_range.start
+        if flask_request.method == 'HEAD':
+            return resp
+        img_file = open(cover_art.path, 'rb')
+        if content_range is None:
+            resp.response = wrap_file(flask_request.environ, img_file,
+                                      IMAGE_CHUNK_SIZE)
+        else:
+            resp.response = _read_file_range(img_file, content_range.start,
+                                             content_range.stop)
+        resp.direct_passthrough = True
+        return resp
+
+    @staticmethod
+    def _stream_upstream_image(cover_art, flask_request):
+        """
+        Streams an image from the media server in chunks, forwarding the
+        client's byte range so partial responses come straight from upstream
+
+        :type cover_art: serverstatus.assets.services.CoverArt
+        :type flask_request: werkzeug.local.Request
+        :return: flask.Response
+        """
+        headers = dict()
+        if 'Range' in flask_request.headers:
+            headers['Range'] = flask_request.headers['Range']
+        upstream_resp = cover_art.upstream(flask_request.method, headers)
+        resp = Response(status=upstream_resp.status_code,
+                        mimetype='image/jpeg')
+        for header in UPSTREAM_IMAGE_HEADERS:
+            if header in upstream_resp.headers:
+                resp.headers[header] = upstream_resp.headers[header]
+        if 'Content-Encoding' in upstream_resp.headers:
+            # the body is decoded while streaming
+            del resp.headers['Content-Length']
+        resp.call_on_close(lambda: close_response(upstream_resp))
+        resp.response = upstream_resp.iter_content(IMAGE_CHUNK_SIZE)
+        resp.direct_passthrough = True
         return resp
 
     def _load_apis(self):
@@ -205,3 +930,4 @@ class BackEndCalls(object):
 
 
 BACKENDCALLS = BackEndCalls()
+atexit.register(BACKENDCALLS.close)
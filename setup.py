@@ -1,10 +1,14 @@
 #!/usr/bin/env python
+import imp
 import os
+from distutils.cmd import Command
 
 try:
     from setuptools import setup
+    from setuptools.command.build_py import build_py
 except ImportError:
     from distutils.core import setup
+    from distutils.command.build_py import build_py
 
 readme_file = 'README.md'
 readme_file_full_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), readme_file)
@@ -13,6 +17,39 @@ with open(readme_file_full_path, 'r') as f:
 if not readme_contents:
     readme_contents = ''
 
+package_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            'serverstatus')
+
+
+class CompressStatic(Command):
+    """
+    Writes gzip (and brotli, if installed) variants of the static JS, CSS
+    and font files, served by the static view to clients that accept them
+    """
+    description = 'precompress static files'
+    user_options = []
+
+    def initialize_options(self):
+        pass
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        # load the module directly to skip initializing the flask app
+        compression = imp.load_source('compression', os.path.join(
+            package_path, 'assets', 'compression.py'))
+        for path in compression.precompress_static(
+                os.path.join(package_path, 'static')):
+            self.announce('compressed {}'.format(path), level=2)
+
+
+class BuildPy(build_py):
+    def run(self):
+        self.run_command('compress_static')
+        build_py.run(self)
+
+
 setup(name='server-status',
       version='0.0.1',
       author='David Beall',
@@ -22,6 +59,7 @@ setup(name='server-status',
       long_description='{}'.format(readme_contents),
       packages=['serverstatus'],
       package_dir={'serverstatus': 'serverstatus'},
+      cmdclass={'compress_static': CompressStatic, 'build_py': BuildPy},
       classifiers=[
           'Development Status :: 4 - Beta',
           'Intended Audience :: System Administrators',
@@ -16,3 +16,11 @@ execfile(activate_this, dict(__file__=activate_this))
 sys.path.append(PROJECT_DIR)
 sys.path.append(os.path.join(PROJECT_DIR, VIRTUAL_ENV_DIR, PACKAGES))
 
+
+from serverstatus import app as application
+from serverstatus.views import BACKENDCALLS
+
+# gunicorn may import this before forking its workers, so it starts the
+# warm-up from post_fork in gunicorn.conf.py instead
+if 'gunicorn' not in sys.modules:
+    BACKENDCALLS.start_warmup()